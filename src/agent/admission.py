@@ -0,0 +1,198 @@
+"""Admission control of the messages answered by a worker.
+
+At most `max_in_flight` messages are answered at once. The others wait in a bounded
+queue, and are rejected right away when it is full, or once they waited for too long,
+so that a slow LLM or OpenFGA server doesn't pile up requests. Waiting messages are
+admitted in turns across users, so a user sending many of them doesn't delay the
+others.
+"""
+
+import asyncio
+import math
+from collections import OrderedDict, deque
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+from enum import StrEnum
+from http import HTTPStatus
+
+from loguru import logger
+from pydantic import BaseModel, Field
+
+
+class RejectionReason(StrEnum):
+    """Why a message wasn't admitted.
+
+    *QUEUE_FULL* as too many messages are waiting already.
+    *USER_QUEUE_FULL* as too many messages of the same user are waiting already.
+    *QUEUE_TIMEOUT* as the message waited for longer than allowed.
+    """
+
+    QUEUE_FULL = "queue_full"
+    USER_QUEUE_FULL = "user_queue_full"
+    QUEUE_TIMEOUT = "queue_timeout"
+
+
+class AdmissionRejectedError(Exception):
+    """A message wasn't admitted, and should be sent again later."""
+
+    def __init__(self, reason: RejectionReason, retry_after_seconds: float) -> None:
+        """Init method."""
+        super().__init__(f"Message rejected: {reason}.")
+        self.reason = reason
+        self.retry_after_seconds = retry_after_seconds
+
+    @property
+    def status_code(self) -> HTTPStatus:
+        """Too many requests when the user is to blame, unavailable otherwise."""
+        if self.reason == RejectionReason.USER_QUEUE_FULL:
+            return HTTPStatus.TOO_MANY_REQUESTS
+        return HTTPStatus.SERVICE_UNAVAILABLE
+
+    @property
+    def headers(self) -> dict[str, str]:
+        """Headers telling the client when to try again."""
+        return {"Retry-After": str(math.ceil(self.retry_after_seconds))}
+
+
+class AdmissionStats(BaseModel):
+    """Counters describing the load of the worker."""
+
+    in_flight: int = Field(description="Messages being answered.")
+    max_in_flight: int = Field(description="Messages answered at once, at most.")
+    queued: int = Field(description="Messages waiting to be answered.")
+    max_queued: int = Field(description="Messages waiting, at most.")
+    queued_users: int = Field(description="Users with messages waiting.")
+    admitted: int = Field(description="Messages admitted since the start.")
+    rejected: dict[RejectionReason, int] = Field(
+        description="Messages rejected since the start, by reason."
+    )
+
+
+def _admitted(waiter: asyncio.Future[None]) -> bool:
+    return waiter.done() and not waiter.cancelled()
+
+
+class AdmissionController:
+    """Bounds the messages answered at once, and those waiting to be."""
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        max_queued: int,
+        max_queued_per_user: int,
+        queue_timeout_seconds: float,
+    ) -> None:
+        """Init method.
+
+        Args:
+            max_in_flight (int): How many messages are answered at once.
+            max_queued (int): How many messages may wait, across all users.
+            max_queued_per_user (int): How many messages of a user may wait.
+            queue_timeout_seconds (float): How long a message may wait.
+        """
+        if max_in_flight <= 0:
+            raise ValueError("max_in_flight must be positive.")  # noqa: TRY003
+        self._max_in_flight = max_in_flight
+        self._max_queued = max_queued
+        self._max_queued_per_user = max_queued_per_user
+        self._queue_timeout_seconds = queue_timeout_seconds
+        self._in_flight = 0
+        # The waiters of each user. The first user is served next, then moved last.
+        self._queues: OrderedDict[str, deque[asyncio.Future[None]]] = OrderedDict()
+        self._queued = 0
+        self._admitted = 0
+        self._rejected = dict.fromkeys(RejectionReason, 0)
+
+    def _reject(self, reason: RejectionReason, user_id: str) -> AdmissionRejectedError:
+        self._rejected[reason] += 1
+        logger.warning("Rejected a message of user {}: {}", user_id, reason)
+        return AdmissionRejectedError(
+            reason,
+            # Waiting messages are answered, or rejected, within the timeout.
+            retry_after_seconds=self._queue_timeout_seconds,
+        )
+
+    def _dispatch(self) -> None:
+        while self._in_flight < self._max_in_flight and self._queues:
+            user_id, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            if waiter.done():
+                # Cancelled, and about to forget it.
+                continue
+            self._in_flight += 1
+            self._admitted += 1
+            waiter.set_result(None)
+
+    def _forget(self, user_id: str, waiter: asyncio.Future[None]) -> None:
+        queue = self._queues.get(user_id)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        self._queued -= 1
+        if not queue:
+            del self._queues[user_id]
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        self._dispatch()
+
+    async def _acquire(self, user_id: str) -> None:
+        if self._in_flight < self._max_in_flight and not self._queues:
+            self._in_flight += 1
+            self._admitted += 1
+            return
+        if self._queued >= self._max_queued:
+            raise self._reject(RejectionReason.QUEUE_FULL, user_id)
+        queue = self._queues.setdefault(user_id, deque())
+        if len(queue) >= self._max_queued_per_user:
+            if not queue:
+                del self._queues[user_id]
+            raise self._reject(RejectionReason.USER_QUEUE_FULL, user_id)
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        self._queued += 1
+        try:
+            async with asyncio.timeout(self._queue_timeout_seconds):
+                await waiter
+        except TimeoutError:
+            if _admitted(waiter):
+                # Admitted just before the timeout.
+                return
+            self._forget(user_id, waiter)
+            raise self._reject(RejectionReason.QUEUE_TIMEOUT, user_id) from None
+        except asyncio.CancelledError:
+            if _admitted(waiter):
+                self._release()
+            else:
+                self._forget(user_id, waiter)
+            raise
+
+    @asynccontextmanager
+    async def admit(self, user_id: str) -> AsyncGenerator[None, None]:
+        """Waits for the turn of a message of the user, then holds its slot.
+
+        Raises:
+            AdmissionRejectedError: When the message can't be admitted.
+        """
+        await self._acquire(user_id)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> AdmissionStats:
+        """Returns the current counters."""
+        return AdmissionStats(
+            in_flight=self._in_flight,
+            max_in_flight=self._max_in_flight,
+            queued=self._queued,
+            max_queued=self._max_queued,
+            queued_users=len(self._queues),
+            admitted=self._admitted,
+            rejected=dict(self._rejected),
+        )
@@ -0,0 +1,310 @@
+"""Artifacts kept within a memory budget.
+
+Every message saves new versions of its artifacts, e.g. the retrieved context, so
+keeping all of them, like `InMemoryArtifactService` does, grows without limit. Only
+the last versions of an artifact are kept, artifacts not saved for a while expire,
+and the least recently used versions are moved to disk, or dropped, once the budget
+is exceeded.
+"""
+
+import asyncio
+import shutil
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable
+from pathlib import Path
+from typing import override
+
+from google.adk.artifacts import BaseArtifactService
+from google.genai import types
+from loguru import logger
+from pydantic import BaseModel, Field
+
+_USER_NAMESPACE = "user:"
+
+
+class ArtifactStoreStats(BaseModel):
+    """Counters describing the memory used by the artifacts."""
+
+    resident_bytes: int = Field(description="Bytes of the versions held in memory.")
+    max_resident_bytes: int = Field(description="Budget of the versions in memory.")
+    resident_versions: int = Field(description="Versions held in memory.")
+    spilled_bytes: int = Field(description="Bytes of the versions moved to disk.")
+    spilled_versions: int = Field(description="Versions moved to disk.")
+    evictions: int = Field(
+        description="Versions moved to disk, or dropped, to respect the budget."
+    )
+    expirations: int = Field(description="Artifacts dropped as not saved for a while.")
+
+
+class _Version:
+    """A version of an artifact, in memory or on disk."""
+
+    def __init__(self, part: types.Part, size: int) -> None:
+        # None once only on disk.
+        self.part: types.Part | None = part
+        self.size = size
+        # Set as soon as the version starts being written to disk.
+        self.spill_path: Path | None = None
+        self.dropped = False
+
+
+class _Artifact:
+    """The versions kept of an artifact."""
+
+    def __init__(self) -> None:
+        self.versions: dict[int, _Version] = {}
+        self.next_version = 0
+        self.expires_at = 0.0
+
+
+def _part_size(part: types.Part) -> int:
+    size = len(part.text.encode()) if part.text else 0
+    if part.inline_data and part.inline_data.data:
+        size += len(part.inline_data.data)
+    return size or len(part.model_dump_json(exclude_none=True))
+
+
+def _write_parts(parts: list[tuple[Path, types.Part]]) -> None:
+    for path, part in parts:
+        path.write_text(part.model_dump_json(exclude_none=True), encoding="utf-8")
+
+
+def _read_part(path: Path) -> types.Part | None:
+    try:
+        return types.Part.model_validate_json(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        # Dropped while being read.
+        return None
+
+
+class BoundedArtifactService(BaseArtifactService):
+    """Artifacts kept within a memory budget, the older ones moved to disk.
+
+    At most `max_versions` versions of an artifact are kept, the oldest being dropped
+    first, and artifacts not saved for `ttl_seconds` are dropped with all their
+    versions. Once the versions in memory exceed `max_resident_bytes`, the least
+    recently used ones are moved to `spill_dir`, or dropped if not provided.
+
+    Call `close` before exiting, so that the files moved to disk are removed.
+    """
+
+    def __init__(
+        self,
+        max_resident_bytes: int,
+        max_versions: int = 4,
+        ttl_seconds: float = 60 * 60,
+        spill_dir: Path | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Init method.
+
+        Args:
+            max_resident_bytes (int): Maximum size of the versions held in memory.
+            max_versions (int): How many versions of an artifact are kept.
+            ttl_seconds (float): How long an artifact is kept after its last save.
+            spill_dir (Path | None): Directory where the versions evicted from memory
+                are written. They are dropped when not provided.
+            clock (Callable[[], float]): Source of the current time, in seconds.
+        """
+        if max_resident_bytes <= 0:
+            raise ValueError("max_resident_bytes must be positive.")  # noqa: TRY003
+        if max_versions <= 0:
+            raise ValueError("max_versions must be positive.")  # noqa: TRY003
+        self._max_resident_bytes = max_resident_bytes
+        self._max_versions = max_versions
+        self._ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._spill_dir: Path | None = None
+        if spill_dir is not None:
+            spill_dir.mkdir(parents=True, exist_ok=True)
+            # Private to the process, so that workers don't remove each other's files.
+            self._spill_dir = Path(tempfile.mkdtemp(prefix="artifacts-", dir=spill_dir))
+        # Ordered by last save, so the first ones expire first.
+        self._artifacts: OrderedDict[str, _Artifact] = OrderedDict()
+        # Versions in memory, the least recently used first.
+        self._resident: OrderedDict[tuple[str, int], _Version] = OrderedDict()
+        self._resident_bytes = 0
+        self._spilled_bytes = 0
+        self._spilled_versions = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    @staticmethod
+    def _artifact_path(
+        app_name: str, user_id: str, session_id: str, filename: str
+    ) -> str:
+        if filename.startswith(_USER_NAMESPACE):
+            return f"{app_name}/{user_id}/user/{filename}"
+        return f"{app_name}/{user_id}/{session_id}/{filename}"
+
+    def _drop_version(self, path: str, artifact: _Artifact, number: int) -> None:
+        version = artifact.versions.pop(number)
+        version.dropped = True
+        if self._resident.pop((path, number), None) is not None:
+            self._resident_bytes -= version.size
+        if version.spill_path is not None:
+            self._spilled_bytes -= version.size
+            self._spilled_versions -= 1
+            # Otherwise the file is still being written, and is removed after.
+            if version.part is None:
+                version.spill_path.unlink(missing_ok=True)
+
+    def _drop_artifact(self, path: str) -> None:
+        artifact = self._artifacts.pop(path)
+        for number in list(artifact.versions):
+            self._drop_version(path, artifact, number)
+
+    def _expire(self) -> None:
+        now = self._clock()
+        while self._artifacts:
+            path, artifact = next(iter(self._artifacts.items()))
+            if artifact.expires_at > now:
+                return
+            self._drop_artifact(path)
+            self._expirations += 1
+
+    async def _evict(self) -> None:
+        spilled: list[tuple[str, int, _Version]] = []
+        while self._resident_bytes > self._max_resident_bytes:
+            (path, number), version = self._resident.popitem(last=False)
+            self._resident_bytes -= version.size
+            self._evictions += 1
+            if self._spill_dir is None:
+                self._drop_version(path, self._artifacts[path], number)
+                continue
+            version.spill_path = self._spill_dir / f"{uuid.uuid4().hex}.json"
+            self._spilled_bytes += version.size
+            self._spilled_versions += 1
+            spilled.append((path, number, version))
+        if not spilled:
+            return
+        try:
+            await asyncio.to_thread(
+                _write_parts,
+                [
+                    (version.spill_path, version.part)
+                    for _, _, version in spilled
+                    if version.spill_path and version.part
+                ],
+            )
+        except OSError:
+            logger.exception("Failed to move artifacts to disk, dropping them.")
+            for path, number, version in spilled:
+                if not version.dropped:
+                    self._drop_version(path, self._artifacts[path], number)
+            return
+        for _, _, version in spilled:
+            version.part = None
+            if version.dropped and version.spill_path is not None:
+                version.spill_path.unlink(missing_ok=True)
+
+    @override
+    async def save_artifact(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        filename: str,
+        artifact: types.Part,
+    ) -> int:
+        self._expire()
+        path = self._artifact_path(app_name, user_id, session_id, filename)
+        stored = self._artifacts.pop(path, None) or _Artifact()
+        self._artifacts[path] = stored
+        stored.expires_at = self._clock() + self._ttl_seconds
+        number = stored.next_version
+        stored.next_version += 1
+        version = _Version(artifact, _part_size(artifact))
+        stored.versions[number] = version
+        self._resident[path, number] = version
+        self._resident_bytes += version.size
+        while len(stored.versions) > self._max_versions:
+            self._drop_version(path, stored, min(stored.versions))
+        await self._evict()
+        return number
+
+    @override
+    async def load_artifact(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        filename: str,
+        version: int | None = None,
+    ) -> types.Part | None:
+        self._expire()
+        path = self._artifact_path(app_name, user_id, session_id, filename)
+        stored = self._artifacts.get(path)
+        if stored is None or not stored.versions:
+            return None
+        number = max(stored.versions) if version is None else version
+        found = stored.versions.get(number)
+        if found is None:
+            return None
+        if found.part is not None:
+            if (path, number) in self._resident:
+                self._resident.move_to_end((path, number))
+            return found.part
+        if found.spill_path is None:
+            return None
+        return await asyncio.to_thread(_read_part, found.spill_path)
+
+    @override
+    async def list_artifact_keys(
+        self, *, app_name: str, user_id: str, session_id: str
+    ) -> list[str]:
+        self._expire()
+        prefixes = (
+            f"{app_name}/{user_id}/{session_id}/",
+            f"{app_name}/{user_id}/user/",
+        )
+        return sorted(
+            path.removeprefix(prefix)
+            for path, stored in self._artifacts.items()
+            for prefix in prefixes
+            if stored.versions and path.startswith(prefix)
+        )
+
+    @override
+    async def delete_artifact(
+        self, *, app_name: str, user_id: str, session_id: str, filename: str
+    ) -> None:
+        path = self._artifact_path(app_name, user_id, session_id, filename)
+        if path in self._artifacts:
+            self._drop_artifact(path)
+
+    @override
+    async def list_versions(
+        self, *, app_name: str, user_id: str, session_id: str, filename: str
+    ) -> list[int]:
+        self._expire()
+        stored = self._artifacts.get(
+            self._artifact_path(app_name, user_id, session_id, filename)
+        )
+        return sorted(stored.versions) if stored else []
+
+    def stats(self) -> ArtifactStoreStats:
+        """Returns the current counters."""
+        return ArtifactStoreStats(
+            resident_bytes=self._resident_bytes,
+            max_resident_bytes=self._max_resident_bytes,
+            resident_versions=len(self._resident),
+            spilled_bytes=self._spilled_bytes,
+            spilled_versions=self._spilled_versions,
+            evictions=self._evictions,
+            expirations=self._expirations,
+        )
+
+    def close(self) -> None:
+        """Drops every artifact, and removes the files moved to disk."""
+        self._artifacts.clear()
+        self._resident.clear()
+        self._resident_bytes = 0
+        if self._spill_dir is not None:
+            logger.info("Removing the artifacts moved to {}", self._spill_dir)
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
@@ -0,0 +1,95 @@
+"""Concurrent execution of the messages of a batch."""
+
+import asyncio
+import contextvars
+from collections import deque
+from collections.abc import AsyncGenerator, Awaitable, Callable
+
+from loguru import logger
+from pydantic import BaseModel, Field
+
+from src.agent.admission import AdmissionRejectedError
+from src.agent.custom_types import Message
+from src.ofga_operations.lookup_memo import shared_lookups
+
+
+class MessageResult(BaseModel):
+    """The outcome of a message of a batch."""
+
+    index: int = Field(description="Position of the message in the batch.")
+    answer: str | None = Field(default=None)
+    error: str | None = Field(default=None)
+
+
+def _by_session(messages: list[Message]) -> dict[str, deque[tuple[int, Message]]]:
+    """The messages of each session, in order, with their position in the batch."""
+    waiting: dict[str, deque[tuple[int, Message]]] = {}
+    for index, message in enumerate(messages):
+        waiting.setdefault(message.session_id, deque()).append((index, message))
+    return waiting
+
+
+def _pop_next(
+    waiting: dict[str, deque[tuple[int, Message]]], busy: set[str]
+) -> tuple[int, Message] | None:
+    """Pops the earliest message of a session without a running message."""
+    idle = [session_id for session_id in waiting if session_id not in busy]
+    if not idle:
+        return None
+    session_id = min(idle, key=lambda session_id: waiting[session_id][0][0])
+    next_message = waiting[session_id].popleft()
+    if not waiting[session_id]:
+        del waiting[session_id]
+    return next_message
+
+
+async def run_messages(
+    messages: list[Message],
+    answer: Callable[[Message], Awaitable[str]],
+    max_concurrent_messages: int,
+) -> AsyncGenerator[MessageResult, None]:
+    """Answers the messages, at most `max_concurrent_messages` at a time.
+
+    A message is only started once another one is done, so no more than
+    `max_concurrent_messages` tasks exist at once. Messages of the same session are
+    answered one after the other, in order, and a session only takes a slot once its
+    previous message is answered. The ACL lookups are shared between all the messages,
+    so those of the same user only list their objects once.
+
+    Yields:
+        The result of every message, as soon as it's answered. A failing message
+        doesn't stop the others.
+    """
+
+    async def _run(index: int, message: Message) -> MessageResult:
+        try:
+            return MessageResult(index=index, answer=await answer(message))
+        except AdmissionRejectedError as rejected:
+            return MessageResult(index=index, error=str(rejected))
+        except Exception:  # noqa: BLE001
+            logger.exception("Message {} of the batch failed.", index)
+            return MessageResult(index=index, error="The request failed.")
+
+    with shared_lookups():
+        # The tasks run in this context, so they share the lookups.
+        context = contextvars.copy_context()
+    waiting = _by_session(messages)
+    # The session of each running message.
+    running: dict[asyncio.Task[MessageResult], str] = {}
+    try:
+        while True:
+            while len(running) < max_concurrent_messages:
+                next_message = _pop_next(waiting, busy=set(running.values()))
+                if next_message is None:
+                    break
+                task = asyncio.create_task(_run(*next_message), context=context)
+                running[task] = next_message[1].session_id
+            if not running:
+                return
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                del running[task]
+                yield task.result()
+    finally:
+        for task in running:
+            task.cancel()
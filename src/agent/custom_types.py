@@ -1,6 +1,7 @@
 """Custom types for the agent."""
 
-from sqlite3 import Connection
+from enum import StrEnum
+from pathlib import Path
 from typing import NewType
 
 from google.adk.agents import LlmAgent
@@ -8,6 +9,8 @@ from google.genai import types
 from pydantic import BaseModel, Field
 from uuid_extensions import uuid7str
 
+from src.tabular_data.backends import TabularBackend
+
 
 class Message(BaseModel):
     """Base message class."""
@@ -17,6 +20,101 @@ class Message(BaseModel):
     session_id: str = Field(default_factory=uuid7str)
 
 
+class MessageBatch(BaseModel):
+    """Messages answered by a single request."""
+
+    messages: list[Message] = Field(min_length=1)
+    stream: bool = Field(
+        default=False,
+        description="Whether to stream the results as they complete, as JSON lines, "
+        "instead of returning all of them in order.",
+    )
+
+
+class TabularResultMode(StrEnum):
+    """How the tabular agents return the rows they read.
+
+    *SINGLE_EVENT* serializes every row in a single event.
+    *CHUNKED* emits events of at most `chunk_size` rows, each carrying the column
+        names.
+    """
+
+    SINGLE_EVENT = "SINGLE_EVENT"
+    CHUNKED = "CHUNKED"
+
+
+class TabularBackendKind(StrEnum):
+    """Which backend a tabular agent reads its dataset from.
+
+    *SQLITE* queries an on-disk SQLite copy of the dataset.
+    *NUMPY* keeps the dataset in memory as NumPy arrays.
+    *COLUMNAR* maps an on-disk columnar copy of the dataset, for datasets larger than
+        the memory.
+    """
+
+    SQLITE = "SQLITE"
+    NUMPY = "NUMPY"
+    COLUMNAR = "COLUMNAR"
+
+
+class TabularResultOptions(BaseModel):
+    """Per agent options on the rows returned by the tabular agents."""
+
+    mode: TabularResultMode = Field(default=TabularResultMode.SINGLE_EVENT)
+    columns: list[str] | None = Field(
+        default=None,
+        description="Columns to return, in order. All of them when not provided.",
+    )
+    max_rows: int | None = Field(
+        default=None,
+        gt=0,
+        description="Maximum number of rows returned. Unbounded when not provided.",
+    )
+    chunk_size: int = Field(
+        default=100, gt=0, description="Maximum number of rows per event."
+    )
+
+
+class ArtifactStoreOptions(BaseModel):
+    """Bounds on the artifacts kept by a worker."""
+
+    max_resident_bytes: int = Field(
+        default=64 * 1024 * 1024,
+        gt=0,
+        description="How many bytes of artifacts are kept in memory.",
+    )
+    max_versions: int = Field(
+        default=4, gt=0, description="How many versions of an artifact are kept."
+    )
+    ttl_seconds: float = Field(
+        default=60 * 60,
+        gt=0,
+        description="How long an artifact is kept after its last save.",
+    )
+    spill_dir: Path | None = Field(
+        default=None,
+        description="Directory where the artifacts evicted from memory are written. "
+        "They are dropped when not provided.",
+    )
+
+
+class AdmissionOptions(BaseModel):
+    """Bounds on the messages a worker answers at once, and on those waiting."""
+
+    max_in_flight: int = Field(
+        default=32, gt=0, description="How many messages are answered at once."
+    )
+    max_queued: int = Field(
+        default=64, ge=0, description="How many messages may wait, across all users."
+    )
+    max_queued_per_user: int = Field(
+        default=8, ge=0, description="How many messages of a user may wait."
+    )
+    queue_timeout_seconds: float = Field(
+        default=10.0, gt=0, description="How long a message may wait."
+    )
+
+
 class CustomAgentState(BaseModel):
     """Custom state for the agent."""
 
@@ -25,14 +123,33 @@ class CustomAgentState(BaseModel):
 
 
 AppName = NewType("AppName", str)
+# How many messages of a batch are answered at once.
+MessageConcurrency = NewType("MessageConcurrency", int)
+MaxBatchMessages = NewType("MaxBatchMessages", int)
 AgentName = NewType("AgentName", str)
-DocumentListArtifactKey = NewType("DocumentListArtifactKey", str)
-RowListArtifactKey = NewType("RowListArtifactKey", str)
 RetrieveContextKey = NewType("RetrieveContextKey", str)
+# How many sections the retrieval returns, at most.
+RetrievalTopK = NewType("RetrievalTopK", int)
+# Approximate number of tokens of the retrieved sections passed to the answering agent.
+ContextTokenBudget = NewType("ContextTokenBudget", int)
 GeminiModel = NewType("GeminiModel", str)
 AnsweringAgent = NewType("AnsweringAgent", LlmAgent)  # type: ignore
 DispatcherAgent = NewType("DispatcherAgent", LlmAgent)  # type: ignore
 
+# SQLite file where the sessions are kept.
+SessionDatabasePath = NewType("SessionDatabasePath", Path)
+# How long a session is kept after its last update, in seconds.
+SessionTTLSeconds = NewType("SessionTTLSeconds", float)
+# How many recently used sessions are kept in memory.
+SessionCacheSize = NewType("SessionCacheSize", int)
+
+# Where the on-disk copies of the tabular datasets are kept.
+TabularCacheDir = NewType("TabularCacheDir", Path)
+# How many queries on a tabular dataset may run at once.
+TabularQueryPoolSize = NewType("TabularQueryPoolSize", int)
+
 # Differentiate the tabular datasources by giving them their own type alias
-HRDataConnection = NewType("HRDataConnection", Connection)
-FinancialDataConnection = NewType("FinancialDataConnection", Connection)
+HRDataBackend = NewType("HRDataBackend", TabularBackend)
+FinancialDataBackend = NewType("FinancialDataBackend", TabularBackend)
+HRDataBackendKind = NewType("HRDataBackendKind", TabularBackendKind)
+FinancialDataBackendKind = NewType("FinancialDataBackendKind", TabularBackendKind)
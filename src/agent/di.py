@@ -4,26 +4,28 @@ from textwrap import dedent
 from typing import override
 
 from google.adk.agents import BaseAgent, LlmAgent
-from google.adk.runners import (
-    BaseArtifactService,
-    InMemoryArtifactService,
-    InMemorySessionService,
-    Runner,
-)
+from google.adk.runners import BaseArtifactService, Runner
 from google.adk.sessions import BaseSessionService
 from injector import Binder, Module, provider, singleton
 
+from src.agent.admission import AdmissionController
 from src.agent.agent import OFGATestAgent
+from src.agent.artifacts import BoundedArtifactService
 from src.agent.custom_types import (
+    AdmissionOptions,
     AgentName,
     AnsweringAgent,
     AppName,
+    ArtifactStoreOptions,
     DispatcherAgent,
-    DocumentListArtifactKey,
     GeminiModel,
+    RetrievalTopK,
     RetrieveContextKey,
-    RowListArtifactKey,
+    SessionCacheSize,
+    SessionDatabasePath,
+    SessionTTLSeconds,
 )
+from src.agent.sessions import SQLiteSessionService
 from src.agent.sub_agents.document_agents import (
     DocumentHandlerAgent,
 )
@@ -54,8 +56,36 @@ class AgentModule(Module):
 
     @provider
     @singleton
-    def _provide_session_service(self) -> BaseSessionService:  # noqa: PLR6301
-        return InMemorySessionService()
+    def _provide_sqlite_session_service(  # noqa: PLR6301
+        self,
+        db_path: SessionDatabasePath,
+        ttl_seconds: SessionTTLSeconds,
+        max_cached_sessions: SessionCacheSize,
+    ) -> SQLiteSessionService:
+        return SQLiteSessionService(
+            db_path,
+            max_cached_sessions=max_cached_sessions,
+            ttl_seconds=ttl_seconds,
+        )
+
+    @provider
+    @singleton
+    def _provide_session_service(  # noqa: PLR6301
+        self, session_service: SQLiteSessionService
+    ) -> BaseSessionService:
+        return session_service
+
+    @provider
+    @singleton
+    def _provide_admission_controller(  # noqa: PLR6301
+        self, options: AdmissionOptions
+    ) -> AdmissionController:
+        return AdmissionController(
+            max_in_flight=options.max_in_flight,
+            max_queued=options.max_queued,
+            max_queued_per_user=options.max_queued_per_user,
+            queue_timeout_seconds=options.queue_timeout_seconds,
+        )
 
     @provider
     @singleton
@@ -73,8 +103,22 @@ class AgentModule(Module):
 
     @provider
     @singleton
-    def _provde_artifact_service(self) -> BaseArtifactService:  # noqa: PLR6301
-        return InMemoryArtifactService()
+    def _provide_bounded_artifact_service(  # noqa: PLR6301
+        self, options: ArtifactStoreOptions
+    ) -> BoundedArtifactService:
+        return BoundedArtifactService(
+            max_resident_bytes=options.max_resident_bytes,
+            max_versions=options.max_versions,
+            ttl_seconds=options.ttl_seconds,
+            spill_dir=options.spill_dir,
+        )
+
+    @provider
+    @singleton
+    def _provde_artifact_service(  # noqa: PLR6301
+        self, artifact_service: BoundedArtifactService
+    ) -> BaseArtifactService:
+        return artifact_service
 
     @provider
     @singleton
@@ -131,6 +175,5 @@ class AgentModule(Module):
     @override
     def configure(self, binder: Binder) -> None:
         """Define simple bindings."""
-        binder.bind(DocumentListArtifactKey, to=DocumentListArtifactKey("documents"))
-        binder.bind(RowListArtifactKey, to=RowListArtifactKey("rows"))
         binder.bind(RetrieveContextKey, to=RetrieveContextKey("retrieved_context"))
+        binder.bind(RetrievalTopK, to=RetrievalTopK(20))
@@ -1,13 +1,19 @@
 """Entrypoint."""
 
+import os
 from argparse import ArgumentParser
-from contextlib import asynccontextmanager
-from pathlib import Path
+from collections.abc import AsyncGenerator
+from contextlib import AsyncExitStack, asynccontextmanager
+from enum import StrEnum
+from functools import partial
+from http import HTTPStatus
 from typing import Any
 
 import uvicorn
-from fastapi import FastAPI
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi_injector import Injected, attach_injector
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.adk.runners import Runner
 from google.adk.sessions import BaseSessionService, Session
 from google.genai import types
@@ -15,83 +21,187 @@ from injector import Binder, Injector, SingletonScope
 from loguru import logger
 from openfga_sdk import OpenFgaClient
 
+from src.agent.admission import AdmissionController, AdmissionRejectedError
+from src.agent.artifacts import BoundedArtifactService
+from src.agent.batch import run_messages
 from src.agent.custom_types import (
+    AdmissionOptions,
     AgentName,
     AppName,
+    ArtifactStoreOptions,
+    ContextTokenBudget,
+    FinancialDataBackend,
+    FinancialDataBackendKind,
     GeminiModel,
+    HRDataBackend,
+    HRDataBackendKind,
+    MaxBatchMessages,
     Message,
+    MessageBatch,
+    MessageConcurrency,
+    SessionCacheSize,
+    SessionDatabasePath,
+    SessionTTLSeconds,
+    TabularCacheDir,
+    TabularQueryPoolSize,
 )
 from src.agent.di import AgentModule
+from src.agent.sessions import SQLiteSessionService
+from src.agent.settings import ServerSettings
+from src.agent.streaming import NO_FINAL_RESPONSE, server_sent_events
 from src.agent.sub_agents.di import SubAgentModule
+from src.agent.sub_agents.tabular_agent import TabularResultCache
 from src.configuration import ConfigurationModule
+from src.ofga_operations.cache import CachedOpenFgaClient
+from src.ofga_operations.local_evaluation import EmbeddedOpenFgaClient
+from src.ofga_operations.watcher import ChangeWatcher
 from src.project_types import SerializedConfigurationPath, ShouldResolveMissingValues
 
-parser = ArgumentParser()
-parser.add_argument(
-    "--configuration",
-    type=str,
-    help="Path where to find the serialized (in JSON) configuration.",
-)
-parser.add_argument(
-    "--app_name",
-    type=str,
-    default="test_ofga_app",
-    help="Name of the app",
-)
-parser.add_argument(
-    "--agent_name",
-    type=str,
-    default="test_ofga_agent",
-    help="Name of the agent.",
-)
-parser.add_argument(
-    "--model_version",
-    type=str,
-    default="gemini-2.0-flash-001",
-    help="Gemini version to use.",
-)
-args = parser.parse_args()
 
-
-def _bind_flags(binder: Binder) -> None:
-    configuration_path = SerializedConfigurationPath(Path(args.configuration))
+def _bind_settings(settings: ServerSettings, binder: Binder) -> None:
     binder.bind(
-        SerializedConfigurationPath, to=configuration_path, scope=SingletonScope
+        SerializedConfigurationPath,
+        to=SerializedConfigurationPath(settings.configuration),
+        scope=SingletonScope,
     )
     binder.bind(
         ShouldResolveMissingValues,
         to=ShouldResolveMissingValues.YES,
         scope=SingletonScope,
     )
-    binder.bind(GeminiModel, to=GeminiModel(args.model_version), scope=SingletonScope)
-    binder.bind(AppName, to=AppName(args.app_name), scope=SingletonScope)
-    binder.bind(AgentName, to=AgentName(args.agent_name), scope=SingletonScope)
+    binder.bind(
+        GeminiModel, to=GeminiModel(settings.model_version), scope=SingletonScope
+    )
+    binder.bind(AppName, to=AppName(settings.app_name), scope=SingletonScope)
+    binder.bind(AgentName, to=AgentName(settings.agent_name), scope=SingletonScope)
+    binder.bind(
+        ContextTokenBudget,
+        to=ContextTokenBudget(settings.context_token_budget),
+        scope=SingletonScope,
+    )
+    binder.bind(
+        TabularCacheDir,
+        to=TabularCacheDir(settings.tabular_cache_dir),
+        scope=SingletonScope,
+    )
+    binder.bind(
+        TabularQueryPoolSize,
+        to=TabularQueryPoolSize(settings.tabular_query_pool_size),
+        scope=SingletonScope,
+    )
+    binder.bind(
+        HRDataBackendKind,
+        to=HRDataBackendKind(settings.hr_data_backend),
+        scope=SingletonScope,
+    )
+    binder.bind(
+        FinancialDataBackendKind,
+        to=FinancialDataBackendKind(settings.financial_data_backend),
+        scope=SingletonScope,
+    )
+    binder.bind(
+        MessageConcurrency,
+        to=MessageConcurrency(settings.max_concurrent_messages),
+        scope=SingletonScope,
+    )
+    binder.bind(
+        MaxBatchMessages,
+        to=MaxBatchMessages(settings.max_batch_messages),
+        scope=SingletonScope,
+    )
+    binder.bind(
+        SessionDatabasePath,
+        to=SessionDatabasePath(settings.session_db_path),
+        scope=SingletonScope,
+    )
+    binder.bind(
+        SessionTTLSeconds,
+        to=SessionTTLSeconds(settings.session_ttl_seconds),
+        scope=SingletonScope,
+    )
+    binder.bind(
+        SessionCacheSize,
+        to=SessionCacheSize(settings.max_cached_sessions),
+        scope=SingletonScope,
+    )
+    binder.bind(
+        ArtifactStoreOptions,
+        to=ArtifactStoreOptions(
+            max_resident_bytes=settings.artifact_max_resident_bytes,
+            max_versions=settings.artifact_max_versions,
+            ttl_seconds=settings.artifact_ttl_seconds,
+            spill_dir=settings.artifact_spill_dir,
+        ),
+        scope=SingletonScope,
+    )
+    binder.bind(
+        AdmissionOptions,
+        to=AdmissionOptions(
+            max_in_flight=settings.max_in_flight_messages,
+            max_queued=settings.max_queued_messages,
+            max_queued_per_user=settings.max_queued_messages_per_user,
+            queue_timeout_seconds=settings.queue_timeout_seconds,
+        ),
+        scope=SingletonScope,
+    )
+
 
+def build_injector(settings: ServerSettings) -> Injector:
+    """The injector of a worker. Nothing is instantiated until requested."""
+    return Injector([
+        # Bind settings so that they are available by the other modules.
+        partial(_bind_settings, settings),
+        # Confiugration module
+        ConfigurationModule(),
+        # Module for the sub agents
+        SubAgentModule(),
+        # Main agent module.
+        AgentModule(),
+    ])
 
-inj = Injector([
-    # Bind flags so that they are available by the other modules.
-    _bind_flags,
-    # Confiugration module
-    ConfigurationModule(),
-    # Module for the sub agents
-    SubAgentModule(),
-    # Main agent module.
-    AgentModule(),
-])
+
+async def _mirror_stores(clients: dict[str, OpenFgaClient]) -> None:
+    """Reads the tuples of the stores evaluated locally.
+
+    Until then, and if reading fails, their requests are sent to the server.
+    """
+    for store_key, client in clients.items():
+        if not isinstance(client, EmbeddedOpenFgaClient):
+            continue
+        try:
+            tuple_count = await client.mirror_store()
+        except Exception:  # noqa: BLE001
+            logger.exception("Failed mirroring the tuples of store {}", store_key)
+            continue
+        logger.info("Mirrored {} tuples of store {}.", tuple_count, store_key)
 
 
 @asynccontextmanager
-async def lifespan(_: FastAPI):  # noqa: ANN201, D103
+async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
+    """Starts, then stops, the services of the worker serving the app."""
+    inj: Injector = app.state.injector
     # Startup ops.
-    yield
-    clients = inj.get(dict[str, OpenFgaClient])
-    for client in clients.values():
-        logger.info("Closing pending open fga clients.")
-        await client.close()
+    watcher = inj.get(ChangeWatcher)
+    # After creating the watcher, so that it reads the changes made meanwhile.
+    await _mirror_stores(inj.get(dict[str, OpenFgaClient]))
+    watcher.start()
+    try:
+        yield
+    finally:
+        await watcher.stop()
+        clients = inj.get(dict[str, OpenFgaClient])
+        for client in clients.values():
+            logger.info("Closing pending open fga clients.")
+            await client.close()
+        logger.info("Closing the tabular backends.")
+        inj.get(HRDataBackend).close()
+        inj.get(FinancialDataBackend).close()
+        logger.info("Writing the pending session events.")
+        await inj.get(SQLiteSessionService).close()
+        inj.get(BoundedArtifactService).close()
 
 
-app = FastAPI(lifespan=lifespan)
-attach_injector(app, inj)
+router = APIRouter()
 
 
 async def get_or_create_session(
@@ -122,14 +232,9 @@ async def get_or_create_session(
     )
 
 
-@app.post("/message")
-async def new_message(
-    message: Message,
-    app_name: AppName = Injected(AppName),  # noqa: B008
-    session_service: BaseSessionService = Injected(BaseSessionService),  # noqa: B008
-    runner: Runner = Injected(Runner),  # noqa: B008
-) -> dict[str, Any]:
-    """New message endpoint."""
+async def _session_and_content(
+    message: Message, app_name: str, session_service: BaseSessionService
+) -> tuple[Session, types.Content]:
     logger.info(
         "Received new message from user {}. Content: {}", message.user_id, message.body
     )
@@ -141,24 +246,232 @@ async def new_message(
         session_service=session_service,
         user_content=content,
     )
-    events = runner.run_async(
-        user_id=session.user_id, session_id=session.id, new_message=content
-    )
-    final_response = "No final response captured."
-    async for event in events:
-        if (
-            event
-            and event.is_final_response()
-            and event.content
-            and event.content.parts
-            and event.content.parts[0].text
-        ):
-            final_response = event.content.parts[0].text
+    return session, content
+
+
+async def _answer(
+    message: Message,
+    app_name: str,
+    session_service: BaseSessionService,
+    runner: Runner,
+    admission: AdmissionController,
+) -> str:
+    async with admission.admit(message.user_id):
+        session, content = await _session_and_content(
+            message, app_name, session_service
+        )
+        events = runner.run_async(
+            user_id=session.user_id, session_id=session.id, new_message=content
+        )
+        final_response = NO_FINAL_RESPONSE
+        async for event in events:
+            if (
+                event
+                and event.is_final_response()
+                and event.content
+                and event.content.parts
+                and event.content.parts[0].text
+            ):
+                final_response = event.content.parts[0].text
 
     logger.info("Final response {}", final_response)
-    return {"answer": final_response}
+    return final_response
+
+
+@router.post("/message")
+async def new_message(
+    message: Message,
+    app_name: AppName = Injected(AppName),  # noqa: B008
+    session_service: BaseSessionService = Injected(BaseSessionService),  # noqa: B008
+    runner: Runner = Injected(Runner),  # noqa: B008
+    admission: AdmissionController = Injected(AdmissionController),  # noqa: B008
+) -> dict[str, Any]:
+    """New message endpoint.
+
+    Messages wait for their turn when the worker is busy, and are rejected with a 429
+    or 503 status and a `Retry-After` header when they can't.
+    """
+    return {
+        "answer": await _answer(message, app_name, session_service, runner, admission)
+    }
+
+
+@router.get("/metrics")
+async def metrics(  # noqa: PLR0913, PLR0917
+    admission: AdmissionController = Injected(AdmissionController),  # noqa: B008
+    artifact_service: BoundedArtifactService = Injected(BoundedArtifactService),  # noqa: B008
+    clients: dict[str, OpenFgaClient] = Injected(dict[str, OpenFgaClient]),  # noqa: B008
+    result_cache: TabularResultCache = Injected(TabularResultCache),  # noqa: B008
+    hr_data: HRDataBackend = Injected(HRDataBackend),  # noqa: B008
+    financial_data: FinancialDataBackend = Injected(FinancialDataBackend),  # noqa: B008
+) -> dict[str, Any]:
+    """Load of the worker serving the request, and usage of its caches and pools.
+
+    The tabular backends without connections, and the clients without a decision
+    cache, are reported as null.
+    """
+    return {
+        "admission": admission.stats().model_dump(),
+        "artifacts": artifact_service.stats().model_dump(),
+        "decision_caches": {
+            name: client.decision_cache.stats().model_dump()
+            if isinstance(client, CachedOpenFgaClient)
+            else None
+            for name, client in clients.items()
+        },
+        "tabular_results": result_cache.stats().model_dump(),
+        "tabular_queries": {
+            name: stats.model_dump() if (stats := backend.stats()) else None
+            for name, backend in (("hr", hr_data), ("financial", financial_data))
+        },
+    }
+
+
+async def _rejected_message(request: Request, exc: Exception) -> JSONResponse:  # noqa: ARG001, RUF029
+    if not isinstance(exc, AdmissionRejectedError):
+        raise exc
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc), "reason": exc.reason},
+        headers=exc.headers,
+    )
+
+
+async def _bounded_batch(  # noqa: RUF029
+    batch: MessageBatch,
+    max_batch_messages: MaxBatchMessages = Injected(MaxBatchMessages),  # noqa: B008
+) -> MessageBatch:
+    if len(batch.messages) > max_batch_messages:
+        raise HTTPException(
+            status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+            detail=f"A batch holds at most {max_batch_messages} messages.",
+        )
+    return batch
+
+
+@router.post("/messages", response_model=None)
+async def new_messages(  # noqa: PLR0913, PLR0917
+    batch: MessageBatch = Depends(_bounded_batch),  # noqa: B008
+    app_name: AppName = Injected(AppName),  # noqa: B008
+    session_service: BaseSessionService = Injected(BaseSessionService),  # type: ignore[type-abstract]  # noqa: B008
+    runner: Runner = Injected(Runner),  # noqa: B008
+    max_concurrent_messages: MessageConcurrency = Injected(MessageConcurrency),  # noqa: B008
+    admission: AdmissionController = Injected(AdmissionController),  # noqa: B008
+) -> dict[str, Any] | StreamingResponse:
+    """Answers a batch of messages concurrently.
+
+    The results come back in the order of the messages, or, when streaming, as JSON
+    lines in the order they complete. Batches holding more than `max_batch_messages`
+    messages are rejected with a 422 status. Every message is admitted like those of
+    the new message endpoint, those that aren't getting an error as result.
+    """
+    results = run_messages(
+        batch.messages,
+        answer=partial(
+            _answer,
+            app_name=app_name,
+            session_service=session_service,
+            runner=runner,
+            admission=admission,
+        ),
+        max_concurrent_messages=max_concurrent_messages,
+    )
+    if batch.stream:
+        return StreamingResponse(
+            (f"{result.model_dump_json()}\n" async for result in results),
+            media_type="application/x-ndjson",
+        )
+    ordered_results = sorted([r async for r in results], key=lambda r: r.index)
+    return {"results": [r.model_dump() for r in ordered_results]}
+
+
+@router.post("/message/stream")
+async def new_message_stream(
+    message: Message,
+    app_name: AppName = Injected(AppName),  # noqa: B008
+    session_service: BaseSessionService = Injected(BaseSessionService),  # type: ignore[type-abstract]  # noqa: B008
+    runner: Runner = Injected(Runner),  # noqa: B008
+    admission: AdmissionController = Injected(AdmissionController),  # noqa: B008
+) -> StreamingResponse:
+    """Same as the new message endpoint, streaming Server-Sent Events.
+
+    Sub agents progress and partial responses are streamed as they happen, and the
+    final answer comes last. The message is admitted before the stream starts, and
+    holds its slot until the stream ends.
+    """
+    async with AsyncExitStack() as stack:
+        await stack.enter_async_context(admission.admit(message.user_id))
+        session, content = await _session_and_content(
+            message, app_name, session_service
+        )
+        events = runner.run_async(
+            user_id=session.user_id,
+            session_id=session.id,
+            new_message=content,
+            run_config=RunConfig(streaming_mode=StreamingMode.SSE),
+        )
+        # Released by the stream instead.
+        slot = stack.pop_all()
+
+    async def _admitted_events() -> AsyncGenerator[str, None]:
+        async with slot:
+            async for server_sent_event in server_sent_events(events):
+                yield server_sent_event
+
+    return StreamingResponse(
+        _admitted_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def create_app(settings: ServerSettings | None = None) -> FastAPI:
+    """Builds the app of a worker, with its own clients and caches.
+
+    Args:
+        settings (ServerSettings | None): The settings of the server. Read from the
+            environment when not provided, which is what workers started by uvicorn or
+            gunicorn do.
+    """
+    settings = settings or ServerSettings.from_env()
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(router)
+    app.add_exception_handler(AdmissionRejectedError, _rejected_message)
+    attach_injector(app, build_injector(settings))
+    return app
+
+
+def _parse_settings() -> ServerSettings:
+    parser = ArgumentParser()
+    for name, field in ServerSettings.model_fields.items():
+        annotation = field.annotation
+        parser.add_argument(
+            f"--{name}",
+            type=str,
+            choices=[str(choice) for choice in annotation]
+            if isinstance(annotation, type) and issubclass(annotation, StrEnum)
+            else None,
+            help=field.description,
+        )
+    args = parser.parse_args()
+    # Flags that aren't provided fall back to the environment, then to the defaults.
+    return ServerSettings.from_env(**{
+        name: value for name, value in vars(args).items() if value is not None
+    })
 
 
 def entrypoint() -> None:
-    """The actual entrypoint."""
-    uvicorn.run(app, host="0.0.0.0", port=8000)  # noqa: S104
+    """The actual entrypoint.
+
+    The settings are exported to the environment, where every worker reads them back
+    from to build its own app.
+    """
+    settings = _parse_settings()
+    os.environ.update(settings.to_env())
+    uvicorn.run(
+        "src.agent.main:create_app",
+        factory=True,
+        host=settings.host,
+        port=settings.port,
+        workers=settings.workers,
+    )
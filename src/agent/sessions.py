@@ -0,0 +1,563 @@
+"""Sessions kept in a local SQLite file, with the recent ones cached in memory.
+
+The file is opened in WAL mode, so the workers of a server share the sessions: a
+worker reloads a cached session when another one updated it since. Events are written
+behind the request, in batches, and sessions idle for longer than their time to live
+are dropped, so neither the memory nor the file grow without limit.
+"""
+
+import asyncio
+import copy
+import json
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, NamedTuple, TypeVar, override
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, Session, State
+from google.adk.sessions.base_session_service import (
+    GetSessionConfig,
+    ListSessionsResponse,
+)
+from loguru import logger
+from pydantic_core import to_json
+
+T = TypeVar("T")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    last_update_time REAL NOT NULL,
+    PRIMARY KEY (app_name, user_id, session_id)
+);
+CREATE INDEX IF NOT EXISTS sessions_last_update_time
+    ON sessions (last_update_time);
+CREATE TABLE IF NOT EXISTS events (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    event TEXT NOT NULL,
+    FOREIGN KEY (app_name, user_id, session_id)
+        REFERENCES sessions (app_name, user_id, session_id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS events_session ON events (app_name, user_id, session_id);
+CREATE TABLE IF NOT EXISTS app_states (
+    app_name TEXT NOT NULL PRIMARY KEY,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_states (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (app_name, user_id)
+);
+"""
+_UPSERT_SESSION = """
+INSERT INTO sessions (app_name, user_id, session_id, state, last_update_time)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (app_name, user_id, session_id)
+DO UPDATE SET state = excluded.state, last_update_time = excluded.last_update_time
+"""
+_SESSION_KEY_CLAUSE = "app_name = ? AND user_id = ? AND session_id = ?"
+_SHARED_PREFIXES = (State.APP_PREFIX, State.USER_PREFIX, State.TEMP_PREFIX)
+
+
+class SessionKey(NamedTuple):
+    """Identifies a session."""
+
+    app_name: str
+    user_id: str
+    session_id: str
+
+
+class _PendingSession:
+    """What is still to be written of a session."""
+
+    def __init__(self, session: Session, *, created: bool) -> None:
+        self.session = session
+        # Whether the rows of a previous session with the same key must go.
+        self.created = created
+        self.events: list[Event] = []
+
+
+class _StoredSession(NamedTuple):
+    """What `_read_session` found in the file."""
+
+    exists: bool
+    # None when the cached copy is current.
+    session: Session | None
+    shared_state: dict[str, Any]
+
+
+def _connect(db_path: Path, busy_timeout_seconds: float) -> sqlite3.Connection:
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=busy_timeout_seconds)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _session_state(session: Session) -> str:
+    """The state kept with the session, without the app, user and temp keys."""
+    return to_json({
+        key: value
+        for key, value in session.state.items()
+        if not key.startswith(_SHARED_PREFIXES)
+    }).decode()
+
+
+def _read_shared_state(
+    conn: sqlite3.Connection, app_name: str, user_id: str
+) -> dict[str, Any]:
+    shared_state = {}
+    app_row = conn.execute(
+        "SELECT state FROM app_states WHERE app_name = ?", (app_name,)
+    ).fetchone()
+    if app_row:
+        for key, value in json.loads(app_row[0]).items():
+            shared_state[State.APP_PREFIX + key] = value
+    user_row = conn.execute(
+        "SELECT state FROM user_states WHERE app_name = ? AND user_id = ?",
+        (app_name, user_id),
+    ).fetchone()
+    if user_row:
+        for key, value in json.loads(user_row[0]).items():
+            shared_state[State.USER_PREFIX + key] = value
+    return shared_state
+
+
+def _read_session(
+    conn: sqlite3.Connection, key: SessionKey, cached_update_time: float | None
+) -> _StoredSession:
+    shared_state = _read_shared_state(conn, key.app_name, key.user_id)
+    row = conn.execute(
+        f"SELECT state, last_update_time FROM sessions WHERE {_SESSION_KEY_CLAUSE}",  # noqa: S608
+        key,
+    ).fetchone()
+    if row is None:
+        return _StoredSession(exists=False, session=None, shared_state=shared_state)
+    state, last_update_time = row
+    if cached_update_time is not None and last_update_time <= cached_update_time:
+        return _StoredSession(exists=True, session=None, shared_state=shared_state)
+    events = [
+        Event.model_validate_json(row[0])
+        for row in conn.execute(
+            f"SELECT event FROM events WHERE {_SESSION_KEY_CLAUSE} ORDER BY rowid",  # noqa: S608
+            key,
+        )
+    ]
+    session = Session(
+        id=key.session_id,
+        app_name=key.app_name,
+        user_id=key.user_id,
+        state=json.loads(state),
+        events=events,
+        last_update_time=last_update_time,
+    )
+    return _StoredSession(exists=True, session=session, shared_state=shared_state)
+
+
+def _write_sessions(
+    conn: sqlite3.Connection,
+    sessions: list[tuple[SessionKey, str, float, bool]],
+    events: list[tuple[str, str, str, str]],
+    expired_before: float,
+) -> None:
+    with conn:
+        for key, state, last_update_time, created in sessions:
+            if created:
+                conn.execute(
+                    f"DELETE FROM events WHERE {_SESSION_KEY_CLAUSE}",  # noqa: S608
+                    key,
+                )
+            conn.execute(_UPSERT_SESSION, (*key, state, last_update_time))
+        conn.executemany(
+            "INSERT INTO events (app_name, user_id, session_id, event) "
+            "VALUES (?, ?, ?, ?)",
+            events,
+        )
+        expired = conn.execute(
+            "DELETE FROM sessions WHERE last_update_time < ?", (expired_before,)
+        ).rowcount
+    if expired:
+        logger.info("Dropped {} expired sessions.", expired)
+
+
+def _update_shared_state(
+    conn: sqlite3.Connection,
+    app_name: str,
+    user_id: str,
+    app_delta: dict[str, Any],
+    user_delta: dict[str, Any],
+) -> None:
+    with conn:
+        if app_delta:
+            row = conn.execute(
+                "SELECT state FROM app_states WHERE app_name = ?", (app_name,)
+            ).fetchone()
+            state = {**(json.loads(row[0]) if row else {}), **app_delta}
+            conn.execute(
+                "INSERT OR REPLACE INTO app_states (app_name, state) VALUES (?, ?)",
+                (app_name, to_json(state).decode()),
+            )
+        if user_delta:
+            row = conn.execute(
+                "SELECT state FROM user_states WHERE app_name = ? AND user_id = ?",
+                (app_name, user_id),
+            ).fetchone()
+            state = {**(json.loads(row[0]) if row else {}), **user_delta}
+            conn.execute(
+                "INSERT OR REPLACE INTO user_states (app_name, user_id, state) "
+                "VALUES (?, ?, ?)",
+                (app_name, user_id, to_json(state).decode()),
+            )
+
+
+def _delete_session(conn: sqlite3.Connection, key: SessionKey) -> None:
+    with conn:
+        conn.execute(
+            f"DELETE FROM sessions WHERE {_SESSION_KEY_CLAUSE}",  # noqa: S608
+            key,
+        )
+
+
+def _list_sessions(
+    conn: sqlite3.Connection, app_name: str, user_id: str, expired_before: float
+) -> list[Session]:
+    return [
+        Session(
+            id=session_id,
+            app_name=app_name,
+            user_id=user_id,
+            last_update_time=last_update_time,
+        )
+        for session_id, last_update_time in conn.execute(
+            "SELECT session_id, last_update_time FROM sessions "
+            "WHERE app_name = ? AND user_id = ? AND last_update_time >= ?",
+            (app_name, user_id, expired_before),
+        )
+    ]
+
+
+def _filter_events(session: Session, config: GetSessionConfig) -> None:
+    """Keeps the events `config` asks for, like `InMemorySessionService`."""
+    if config.num_recent_events:
+        session.events = session.events[-config.num_recent_events :]
+    if config.after_timestamp:
+        session.events = [
+            event
+            for event in session.events
+            if event.timestamp >= config.after_timestamp
+        ]
+
+
+class SQLiteSessionService(BaseSessionService):
+    """Sessions kept in a SQLite file, the most recently used ones in memory.
+
+    Events are appended to the cached session right away, and written to the file
+    within `flush_interval_seconds`, or as soon as `max_pending_events` of them wait.
+    Changes to the app and user state are shared by all the sessions, so they are
+    written right away.
+
+    Call `close` before exiting, so that the pending events are written.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        db_path: Path,
+        *,
+        max_cached_sessions: int = 1_000,
+        ttl_seconds: float = 24 * 60 * 60,
+        flush_interval_seconds: float = 0.5,
+        max_pending_events: int = 256,
+        busy_timeout_seconds: float = 5.0,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """Init method.
+
+        Args:
+            db_path (Path): The SQLite file, created if missing.
+            max_cached_sessions (int): How many sessions are kept in memory, at most.
+            ttl_seconds (float): How long a session is kept after its last update.
+            flush_interval_seconds (float): How long events wait before being written.
+            max_pending_events (int): How many events may wait before being written.
+            busy_timeout_seconds (float): How long to wait on the writes of the other
+                workers.
+            clock (Callable[[], float]): The current time, in seconds since the epoch.
+        """
+        self._db_path = db_path
+        self._max_cached_sessions = max_cached_sessions
+        self._ttl_seconds = ttl_seconds
+        self._flush_interval_seconds = flush_interval_seconds
+        self._max_pending_events = max_pending_events
+        self._busy_timeout_seconds = busy_timeout_seconds
+        self._clock = clock
+        self._cache: OrderedDict[SessionKey, Session] = OrderedDict()
+        self._pending: dict[SessionKey, _PendingSession] = {}
+        self._pending_events = 0
+        self._flush_task: asyncio.Task[None] | None = None
+        # A single thread owns the connection, so statements run in submission order.
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="sessions"
+        )
+        self._connection: sqlite3.Connection | None = None
+
+    def _call(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        if self._connection is None:
+            logger.debug("Opening the sessions in {}", self._db_path)
+            self._connection = _connect(self._db_path, self._busy_timeout_seconds)
+        return fn(self._connection)
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._call, fn
+        )
+
+    def _expired_before(self) -> float:
+        return self._clock() - self._ttl_seconds
+
+    def _cache_session(self, key: SessionKey, session: Session) -> None:
+        self._cache[key] = session
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._max_cached_sessions:
+            # Sessions with pending events stay referenced until written.
+            self._cache.popitem(last=False)
+
+    @override
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: dict[str, Any] | None = None,
+        session_id: str | None = None,
+    ) -> Session:
+        session_id = (
+            session_id.strip()
+            if session_id and session_id.strip()
+            else str(uuid.uuid4())
+        )
+        key = SessionKey(app_name, user_id, session_id)
+        session = Session(
+            id=session_id,
+            app_name=app_name,
+            user_id=user_id,
+            state=state or {},
+            last_update_time=self._clock(),
+        )
+        self._cache_session(key, session)
+        self._pending[key] = _PendingSession(session, created=True)
+        self._schedule_flush()
+        shared_state = await self._run(
+            partial(_read_shared_state, app_name=app_name, user_id=user_id)
+        )
+        copied_session = copy.deepcopy(session)
+        copied_session.state.update(shared_state)
+        return copied_session
+
+    async def _stored_session(self, key: SessionKey) -> _StoredSession:
+        pending = self._pending.get(key)
+        cached = pending.session if pending else self._cache.get(key)
+        stored = await self._run(
+            partial(
+                _read_session,
+                key=key,
+                # Pending sessions are newer than anything in the file.
+                cached_update_time=float("inf")
+                if pending
+                else cached.last_update_time
+                if cached
+                else None,
+            )
+        )
+        if pending:
+            self._cache_session(key, pending.session)
+            return stored._replace(exists=True, session=pending.session)
+        if stored.session is None and stored.exists and cached is not None:
+            stored = stored._replace(session=cached)
+        if stored.session is None:
+            self._cache.pop(key, None)
+            return stored
+        self._cache_session(key, stored.session)
+        return stored
+
+    @override
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: GetSessionConfig | None = None,
+    ) -> Session | None:
+        key = SessionKey(app_name, user_id, session_id)
+        stored = await self._stored_session(key)
+        if stored.session is None:
+            return None
+        if stored.session.last_update_time < self._expired_before():
+            logger.info("Session {} expired.", session_id)
+            await self.delete_session(
+                app_name=app_name, user_id=user_id, session_id=session_id
+            )
+            return None
+        copied_session = copy.deepcopy(stored.session)
+        if config:
+            _filter_events(copied_session, config)
+        copied_session.state.update(stored.shared_state)
+        return copied_session
+
+    @override
+    async def list_sessions(
+        self, *, app_name: str, user_id: str
+    ) -> ListSessionsResponse:
+        await self.flush()
+        sessions = await self._run(
+            partial(
+                _list_sessions,
+                app_name=app_name,
+                user_id=user_id,
+                expired_before=self._expired_before(),
+            )
+        )
+        return ListSessionsResponse(sessions=sessions)
+
+    @override
+    async def delete_session(
+        self, *, app_name: str, user_id: str, session_id: str
+    ) -> None:
+        key = SessionKey(app_name, user_id, session_id)
+        self._cache.pop(key, None)
+        pending = self._pending.pop(key, None)
+        if pending:
+            self._pending_events -= len(pending.events)
+        await self._run(partial(_delete_session, key=key))
+
+    @override
+    async def append_event(self, session: Session, event: Event) -> Event:
+        await super().append_event(session=session, event=event)
+        if event.partial:
+            return event
+        session.last_update_time = event.timestamp
+        key = SessionKey(session.app_name, session.user_id, session.id)
+        pending = self._pending.get(key)
+        storage_session = pending.session if pending else self._cache.get(key)
+        if storage_session is None:
+            stored = await self._stored_session(key)
+            if stored.session is None:
+                logger.warning("Session {} not found, event not kept.", session.id)
+                return event
+            storage_session = stored.session
+
+        state_delta = event.actions.state_delta if event.actions else {}
+        app_delta = {
+            key.removeprefix(State.APP_PREFIX): value
+            for key, value in state_delta.items()
+            if key.startswith(State.APP_PREFIX)
+        }
+        user_delta = {
+            key.removeprefix(State.USER_PREFIX): value
+            for key, value in state_delta.items()
+            if key.startswith(State.USER_PREFIX)
+        }
+        if app_delta or user_delta:
+            await self._run(
+                partial(
+                    _update_shared_state,
+                    app_name=session.app_name,
+                    user_id=session.user_id,
+                    app_delta=app_delta,
+                    user_delta=user_delta,
+                )
+            )
+
+        await super().append_event(session=storage_session, event=event)
+        storage_session.last_update_time = event.timestamp
+        pending = self._pending.setdefault(
+            key, _PendingSession(storage_session, created=False)
+        )
+        pending.events.append(event)
+        self._pending_events += 1
+        if self._pending_events >= self._max_pending_events:
+            await self.flush()
+        else:
+            self._schedule_flush()
+        return event
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self._flush_interval_seconds)
+        try:
+            await self.flush()
+        except Exception:  # noqa: BLE001
+            logger.exception("Failed to write the pending sessions, will retry.")
+            self._flush_task = None
+            self._schedule_flush()
+
+    def _restore(self, pending: dict[SessionKey, _PendingSession]) -> None:
+        for key, older in pending.items():
+            newer = self._pending.get(key)
+            if newer is None:
+                self._pending[key] = older
+            else:
+                newer.events[:0] = older.events
+                newer.created = newer.created or older.created
+            self._pending_events += len(older.events)
+
+    async def flush(self) -> None:
+        """Writes the pending sessions and events, and drops the expired sessions."""
+        pending, self._pending = self._pending, {}
+        self._pending_events = 0
+        sessions = [
+            (
+                key,
+                _session_state(entry.session),
+                entry.session.last_update_time,
+                entry.created,
+            )
+            for key, entry in pending.items()
+        ]
+        events = [
+            (*key, event.model_dump_json(exclude_none=True))
+            for key, entry in pending.items()
+            for event in entry.events
+        ]
+        try:
+            await self._run(
+                partial(
+                    _write_sessions,
+                    sessions=sessions,
+                    events=events,
+                    expired_before=self._expired_before(),
+                )
+            )
+        except BaseException:
+            self._restore(pending)
+            raise
+
+    async def close(self) -> None:
+        """Writes the pending events, then closes the file."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        await self.flush()
+
+        def _close_connection() -> None:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+        self._executor.submit(_close_connection)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,154 @@
+"""Settings of the agent server.
+
+Every worker process builds its own app out of the settings, so they are passed
+through environment variables, e.g. `OFGA_AGENT_CONFIGURATION`, rather than flags.
+This also lets process managers like gunicorn start the workers directly.
+"""
+
+import os
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Self
+
+from pydantic import BaseModel, Field
+
+from src.agent.custom_types import TabularBackendKind
+
+ENV_PREFIX = "OFGA_AGENT_"
+
+
+class ServerSettings(BaseModel):
+    """Settings of the agent server."""
+
+    configuration: Path = Field(
+        description="Path where to find the serialized (in JSON) configuration.",
+    )
+    app_name: str = Field(default="test_ofga_app", description="Name of the app.")
+    agent_name: str = Field(default="test_ofga_agent", description="Name of the agent.")
+    model_version: str = Field(
+        default="gemini-2.0-flash-001", description="Gemini version to use."
+    )
+    context_token_budget: int = Field(
+        default=2_000,
+        gt=0,
+        description="Approximate number of tokens of the retrieved sections passed to "
+        "the answering agent.",
+    )
+    tabular_cache_dir: Path = Field(
+        default=Path(".cache/tabular_data"),
+        description="Directory where the on-disk copies of the tabular datasets are "
+        "kept.",
+    )
+    tabular_query_pool_size: int = Field(
+        default=4,
+        gt=0,
+        description="How many queries on each tabular dataset may run at once.",
+    )
+    hr_data_backend: TabularBackendKind = Field(
+        default=TabularBackendKind.SQLITE, description="Backend serving the HR dataset."
+    )
+    financial_data_backend: TabularBackendKind = Field(
+        default=TabularBackendKind.SQLITE,
+        description="Backend serving the financial dataset.",
+    )
+    max_concurrent_messages: int = Field(
+        default=8,
+        gt=0,
+        description="How many messages of a batch are answered at once.",
+    )
+    max_batch_messages: int = Field(
+        default=32,
+        gt=0,
+        description="How many messages a batch holds, at most.",
+    )
+    session_db_path: Path = Field(
+        default=Path(".cache/sessions/sessions.sqlite3"),
+        description="SQLite file where the sessions are kept. Shared by the workers.",
+    )
+    session_ttl_seconds: float = Field(
+        default=24 * 60 * 60,
+        gt=0,
+        description="How long a session is kept after its last update.",
+    )
+    max_cached_sessions: int = Field(
+        default=1_000,
+        gt=0,
+        description="How many recently used sessions each worker keeps in memory.",
+    )
+    artifact_max_resident_bytes: int = Field(
+        default=64 * 1024 * 1024,
+        gt=0,
+        description="How many bytes of artifacts each worker keeps in memory.",
+    )
+    artifact_max_versions: int = Field(
+        default=4,
+        gt=0,
+        description="How many versions of an artifact are kept.",
+    )
+    artifact_ttl_seconds: float = Field(
+        default=60 * 60,
+        gt=0,
+        description="How long an artifact is kept after its last save.",
+    )
+    artifact_spill_dir: Path | None = Field(
+        default=None,
+        description="Directory where the artifacts evicted from memory are written. "
+        "They are dropped when not provided.",
+    )
+    max_in_flight_messages: int = Field(
+        default=32,
+        gt=0,
+        description="How many messages each worker answers at once. The others wait.",
+    )
+    max_queued_messages: int = Field(
+        default=64,
+        ge=0,
+        description="How many messages may wait, before the next ones are rejected.",
+    )
+    max_queued_messages_per_user: int = Field(
+        default=8,
+        ge=0,
+        description="How many messages of a user may wait, before the next ones are "
+        "rejected.",
+    )
+    queue_timeout_seconds: float = Field(
+        default=10.0,
+        gt=0,
+        description="How long a message may wait before being rejected.",
+    )
+    host: str = Field(default="0.0.0.0", description="Address to listen on.")  # noqa: S104
+    port: int = Field(default=8000, description="Port to listen on.")
+    workers: int = Field(
+        default=1,
+        gt=0,
+        description="How many worker processes serve the requests. Each of them has "
+        "its own OpenFGA clients and caches.",
+    )
+
+    @classmethod
+    def from_env(
+        cls,
+        environ: Mapping[str, str] = os.environ,
+        **overrides: Any,  # noqa: ANN401
+    ) -> Self:
+        """Reads the settings out of the environment, using defaults for the others.
+
+        Args:
+            environ (Mapping[str, str]): The environment variables.
+            **overrides (Any): Values taking precedence over the environment.
+        """
+        return cls.model_validate({
+            **{
+                name: environ[f"{ENV_PREFIX}{name.upper()}"]
+                for name in cls.model_fields
+                if f"{ENV_PREFIX}{name.upper()}" in environ
+            },
+            **overrides,
+        })
+
+    def to_env(self) -> dict[str, str]:
+        """The environment variables `from_env` reads these settings back from."""
+        return {
+            f"{ENV_PREFIX}{name.upper()}": str(value)
+            for name, value in self.model_dump(exclude_none=True).items()
+        }
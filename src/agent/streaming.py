@@ -0,0 +1,96 @@
+"""Server-Sent Events out of the events of a run of the agent."""
+
+import json
+from collections.abc import AsyncGenerator, AsyncIterator
+from enum import StrEnum
+from typing import Any
+
+from google.adk.events import Event
+from loguru import logger
+
+NO_FINAL_RESPONSE = "No final response captured."
+
+
+class ServerSentEventKind(StrEnum):
+    """The kinds of events streamed to the client.
+
+    *PROGRESS* carries the metadata sub agents attach to their events, e.g. that the
+        files were filtered.
+    *TOKEN* carries a chunk of text of a response being generated.
+    *MESSAGE* carries a complete response, e.g. rows read by a tabular agent.
+    *ANSWER* carries the final answer, and is the last event of a successful run.
+    *ERROR* is the last event of a failed run.
+    """
+
+    PROGRESS = "progress"
+    TOKEN = "token"  # noqa: S105
+    MESSAGE = "message"
+    ANSWER = "answer"
+    ERROR = "error"
+
+
+def format_server_sent_event(kind: ServerSentEventKind, data: dict[str, Any]) -> str:
+    """Serializes an event in the `text/event-stream` format."""
+    return f"event: {kind}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _text(event: Event) -> str:
+    if not event.content or not event.content.parts:
+        return ""
+    return "".join(part.text or "" for part in event.content.parts)
+
+
+def _format_event(event: Event) -> list[str]:
+    server_sent_events = []
+    if event.custom_metadata:
+        server_sent_events.append(
+            format_server_sent_event(
+                ServerSentEventKind.PROGRESS,
+                {"author": event.author, "metadata": event.custom_metadata},
+            )
+        )
+    text = _text(event)
+    if text:
+        kind = (
+            ServerSentEventKind.TOKEN if event.partial else ServerSentEventKind.MESSAGE
+        )
+        server_sent_events.append(
+            format_server_sent_event(kind, {"author": event.author, "text": text})
+        )
+    return server_sent_events
+
+
+async def _stream(
+    events: AsyncIterator[Event], final_responses: list[str]
+) -> AsyncGenerator[str, None]:
+    async for event in events:
+        for server_sent_event in _format_event(event):
+            yield server_sent_event
+        text = _text(event)
+        if text and not event.partial and event.is_final_response():
+            final_responses.append(text)
+
+
+async def server_sent_events(
+    events: AsyncIterator[Event],
+) -> AsyncGenerator[str, None]:
+    """Streams the events of a run as they happen, then its final answer.
+
+    The final answer is the text of the last final response, like the one returned by
+    the `/message` endpoint.
+    """
+    final_responses: list[str] = []
+    try:
+        async for server_sent_event in _stream(events, final_responses):
+            yield server_sent_event
+    except Exception:  # noqa: BLE001
+        logger.exception("The run failed while streaming its events.")
+        yield format_server_sent_event(
+            ServerSentEventKind.ERROR, {"error": "The request failed."}
+        )
+        return
+    final_response = final_responses[-1] if final_responses else NO_FINAL_RESPONSE
+    logger.info("Final response {}", final_response)
+    yield format_server_sent_event(
+        ServerSentEventKind.ANSWER, {"answer": final_response}
+    )
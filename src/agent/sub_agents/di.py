@@ -1,26 +1,75 @@
 """DI module for the sub-agents."""
 
-import sqlite3
 from pathlib import Path
 from textwrap import dedent
 
-import pandas as pd
 from injector import Module, provider, singleton
 from loguru import logger
 from openfga_sdk import OpenFgaClient
 
 from src.agent.custom_types import (
-    DocumentListArtifactKey,
-    FinancialDataConnection,
-    HRDataConnection,
-    RetrieveContextKey,
-    RowListArtifactKey,
+    ContextTokenBudget,
+    FinancialDataBackend,
+    FinancialDataBackendKind,
+    GeminiModel,
+    HRDataBackend,
+    HRDataBackendKind,
+    TabularBackendKind,
+    TabularCacheDir,
+    TabularQueryPoolSize,
+    TabularResultMode,
+    TabularResultOptions,
 )
 from src.agent.sub_agents.document_agents import FilterDocumentAgent
+from src.agent.sub_agents.handoff import DocumentHandoff
 from src.agent.sub_agents.tabular_agent import (
     FilterTabularAgentDefaultDeny,
     FilterTabulerAgentDefaultAllow,
+    TabularResultCache,
 )
+from src.document_data.bm25 import BM25Retriever
+from src.document_data.corpus import PackedCorpus
+from src.document_data.sections import SECTION_SEPARATOR
+from src.ofga_operations.filter_strategy import FilterStrategySelector
+from src.ofga_operations.section_overrides import SectionOverrideIndex
+from src.ofga_operations.watcher import ChangeWatcher
+from src.tabular_data.backends import (
+    ColumnarBackend,
+    NumPyBackend,
+    SQLiteBackend,
+    TabularBackend,
+    create_acl_table,
+)
+from src.tabular_data.columnar import ColumnarDataset, ensure_columnar_dataset
+from src.tabular_data.query_runner import SQLiteQueryRunner
+from src.tabular_data.sqlite_cache import ensure_sqlite_dataset
+
+
+def _open_dataset(
+    path: Path,
+    kind: TabularBackendKind,
+    cache_dir: TabularCacheDir,
+    pool_size: TabularQueryPoolSize,
+) -> TabularBackend:
+    if not path.exists():
+        logger.error("Path {} does not exists.", str(path.absolute()))
+        raise RuntimeError()
+    logger.info("Serving {} with the {} backend.", path, kind)
+    match kind:
+        case TabularBackendKind.NUMPY:
+            return NumPyBackend.from_csv(path)
+        case TabularBackendKind.COLUMNAR:
+            return ColumnarBackend(
+                ColumnarDataset(ensure_columnar_dataset(path, cache_dir))
+            )
+        case TabularBackendKind.SQLITE:
+            return SQLiteBackend(
+                SQLiteQueryRunner(
+                    ensure_sqlite_dataset(path, cache_dir),
+                    pool_size=pool_size,
+                    initializer=create_acl_table,
+                )
+            )
 
 
 class SubAgentModule(Module):
@@ -30,57 +79,111 @@ class SubAgentModule(Module):
     @singleton
     def _provide_filter_agent(  # noqa: PLR6301
         self,
-        clients: dict[str, OpenFgaClient],
-        documents_artifact_key: DocumentListArtifactKey,
-        rows_artifact_key: RowListArtifactKey,
-        retrieved_context_key: RetrieveContextKey,
+        filter_strategy: FilterStrategySelector,
+        section_overrides: SectionOverrideIndex,
+        handoff: DocumentHandoff,
+        corpus: PackedCorpus,
+        token_budget: ContextTokenBudget,
     ) -> FilterDocumentAgent:
+        return FilterDocumentAgent(
+            filter_strategy=filter_strategy,
+            section_overrides=section_overrides,
+            handoff=handoff,
+            corpus=corpus,
+            token_budget=token_budget,
+        )
+
+    @provider
+    @singleton
+    def _provide_document_handoff(self) -> DocumentHandoff:  # noqa: PLR6301
+        return DocumentHandoff()
+
+    @provider
+    @singleton
+    def _provide_document_filter_strategy(  # noqa: PLR6301
+        self, clients: dict[str, OpenFgaClient], watcher: ChangeWatcher
+    ) -> FilterStrategySelector:
         # WARN: This shouldn't be hardcoded.
         logger.info("Client keys: {}", list(clients.keys()))
-        client = clients["store_for_documents_configuration"]
-        return FilterDocumentAgent(
-            openfga_client=client,
-            documents_artifact_key=documents_artifact_key,
-            rows_artifact_key=rows_artifact_key,
-            retrieved_context_key=retrieved_context_key,
+        filter_strategy = FilterStrategySelector(
+            clients["store_for_documents_configuration"]
         )
+        watcher.register(filter_strategy)
+        return filter_strategy
 
     @provider
     @singleton
-    def _provide_hr_data(self) -> HRDataConnection:  # noqa: PLR6301
-        path = Path("data/tabular_data/hr_data.csv")
-        if not path.exists():
-            logger.error("Path {} does not exists.", str(path.absolute()))
-            raise RuntimeError()
+    def _provide_document_section_overrides(  # noqa: PLR6301
+        self, clients: dict[str, OpenFgaClient], watcher: ChangeWatcher
+    ) -> SectionOverrideIndex:
+        section_overrides = SectionOverrideIndex(
+            clients["store_for_documents_configuration"], separator=SECTION_SEPARATOR
+        )
+        watcher.register(section_overrides)
+        return section_overrides
 
-        df = pd.read_csv(str(path.absolute()))  # noqa: PD901
-        # In memory connection for example.
-        connection = sqlite3.connect(":memory:")
+    @provider
+    @singleton
+    def _provide_document_corpus(self) -> PackedCorpus:  # noqa: PLR6301
+        return PackedCorpus(
+            directory=Path("data/documents"),
+            packed_path=Path(".cache/document_data/documents.packed"),
+        )
 
-        df.to_sql(name="data", con=connection, if_exists="replace", index=False)
-        return HRDataConnection(connection)
+    @provider
+    @singleton
+    def _provide_document_retriever(  # noqa: PLR6301
+        self, corpus: PackedCorpus
+    ) -> BM25Retriever:
+        return BM25Retriever(
+            corpus=corpus, index_path=Path(".cache/document_data/bm25_index.json")
+        )
 
     @provider
     @singleton
-    def _provide_financial_data(self) -> FinancialDataConnection:  # noqa: PLR6301
-        path = Path("data/tabular_data/financial_data.csv")
-        if not path.exists():
-            logger.error("Path {} does not exists.", str(path.absolute()))
-            raise RuntimeError()
+    def _provide_hr_data(  # noqa: PLR6301
+        self,
+        kind: HRDataBackendKind,
+        cache_dir: TabularCacheDir,
+        pool_size: TabularQueryPoolSize,
+    ) -> HRDataBackend:
+        return HRDataBackend(
+            _open_dataset(
+                Path("data/tabular_data/hr_data.csv"), kind, cache_dir, pool_size
+            )
+        )
 
-        df = pd.read_csv(str(path.absolute()))  # noqa: PD901
-        # In memory connection for example.
-        connection = sqlite3.connect(":memory:")
+    @provider
+    @singleton
+    def _provide_financial_data(  # noqa: PLR6301
+        self,
+        kind: FinancialDataBackendKind,
+        cache_dir: TabularCacheDir,
+        pool_size: TabularQueryPoolSize,
+    ) -> FinancialDataBackend:
+        return FinancialDataBackend(
+            _open_dataset(
+                Path("data/tabular_data/financial_data.csv"), kind, cache_dir, pool_size
+            )
+        )
 
-        df.to_sql(name="data", con=connection, if_exists="replace", index=False)
-        return FinancialDataConnection(connection)
+    @provider
+    @singleton
+    def _provide_tabular_result_cache(  # noqa: PLR6301
+        self, watcher: ChangeWatcher
+    ) -> TabularResultCache:
+        cache = TabularResultCache(max_bytes=64 * 1024 * 1024, ttl_seconds=300)
+        watcher.register(cache)
+        return cache
 
     @provider
     @singleton
     def _provide_agent_for_financial_data(  # noqa: PLR6301
         self,
-        db_conn: FinancialDataConnection,
+        backend: FinancialDataBackend,
         clients: dict[str, OpenFgaClient],
+        model: GeminiModel,
+        result_cache: TabularResultCache,
     ) -> FilterTabulerAgentDefaultAllow:
         # WARN: This shouldn't be hardcoded.
         client = clients["store_for_tables_with_default_allow"]
@@ -88,15 +191,24 @@ class SubAgentModule(Module):
         You have access to the financial data of our company.
         """)
         return FilterTabulerAgentDefaultAllow(
-            connection=db_conn, ofga_client=client, description=description
+            backend=backend,
+            ofga_client=client,
+            description=description,
+            result_options=TabularResultOptions(
+                mode=TabularResultMode.CHUNKED, max_rows=1_000
+            ),
+            query_planner_model=model,
+            result_cache=result_cache,
         )
 
     @provider
     @singleton
     def _provide_agent_for_hr_data(  # noqa: PLR6301
         self,
-        db_conn: HRDataConnection,
+        backend: HRDataBackend,
         clients: dict[str, OpenFgaClient],
+        model: GeminiModel,
+        result_cache: TabularResultCache,
     ) -> FilterTabularAgentDefaultDeny:
         # WARN: This shouldn't be hardcoded.
         client = clients["store_for_tables_with_default_deny"]
@@ -105,5 +217,14 @@ class SubAgentModule(Module):
         performance cycle.
         """)
         return FilterTabularAgentDefaultDeny(
-            connection=db_conn, ofga_client=client, description=description
+            backend=backend,
+            ofga_client=client,
+            description=description,
+            result_options=TabularResultOptions(
+                mode=TabularResultMode.CHUNKED,
+                columns=["id", "rating", "full name"],
+                max_rows=1_000,
+            ),
+            query_planner_model=model,
+            result_cache=result_cache,
         )
@@ -1,8 +1,8 @@
 """Sub agents that work with documents."""
 
+import asyncio
 import json
 from collections.abc import AsyncGenerator
-from pathlib import Path
 from textwrap import dedent
 
 from google.adk.agents import BaseAgent
@@ -11,59 +11,59 @@ from google.adk.events import Event
 from google.genai import types
 from injector import inject
 from loguru import logger
-from openfga_sdk import OpenFgaClient
 from pydantic import ConfigDict
 
 from src.agent.custom_types import (
-    DocumentListArtifactKey,
+    ContextTokenBudget,
+    RetrievalTopK,
     RetrieveContextKey,
-    RowListArtifactKey,
 )
-from src.ofga_operations.checks import can_user_read
+from src.agent.sub_agents.handoff import DocumentHandoff
+from src.document_data.bm25 import BM25Retriever
+from src.document_data.corpus import PackedCorpus
+from src.document_data.sections import fit_token_budget
+from src.ofga_operations.filter_strategy import FilterStrategySelector
+from src.ofga_operations.section_overrides import SectionOverrideIndex
 
 
 class RetrievalDocumentsAgent(BaseAgent):
-    """Agent that mimicks the retrieval."""
+    """Agent that retrieves the sections of documents most relevant to the question."""
 
     model_config = ConfigDict(extra="allow")
 
     @inject
     def __init__(
         self,
-        documents_artifact_key: DocumentListArtifactKey,
-        rows_artifact_key: RowListArtifactKey,
+        handoff: DocumentHandoff,
+        retriever: BM25Retriever,
+        top_k: RetrievalTopK,
     ) -> None:
         """Init method."""
         super().__init__(
             name="retrieval_agent",
         )
-        self._documents_artifact_key: DocumentListArtifactKey = documents_artifact_key
-        self._rows_artifact_key: RowListArtifactKey = rows_artifact_key
+        self._handoff: DocumentHandoff = handoff
+        self._retriever: BM25Retriever = retriever
+        self._top_k: RetrievalTopK = top_k
+
+    @staticmethod
+    def _question(ctx: InvocationContext) -> str:
+        user_content = ctx.user_content
+        if user_content and user_content.parts:
+            question = "".join(part.text or "" for part in user_content.parts)
+            if question:
+                return question
+        return str(ctx.session.state.get("last_question", ""))
 
     async def _run_async_impl(
         self, ctx: InvocationContext
     ) -> AsyncGenerator[Event, None]:
-        if not ctx.artifact_service:
-            raise RuntimeError()
-
-        # Files are under the "data" folder. This is just for demo purposes.
-        path = Path("data")
-        document_path = path / "documents"
-
-        paths = [doc.absolute() for doc in document_path.glob("*.txt")]
-        path_2_contents = {}
-        for p in paths:
-            with p.open("r") as f:
-                content = f.read()
-                logger.debug("Retrieving {}. Length {}", p, len(content))
-                path_2_contents[str(p.absolute())] = content
-
-        await ctx.artifact_service.save_artifact(
-            app_name=ctx.app_name,
-            session_id=ctx.session.id,
-            user_id=ctx.session.user_id,
-            filename=self._documents_artifact_key,
-            artifact=types.Part(text=json.dumps(path_2_contents)),
+        # Only the files that changed since the last message are read.
+        await asyncio.to_thread(self._retriever.refresh)
+        matches = self._retriever.search(self._question(ctx), top_k=self._top_k)
+        logger.debug("Retrieved sections {}", matches)
+        self._handoff.send_sections(
+            ctx.invocation_id, [match.section for match in matches]
         )
 
         yield Event(
@@ -73,65 +73,85 @@ class RetrievalDocumentsAgent(BaseAgent):
 
 
 class FilterDocumentAgent(BaseAgent):
-    """Agent that filters the files using ofga api calls."""
+    """Agent that filters the retrieved sections using ofga api calls.
+
+    Sections are checked under the id of their document, unless they have tuples of
+    their own. The ids are filtered with checks or ListObjects, whichever the selector
+    expects to be cheaper. The best permitted sections are then kept, as long as they
+    fit in the token budget of the context.
+    """
 
     model_config = ConfigDict(extra="allow")
 
     @inject
     def __init__(
         self,
-        openfga_client: OpenFgaClient,
-        documents_artifact_key: DocumentListArtifactKey,
-        rows_artifact_key: RowListArtifactKey,
-        retrieved_context_key: RetrieveContextKey,
+        filter_strategy: FilterStrategySelector,
+        section_overrides: SectionOverrideIndex,
+        handoff: DocumentHandoff,
+        corpus: PackedCorpus,
+        token_budget: ContextTokenBudget,
     ) -> None:
         """Init method."""
         super().__init__(
             name="filter_agent",
         )
+        self._corpus: PackedCorpus = corpus
+        self._token_budget: ContextTokenBudget = token_budget
 
-        self._ofga_client: OpenFgaClient = openfga_client
-        self._documents_artifact_key: DocumentListArtifactKey = documents_artifact_key
-        self._rows_artifact_key: RowListArtifactKey = rows_artifact_key
-        self._retrieved_context_key: RetrieveContextKey = retrieved_context_key
+        self._filter_strategy: FilterStrategySelector = filter_strategy
+        self._section_overrides: SectionOverrideIndex = section_overrides
+        self._handoff: DocumentHandoff = handoff
 
     async def _run_async_impl(
         self, ctx: InvocationContext
     ) -> AsyncGenerator[Event, None]:
-        artifact_service = ctx.artifact_service
-        if not artifact_service:
-            raise RuntimeError()
-
         user_id = ctx.session.user_id
         logger.info("User id: {}", user_id)
-        content = await artifact_service.load_artifact(
-            app_name=ctx.app_name,
-            session_id=ctx.session.id,
-            user_id=user_id,
-            filename=self._documents_artifact_key,
+        sections = self._handoff.receive_sections(ctx.invocation_id)
+        section_2_object = await self._section_overrides.objects_to_check(
+            section.object_id for section in sections
         )
-        if not content or not content.text:
-            raise RuntimeError()
-
-        path_2_content: dict[str, str] = json.loads(content.text)
-        filtered_path_2_content = {}
-        for file_path_str, file_content in path_2_content.items():
-            file_path = Path(file_path_str)
-            file_name = file_path.name
-            logger.info("Checking if user {} can read file {}", user_id, file_name)
-            if await can_user_read(
-                client=self._ofga_client, user_id=user_id, document_id=file_name
-            ):
-                logger.info("He/she can read file {}", file_name)
-                filtered_path_2_content[str(file_path.absolute())] = file_content
-        logger.info(filtered_path_2_content)
-        await artifact_service.save_artifact(
-            app_name=ctx.app_name,
-            session_id=ctx.session.id,
-            user_id=ctx.session.user_id,
-            filename=self._retrieved_context_key,
-            artifact=types.Part(text=json.dumps(filtered_path_2_content)),
+        logger.info(
+            "Checking which of the {} sections user {} can read", len(sections), user_id
+        )
+        object_2_allowed = await self._filter_strategy.filter(
+            user_id=user_id, object_ids=section_2_object.values()
+        )
+        # Only the contents of the allowed sections are read out of the corpus.
+        allowed_sections = []
+        texts = []
+        for section in sections:
+            if not object_2_allowed[section_2_object[section.object_id]]:
+                continue
+            text = self._corpus.text(section.doc_id, section.start, section.end)
+            if text is None:
+                continue
+            logger.info("He/she can read section {}", section.object_id)
+            allowed_sections.append(section)
+            texts.append(text)
+        kept = fit_token_budget(texts, self._token_budget)
+        logger.info(
+            "Keeping {} of {} sections within {} tokens.",
+            len(kept),
+            len(allowed_sections),
+            self._token_budget,
         )
+        # Sections of the same document are joined, in the order of the document.
+        path_2_sections: dict[str, list[tuple[int, str]]] = {}
+        for position in kept:
+            section = allowed_sections[position]
+            file_path = self._corpus.directory / section.name
+            path_2_sections.setdefault(str(file_path.absolute()), []).append((
+                section.number,
+                texts[position],
+            ))
+        filtered_path_2_content = {
+            path: "\n...\n".join(text for _, text in sorted(numbered_texts))
+            for path, numbered_texts in path_2_sections.items()
+        }
+        logger.info(filtered_path_2_content)
+        self._handoff.send_context(ctx.invocation_id, filtered_path_2_content)
 
         yield Event(
             author=self.name,
@@ -140,7 +160,11 @@ class FilterDocumentAgent(BaseAgent):
 
 
 class DocumentHandlerAgent(BaseAgent):
-    """Agent that does RAG."""
+    """Agent that does RAG.
+
+    The retrieval and filter agents hand the documents over in memory. Only the final
+    context is serialized, into the artifact the answering agent reads.
+    """
 
     description: str = dedent("""
     Retrieves to-do items from the available documents.
@@ -153,6 +177,7 @@ class DocumentHandlerAgent(BaseAgent):
         _retriever_agent: RetrievalDocumentsAgent,
         _filter_agent: FilterDocumentAgent,
         _retrieved_context_key: RetrieveContextKey,
+        _handoff: DocumentHandoff,
     ) -> None:
         """Init."""
         super().__init__(
@@ -161,9 +186,19 @@ class DocumentHandlerAgent(BaseAgent):
         self._filter_agent: FilterDocumentAgent = _filter_agent
         self._retriever_agent: RetrievalDocumentsAgent = _retriever_agent
         self._retrieved_context_key: RetrieveContextKey = _retrieved_context_key
+        self._handoff: DocumentHandoff = _handoff
 
     async def _run_async_impl(
         self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        try:
+            async for event in self._run_sub_agents(ctx):
+                yield event
+        finally:
+            self._handoff.release(ctx.invocation_id)
+
+    async def _run_sub_agents(
+        self, ctx: InvocationContext
     ) -> AsyncGenerator[Event, None]:
         logger.debug("Inside agent body.")
         logger.info("User id: {}, {}", ctx.session.user_id, ctx.user_id)
@@ -191,13 +226,16 @@ class DocumentHandlerAgent(BaseAgent):
             ):
                 if ctx.artifact_service is None:
                     raise RuntimeError()
-                content = await ctx.artifact_service.load_artifact(
+                content = types.Part(
+                    text=json.dumps(self._handoff.receive_context(ctx.invocation_id))
+                )
+                # The answering agent reads the context out of the artifact.
+                await ctx.artifact_service.save_artifact(
                     app_name=ctx.app_name,
                     user_id=ctx.user_id,
                     session_id=ctx.session.id,
                     filename=self._retrieved_context_key,
+                    artifact=content,
                 )
-                if content is None:
-                    content = types.Part(text="Couldn't retrieve the data")
 
                 yield Event(author=self.name, content=types.Content(parts=[content]))
@@ -0,0 +1,60 @@
+"""In-memory handoff of the documents between the document agents."""
+
+from src.document_data.sections import Section
+
+
+class DocumentHandoff:
+    """Request scoped channel between the retrieval, filter and RAG agents.
+
+    The agents of an invocation share its id, which keys what they hand over. Values
+    are passed as they are, without being serialized into artifacts, and are dropped
+    when the invocation releases them.
+    """
+
+    def __init__(self) -> None:
+        """Init method."""
+        self._sections: dict[str, list[Section]] = {}
+        self._contexts: dict[str, dict[str, str]] = {}
+
+    def send_sections(self, invocation_id: str, sections: list[Section]) -> None:
+        """Hands over the retrieved sections, best first."""
+        self._sections[invocation_id] = sections
+
+    def receive_sections(self, invocation_id: str) -> list[Section]:
+        """The sections retrieved by the invocation.
+
+        Raises:
+            RuntimeError: If no sections were sent.
+        """
+        try:
+            return self._sections[invocation_id]
+        except KeyError:
+            raise RuntimeError(  # noqa: TRY003
+                f"No sections were retrieved by invocation {invocation_id}."
+            ) from None
+
+    def send_context(self, invocation_id: str, context: dict[str, str]) -> None:
+        """Hands over the permitted content, by path of the document."""
+        self._contexts[invocation_id] = context
+
+    def receive_context(self, invocation_id: str) -> dict[str, str]:
+        """The permitted content of the invocation.
+
+        Raises:
+            RuntimeError: If no context was sent.
+        """
+        try:
+            return self._contexts[invocation_id]
+        except KeyError:
+            raise RuntimeError(  # noqa: TRY003
+                f"No context was filtered by invocation {invocation_id}."
+            ) from None
+
+    def release(self, invocation_id: str) -> None:
+        """Drops whatever the invocation handed over."""
+        self._sections.pop(invocation_id, None)
+        self._contexts.pop(invocation_id, None)
+
+    def __len__(self) -> int:
+        """The number of invocations holding values."""
+        return len(self._sections.keys() | self._contexts.keys())
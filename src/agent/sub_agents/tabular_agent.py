@@ -1,21 +1,148 @@
 """Agents for tabular data."""
 
 import json
-from collections.abc import AsyncGenerator
-from sqlite3 import Connection, Cursor
+import time
+from collections import OrderedDict
+from collections.abc import AsyncGenerator, Callable
+from contextlib import aclosing
 from textwrap import dedent
+from typing import NamedTuple
 
-from google.adk.agents import BaseAgent
+from google.adk.agents import BaseAgent, LlmAgent
 from google.adk.events import Event
 from google.adk.runners import InvocationContext
 from google.genai import types
 from loguru import logger
 from openfga_sdk import OpenFgaClient
-from pydantic import ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 
-from src.agent.custom_types import FinancialDataConnection, HRDataConnection
-from src.ofga_operations.objects import list_objects_for_user
+from src.agent.custom_types import (
+    FinancialDataBackend,
+    HRDataBackend,
+    TabularResultMode,
+    TabularResultOptions,
+)
+from src.ofga_operations.objects import stream_object_chunks_for_user
+from src.ofga_operations.watcher import StoreChanges
 from src.project_types import ACLType
+from src.tabular_data.aggregates import AggregateQuery
+from src.tabular_data.backends import Row, TabularBackend
+
+
+class TabularResultCacheKey(NamedTuple):
+    """Identifies the result of a tabular agent for a user."""
+
+    agent_name: str
+    store_id: str | None
+    authorization_model_id: str | None
+    user_id: str
+    dataset_version: str
+    question: str
+
+
+class TabularResultCacheStats(BaseModel):
+    """Counters describing how the cache is performing."""
+
+    hits: int = Field(description="Results served by the cache.")
+    misses: int = Field(description="Results that had to be computed.")
+    evictions: int = Field(description="Results dropped to respect the size bound.")
+    size: int = Field(description="Results currently held by the cache.")
+    size_bytes: int = Field(description="Bytes currently held by the cache.")
+
+
+class TabularResultCache:
+    """Bounded LRU cache of the results of the tabular agents.
+
+    A result is kept as the texts of the events the agent emitted. Entries are keyed
+    on the authorization model and the version of the dataset, so they are never
+    reused across them, and are dropped when the watcher reports changes to the
+    tuples of their user. Entries also expire, for when the watcher is disabled.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Init method.
+
+        Args:
+            max_bytes (int): Maximum size of the cached texts, in bytes. The least
+                recently used results are evicted first.
+            ttl_seconds (float): For how long a result is valid.
+            clock (Callable[[], float]): Source of the current time, in seconds.
+        """
+        if max_bytes <= 0:
+            raise ValueError("max_bytes must be positive.")  # noqa: TRY003
+        self._max_bytes = max_bytes
+        self._ttl_seconds = ttl_seconds
+        self._clock = clock
+        # Maps each key to the texts, their size and the time at which they expire.
+        self._entries: OrderedDict[
+            TabularResultCacheKey, tuple[list[str], int, float]
+        ] = OrderedDict()
+        self._size_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _drop(self, key: TabularResultCacheKey) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._size_bytes -= size
+
+    def get(self, key: TabularResultCacheKey) -> list[str] | None:
+        """Returns the cached result, or None if it is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return None
+        payloads, _, expires_at = entry
+        if expires_at <= self._clock():
+            self._drop(key)
+            self._misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return list(payloads)
+
+    def put(self, key: TabularResultCacheKey, payloads: list[str]) -> None:
+        """Stores a result, unless it is larger than the whole cache."""
+        size = sum(len(payload.encode()) for payload in payloads)
+        if key in self._entries:
+            self._drop(key)
+        if self._ttl_seconds <= 0 or size > self._max_bytes:
+            return
+        self._entries[key] = (list(payloads), size, self._clock() + self._ttl_seconds)
+        self._size_bytes += size
+        while self._size_bytes > self._max_bytes:
+            self._drop(next(iter(self._entries)))
+            self._evictions += 1
+
+    def on_store_changes(self, store_changes: StoreChanges) -> None:
+        """Drops the results of the users whose tuples changed.
+
+        Changes to an object alone don't matter, as the ListObjects results only
+        change for the users of the tuples. Changes to groups or wildcards may
+        affect anyone, and drop every result of the store.
+        """
+        stale_keys = [
+            key
+            for key in self._entries
+            if store_changes.affects_user(key.store_id, key.user_id)
+        ]
+        for key in stale_keys:
+            self._drop(key)
+
+    def stats(self) -> TabularResultCacheStats:
+        """Returns the current counters."""
+        return TabularResultCacheStats(
+            hits=self._hits,
+            misses=self._misses,
+            evictions=self._evictions,
+            size=len(self._entries),
+            size_bytes=self._size_bytes,
+        )
 
 
 class _FilteringTabularAgentLike(BaseAgent):
@@ -26,23 +153,34 @@ class _FilteringTabularAgentLike(BaseAgent):
     def __init__(  # noqa: PLR0913, PLR0917
         self,
         acl_type: ACLType,
-        sqlite_conn: Connection,
+        backend: TabularBackend,
         ofga_client: OpenFgaClient,
         relationships_name: str,
         name: str,
         description: str,
+        result_options: TabularResultOptions | None = None,
+        query_planner_model: str | None = None,
+        result_cache: TabularResultCache | None = None,
     ) -> None:
         """Init method.
 
         Args:
             acl_type (ACLType): The type of ACL this tabular agent will use when
                                 building the query.
-            sqlite_conn (Connection): The connection with the data.
+            backend (TabularBackend): The backend holding the data.
             ofga_client (OpenFgaClient): The openfga client that will be used to perform
                 the ListObject api requests.
             relationships_name(str): The name of the relationships in ofga.
             name(str): The name of the agent.
             description(str): The purpose of this agent.
+            result_options(TabularResultOptions | None): Projection, row cap and
+                chunking of the returned rows. Defaults to every row and column in a
+                single event.
+            query_planner_model(str | None): The model turning the question into an
+                `AggregateQuery`. When provided, questions that can be answered with
+                aggregates get their result instead of the rows.
+            result_cache(TabularResultCache | None): Where to keep the results, so
+                that repeated questions skip OpenFGA and the backend.
         """
         super().__init__(
             name=name,
@@ -50,28 +188,172 @@ class _FilteringTabularAgentLike(BaseAgent):
         )
 
         self._acl_type: ACLType = acl_type
-        self._sqlite_connection: Connection = sqlite_conn
+        self._backend: TabularBackend = backend
         self._ofga_client: OpenFgaClient = ofga_client
         self._relationships_name: str = relationships_name
+        self._result_options: TabularResultOptions = (
+            result_options or TabularResultOptions()
+        )
+        self._columns: list[str] = self._validated_columns()
+        self._result_cache: TabularResultCache | None = result_cache
+        self._query_planner: LlmAgent | None = (
+            None
+            if query_planner_model is None
+            else self._build_query_planner(query_planner_model)
+        )
+
+    def _validated_columns(self) -> list[str]:
+        """The columns returned by the agent, checked against the dataset."""
+        available_columns = self._backend.column_names()
+        columns = self._result_options.columns
+        if columns is None:
+            return available_columns
+        unknown_columns = [c for c in columns if c not in available_columns]
+        if unknown_columns:
+            raise ValueError(  # noqa: TRY003
+                f"Unknown columns for agent {self.name}: {unknown_columns}. "
+                f"Available columns: {sorted(available_columns)}"
+            )
+        return list(columns)
+
+    def _build_query_planner(self, model: str) -> LlmAgent:
+        return LlmAgent(
+            name=f"{self.name}QueryPlanner",
+            model=model,
+            description="Turns questions on a table into aggregate queries.",
+            instruction=dedent(f"""
+            You translate the last question of the user into a query on a table with
+            the columns {json.dumps(self._columns)}.
+
+            Use aggregates (COUNT, SUM, AVG, MIN, MAX), grouping, filters on the
+            columns, sorting and limits when the question can be answered from them,
+            e.g. totals, averages, counts or rankings. An aggregate is referred to in
+            the sorting by its label, e.g. sum(column).
 
-    async def _build_query(self, user_id: str) -> str:
+            When the question needs the rows themselves, return no aggregate.
+            """),
+            output_schema=AggregateQuery,
+            disallow_transfer_to_parent=True,
+            disallow_transfer_to_peers=True,
+        )
+
+    async def _plan_query(self, ctx: InvocationContext) -> AggregateQuery | None:
+        """Asks the planner for a query, if the question can be answered by one."""
+        if self._query_planner is None:
+            return None
+        answer = None
+        async for event in self._query_planner.run_async(ctx):
+            if event.is_final_response() and event.content and event.content.parts:
+                answer = "".join(part.text or "" for part in event.content.parts)
+        if not answer:
+            return None
+        try:
+            query = AggregateQuery.model_validate_json(answer)
+            if not query.aggregates:
+                return None
+            query.validate_columns(self._columns)
+        except ValueError as e:
+            logger.warning("{} ignores the planned query {}: {}", self.name, answer, e)
+            return None
+        return query
+
+    async def _acl_ids(self, user_id: str) -> AsyncGenerator[list[str], None]:
+        """Streams the ids returned by ListObjects, in chunks."""
         object_type = "item"
-        objects = await list_objects_for_user(
+        loaded_ids = 0
+        async for chunk in stream_object_chunks_for_user(
             user_id=user_id,
             relation=self._relationships_name,
             object_type=object_type,
             client=self._ofga_client,
+        ):
+            loaded_ids += len(chunk)
+            yield [o.split(":")[-1] for o in chunk]
+        logger.info("ListObject for user {} returned {} objects", user_id, loaded_ids)
+
+    async def _chunk_payloads(
+        self, chunks: AsyncGenerator[list[Row], None], max_rows: int | None
+    ) -> AsyncGenerator[str, None]:
+        """Turns every chunk of rows into the text of an event."""
+        read_rows = 0
+        chunk_index = 0
+        rows: list[Row] = await anext(chunks, [])
+        while True:
+            # Looking one chunk ahead tells whether this is the last one.
+            next_rows = await anext(chunks, []) if rows else []
+            kept_rows = rows if max_rows is None else rows[: max_rows - read_rows]
+            read_rows += len(kept_rows)
+            is_last = not next_rows or (max_rows is not None and read_rows >= max_rows)
+            yield json.dumps({
+                "columns": self._columns,
+                "rows": kept_rows,
+                "chunk_index": chunk_index,
+                "is_last": is_last,
+                "truncated": is_last
+                and (len(kept_rows) < len(rows) or bool(next_rows)),
+            })
+            if is_last:
+                logger.info("{} returned {} rows", self.name, read_rows)
+                return
+            rows = next_rows
+            chunk_index += 1
+
+    async def _payloads(
+        self, user_id: str, query: AggregateQuery | None
+    ) -> AsyncGenerator[str, None]:
+        """Reads the visible rows, or their aggregates, as the texts of the events."""
+        if query is not None:
+            rows = await self._backend.aggregate(
+                self._acl_ids(user_id), self._acl_type, query
+            )
+            logger.info("{} aggregated the rows into {} rows", self.name, len(rows))
+            yield json.dumps({
+                "columns": query.output_columns,
+                "rows": rows,
+                "query": query.model_dump(mode="json"),
+            })
+            return
+
+        max_rows = self._result_options.max_rows
+        async with aclosing(
+            self._backend.select(
+                self._acl_ids(user_id),
+                self._acl_type,
+                self._result_options.columns,
+                # One extra row tells whether the result was truncated.
+                limit=None if max_rows is None else max_rows + 1,
+                chunk_size=self._result_options.chunk_size,
+            )
+        ) as chunks:
+            if self._result_options.mode == TabularResultMode.CHUNKED:
+                async for payload in self._chunk_payloads(chunks, max_rows):
+                    yield payload
+                return
+            rows = [row async for chunk in chunks for row in chunk]
+
+        data = json.dumps(rows[:max_rows])
+        logger.info(data)
+        yield data
+
+    def _cache_key(self, ctx: InvocationContext) -> TabularResultCacheKey:
+        """The key of the result, known before the question is planned.
+
+        Without a planner every question gets the same rows, so the question is
+        only part of the key when there is one. It is normalized, so that questions
+        differing by their case or spacing share their result.
+        """
+        question = ""
+        if self._query_planner is not None and ctx.user_content:
+            text = "".join(part.text or "" for part in ctx.user_content.parts or [])
+            question = " ".join(text.split()).casefold()
+        return TabularResultCacheKey(
+            agent_name=self.name,
+            store_id=self._ofga_client.get_store_id(),
+            authorization_model_id=self._ofga_client.get_authorization_model_id(),
+            user_id=ctx.user_id,
+            dataset_version=self._backend.version,
+            question=question,
         )
-        objects = [f'"{o.split(":")[-1]}"' for o in objects]
-        logger.info("ListObject for user {} returned: {}", user_id, objects)
-        clause = "IN" if self._acl_type == ACLType.DEFAULT_DENY else "NOT IN"
-
-        query = dedent(f"""
-        SELECT * FROM data
-        WHERE data.id {clause} ({",".join(objects)})
-        """)  # noqa: S608
-        logger.info("Query {}", query)
-        return query
 
     async def _run_async_impl(
         self, ctx: InvocationContext
@@ -79,49 +361,81 @@ class _FilteringTabularAgentLike(BaseAgent):
         if not ctx.artifact_service:
             raise RuntimeError()
 
-        query = await self._build_query(user_id=ctx.user_id)
-        cur: Cursor = self._sqlite_connection.execute(query)
+        # The cache is looked up first, so that its hits skip the planner too.
+        cache_key = self._cache_key(ctx)
+        payloads = None
+        if self._result_cache is not None:
+            payloads = self._result_cache.get(cache_key)
+        if payloads is not None:
+            logger.info("{} answered user {} from its cache", self.name, ctx.user_id)
+            for payload in payloads:
+                yield Event(
+                    author=self.name,
+                    content=types.Content(parts=[types.Part(text=payload)]),
+                )
+            return
 
-        data = json.dumps(cur.fetchall())
-        logger.info(data)
-        yield Event(
-            author=self.name,
-            content=types.Content(parts=[types.Part(text=data)]),
-        )
+        query = await self._plan_query(ctx)
+        payloads = []
+        async with aclosing(self._payloads(ctx.user_id, query)) as new_payloads:
+            async for payload in new_payloads:
+                payloads.append(payload)
+                yield Event(
+                    author=self.name,
+                    content=types.Content(parts=[types.Part(text=payload)]),
+                )
+        # Only complete results are cached.
+        if self._result_cache is not None:
+            self._result_cache.put(cache_key, payloads)
 
 
 class FilterTabularAgentDefaultDeny(_FilteringTabularAgentLike):
     """Pass."""
 
-    def __init__(
-        self, connection: HRDataConnection, ofga_client: OpenFgaClient, description: str
+    def __init__(  # noqa: PLR0913, PLR0917
+        self,
+        backend: HRDataBackend,
+        ofga_client: OpenFgaClient,
+        description: str,
+        result_options: TabularResultOptions | None = None,
+        query_planner_model: str | None = None,
+        result_cache: TabularResultCache | None = None,
     ) -> None:
         """Something."""
         super().__init__(
             name="HRAgent",
             acl_type=ACLType.DEFAULT_DENY,
             ofga_client=ofga_client,
-            sqlite_conn=connection,
+            backend=backend,
             relationships_name="can_read",
             description=description,
+            result_options=result_options,
+            query_planner_model=query_planner_model,
+            result_cache=result_cache,
         )
 
 
 class FilterTabulerAgentDefaultAllow(_FilteringTabularAgentLike):
     """Pass."""
 
-    def __init__(
+    def __init__(  # noqa: PLR0913, PLR0917
         self,
-        connection: FinancialDataConnection,
+        backend: FinancialDataBackend,
         ofga_client: OpenFgaClient,
         description: str,
+        result_options: TabularResultOptions | None = None,
+        query_planner_model: str | None = None,
+        result_cache: TabularResultCache | None = None,
     ) -> None:
         """Something."""
         super().__init__(
             name="FinancialAgent",
             acl_type=ACLType.DEFAULT_ALLOW_WITH_EXPLICIT_DENY,
             ofga_client=ofga_client,
-            sqlite_conn=connection,
+            backend=backend,
             relationships_name="excluded",
             description=description,
+            result_options=result_options,
+            query_planner_model=query_planner_model,
+            result_cache=result_cache,
         )
@@ -0,0 +1 @@
+"""CLI command for converting tabular datasets to the columnar format."""
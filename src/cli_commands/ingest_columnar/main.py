@@ -0,0 +1,29 @@
+"""Entrypoint for the ingest columnar CLI command."""
+
+from argparse import ArgumentParser
+from pathlib import Path
+
+from src.tabular_data.columnar import write_columnar
+
+
+def _main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--csv_path",
+        type=Path,
+        required=True,
+        help="Path of the CSV dataset to convert. It must have an 'id' column.",
+    )
+    parser.add_argument(
+        "--output_path",
+        type=Path,
+        required=True,
+        help="Path where to write the columnar file.",
+    )
+    args = parser.parse_args()
+    write_columnar(args.csv_path, args.output_path)
+
+
+def entrypoint() -> None:
+    """Actual entrypoint."""
+    _main()
@@ -13,6 +13,11 @@ class Tuple(BaseModel):
         description="Actual body containing the 'rule' defined by this tuple."
     )
 
+    def split_relation_body(self) -> tuple[str, str, str]:
+        """Splits the body in its user, relation and object parts."""
+        user, relation, object = self.relation_body.strip().split(" ")  # noqa: A001
+        return user, relation, object
+
 
 class TupleCollection(BaseModel):
     """Definition of a collection of tuples."""
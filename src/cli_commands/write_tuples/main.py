@@ -71,7 +71,7 @@ async def _main() -> None:
                     store_name=store_configuration.store_name,
                     store_id=store_configuration.store_id,
                 )
-                user, relation, object = tuple(_tuple.relation_body.strip().split(" "))  # noqa: A001
+                user, relation, object = _tuple.split_relation_body()  # noqa: A001
                 logger.debug(
                     "user: {}, relation: {}, object: {}", user, relation, object
                 )
@@ -20,7 +20,9 @@ from src.configuration.configuration_model import (
     OFGAServerConfiguration,
     OFGAStoreConfiguration,
 )
+from src.ofga_operations.clients import LocalFirstOpenFgaClient
 from src.ofga_operations.utils import get_client
+from src.ofga_operations.watcher import ChangeWatcher
 from src.project_types import (
     OFGASecurityModel,
     SerializedConfigurationMapping,
@@ -91,6 +93,30 @@ class ConfigurationModule(Module):
         store_keys = GeneralConfiguration.get_store_configurations()
         return {key: get_client(config, getattr(config, key)) for key in store_keys}
 
+    @singleton
+    @provider
+    def _provide_change_watcher(  # noqa: PLR6301
+        self,
+        config: GeneralConfiguration,
+        clients: dict[str, OpenFgaClient],
+    ) -> ChangeWatcher:
+        watcher_configuration = config.change_watcher
+        watcher = ChangeWatcher(
+            clients,
+            poll_interval_seconds=watcher_configuration.poll_interval_seconds,
+            page_size=watcher_configuration.page_size,
+            enabled=watcher_configuration.enabled,
+        )
+        if not watcher_configuration.enabled:
+            logger.warning(
+                "Change watcher disabled, local caches may serve stale data."
+            )
+            return watcher
+        for client in clients.values():
+            if isinstance(client, LocalFirstOpenFgaClient):
+                watcher.register(client)
+        return watcher
+
     @singleton
     @multiprovider
     def _provide_authorization_model(  # noqa: PLR6301
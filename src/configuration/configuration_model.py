@@ -14,6 +14,60 @@ class OFGAServerConfiguration(BaseModel):
     api_url: str = Field()
 
 
+class DecisionCacheConfiguration(BaseModel):
+    """Configuration for the cache of authorization decisions."""
+
+    max_entries: int = Field(
+        default=10_000,
+        gt=0,
+        description="Maximum number of decisions kept. Least recently used ones are "
+        "evicted first.",
+    )
+    allow_ttl_seconds: float = Field(
+        default=5.0,
+        ge=0,
+        description="For how long an 'allowed' decision is served from the cache.",
+    )
+    deny_ttl_seconds: float = Field(
+        default=30.0,
+        ge=0,
+        description="For how long a 'denied' decision is served from the cache.",
+    )
+
+
+class LocalEvaluationConfiguration(BaseModel):
+    """Configuration for evaluating checks in process."""
+
+    page_size: int = Field(
+        default=100,
+        gt=0,
+        description="Maximum number of tuples per read request, when mirroring the "
+        "tuples of the store in memory at startup.",
+    )
+
+
+class ChangeWatcherConfiguration(BaseModel):
+    """Configuration for the watcher of the tuple changes of the stores."""
+
+    enabled: bool = Field(
+        default=True,
+        description="Whether to poll the stores for changes. Local caches and tuple "
+        "mirrors aren't kept in sync otherwise.",
+    )
+    poll_interval_seconds: float = Field(
+        default=2.0,
+        gt=0,
+        description="How long to wait between polls once all the pending changes of a "
+        "store have been read.",
+    )
+    page_size: int = Field(
+        default=100,
+        gt=0,
+        le=100,
+        description="Maximum number of changes read per request.",
+    )
+
+
 class OFGAStoreConfiguration(BaseModel):
     """Configuration for stores."""
 
@@ -44,6 +98,18 @@ class OFGAStoreConfiguration(BaseModel):
             "More information on the type definition itself."
         )
     )
+    decision_cache: DecisionCacheConfiguration | None = Field(
+        default=None,
+        description="If provided, check results for this store are cached "
+        "client side. Disabled by default.",
+    )
+    local_evaluation: LocalEvaluationConfiguration | None = Field(
+        default=None,
+        description="If provided, checks and list objects requests for this store are "
+        "evaluated in process, using 'authorization_model_file' and a local mirror of "
+        "the tuples. Requests that can't be evaluated locally go to the server. Takes "
+        "precedence over 'decision_cache'.",
+    )
 
 
 class GeneralConfiguration(BaseModel):
@@ -51,6 +117,9 @@ class GeneralConfiguration(BaseModel):
 
     # Server configuration.
     server_configuration: OFGAServerConfiguration
+    change_watcher: ChangeWatcherConfiguration = Field(
+        default_factory=ChangeWatcherConfiguration
+    )
 
     # Here we create a store configuration for each data source.
     # Ideally there should be a 1:1 mapping, however the definition of datasource
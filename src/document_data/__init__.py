@@ -0,0 +1 @@
+"""Storage of the documents served by the document agents."""
@@ -0,0 +1,193 @@
+"""Lexical retrieval of the sections of a `PackedCorpus`, with BM25 scoring.
+
+The inverted index maps every term to the sections containing it, with the number of
+occurrences. It is persisted next to the packed corpus, tagged with the version of the
+corpus it was built from, so that workers load it instead of rebuilding it and only
+rebuild it when the corpus changes.
+"""
+
+import itertools
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import NamedTuple
+
+from loguru import logger
+
+from src.document_data.corpus import PackedCorpus
+from src.document_data.sections import Section, split_sections
+
+_WORD = re.compile(r"[^\W_]+(?:-[^\W_]+)*")
+_MIN_STEMMED_LENGTH = 4
+
+
+def tokenize(text: str) -> list[str]:
+    """Splits a text into lowercase terms.
+
+    Hyphenated words yield their parts and their concatenation, so that `to-do`
+    matches `todo`, and a trailing plural `s` is dropped.
+    """
+    terms = []
+    for word in _WORD.findall(text.lower()):
+        parts = word.split("-")
+        if len(parts) > 1:
+            parts.append("".join(parts))
+        for part in parts:
+            if (
+                len(part) >= _MIN_STEMMED_LENGTH
+                and part.endswith("s")
+                and not part.endswith("ss")
+            ):
+                terms.append(part[:-1])
+            else:
+                terms.append(part)
+    return terms
+
+
+class ScoredSection(NamedTuple):
+    """A section matching a query."""
+
+    section: Section
+    score: float
+
+
+class _Index(NamedTuple):
+    corpus_version: str
+    max_section_bytes: int
+    sections: list[Section]
+    # term -> [(position of the section, term frequency)]
+    postings: dict[str, list[tuple[int, int]]]
+    # Number of terms of each section.
+    lengths: list[int]
+
+
+def _build(corpus: PackedCorpus, max_section_bytes: int) -> _Index:
+    sections: list[Section] = []
+    postings: defaultdict[str, list[tuple[int, int]]] = defaultdict(list)
+    lengths: list[int] = []
+    for handle in corpus.documents():
+        content = corpus.content(handle.doc_id)
+        if content is None:
+            continue
+        for number, (start, end) in enumerate(
+            split_sections(content, max_section_bytes)
+        ):
+            terms = tokenize(
+                str(content[start:end], encoding="utf-8", errors="replace")
+            )
+            for term, frequency in Counter(terms).items():
+                postings[term].append((len(sections), frequency))
+            sections.append(Section(handle.doc_id, handle.name, number, start, end))
+            lengths.append(len(terms))
+    return _Index(corpus.version, max_section_bytes, sections, dict(postings), lengths)
+
+
+def _load(path: Path) -> _Index | None:
+    try:
+        serialized = json.loads(path.read_text(encoding="utf-8"))
+        return _Index(
+            corpus_version=serialized["corpus_version"],
+            max_section_bytes=serialized["max_section_bytes"],
+            sections=list(itertools.starmap(Section, serialized["sections"])),
+            postings={
+                term: [(position, frequency) for position, frequency in postings]
+                for term, postings in serialized["postings"].items()
+            },
+            lengths=serialized["lengths"],
+        )
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _save(index: _Index, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        tmp_path.write_text(json.dumps(index._asdict()), encoding="utf-8")
+        tmp_path.replace(path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+class BM25Retriever:
+    """Ranks the sections of the documents of a corpus against a query with BM25."""
+
+    def __init__(
+        self,
+        corpus: PackedCorpus,
+        index_path: Path,
+        max_section_bytes: int = 2_000,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ) -> None:
+        """Init method.
+
+        Args:
+            corpus (PackedCorpus): The documents.
+            index_path (Path): Where to persist the inverted index.
+            max_section_bytes (int): The maximum size of the sections.
+            k1 (float): How quickly repeated terms stop increasing the score.
+            b (float): How much the length of the sections normalizes their scores.
+        """
+        self._corpus = corpus
+        self._index_path = index_path
+        self._max_section_bytes = max_section_bytes
+        self._k1 = k1
+        self._b = b
+        self._lock = threading.Lock()
+        self._index: _Index | None = None
+
+    def refresh(self) -> None:
+        """Refreshes the corpus, then brings the index up to date with it."""
+        self._corpus.refresh()
+        with self._lock:
+            if self._is_current(self._index):
+                return
+            index = _load(self._index_path)
+            if index is None or not self._is_current(index):
+                logger.info("Indexing the documents of {}.", self._corpus.directory)
+                index = _build(self._corpus, self._max_section_bytes)
+                _save(index, self._index_path)
+            self._index = index
+
+    def _is_current(self, index: _Index | None) -> bool:
+        return (
+            index is not None
+            and index.corpus_version == self._corpus.version
+            and index.max_section_bytes == self._max_section_bytes
+        )
+
+    def search(self, query: str, top_k: int) -> list[ScoredSection]:
+        """The `top_k` sections best matching the query, best first.
+
+        Sections sharing no term with the query are never returned.
+        """
+        index = self._index
+        if index is None:
+            raise RuntimeError("The index was never refreshed.")  # noqa: TRY003
+        section_count = len(index.sections)
+        if not section_count:
+            return []
+        average_length = sum(index.lengths) / section_count
+        scores: defaultdict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = index.postings.get(term, [])
+            idf = math.log(
+                1 + (section_count - len(postings) + 0.5) / (len(postings) + 0.5)
+            )
+            for position, frequency in postings:
+                length_ratio = index.lengths[position] / (average_length or 1)
+                scores[position] += (
+                    idf
+                    * frequency
+                    * (self._k1 + 1)
+                    / (frequency + self._k1 * (1 - self._b + self._b * length_ratio))
+                )
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+        return [
+            ScoredSection(index.sections[position], score) for position, score in best
+        ]
@@ -0,0 +1,294 @@
+"""Packed, memory-mapped corpus of the documents served by the document agents.
+
+The text files of a directory are concatenated into a single file:
+
+    magic (8 bytes) | header size (uint64) | header (JSON) | padding | contents
+
+The header lists, for every document, its integer id, its name, the size and
+modification time of its source file, and where its content lies relative to the
+start of the contents. Ids are kept across rebuilds, so they can be handed out to
+clients.
+
+The file is only rebuilt when the directory changes, reusing the contents of the
+unchanged documents, and is written next to its destination then renamed. Workers map
+it, so they share a single copy of it in the page cache, and only the pages of the
+documents that are actually read get loaded.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from loguru import logger
+
+MAGIC = b"OFGADOC1"
+_HEADER_SIZE = struct.Struct("<Q")
+_PREAMBLE_SIZE = len(MAGIC) + _HEADER_SIZE.size
+_ALIGNMENT = 8
+
+
+class DocumentHandle(NamedTuple):
+    """A document of the corpus, without its content."""
+
+    doc_id: int
+    name: str
+
+
+class _SourceFile(NamedTuple):
+    size: int
+    mtime_ns: int
+
+
+class _Entry(NamedTuple):
+    handle: DocumentHandle
+    source: _SourceFile
+    offset: int
+    size: int
+
+
+class _Mapping(NamedTuple):
+    """A version of the packed file, mapped in memory."""
+
+    packed: mmap.mmap
+    data_start: int
+    entries: dict[int, _Entry]
+    version: str
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def _scan(directory: Path, pattern: str) -> dict[str, _SourceFile]:
+    sources = {}
+    for path in sorted(directory.glob(pattern)):
+        stat = path.stat()
+        sources[path.name] = _SourceFile(stat.st_size, stat.st_mtime_ns)
+    return sources
+
+
+def _read_header(path: Path) -> dict[str, Any] | None:
+    """The header of a packed corpus, or None if it is missing or unreadable."""
+    try:
+        with path.open("rb") as f:
+            preamble = f.read(_PREAMBLE_SIZE)
+            if preamble[: len(MAGIC)] != MAGIC:
+                return None
+            (header_size,) = _HEADER_SIZE.unpack(preamble[len(MAGIC) :])
+            header: dict[str, Any] = json.loads(f.read(header_size))
+    except (OSError, ValueError, struct.error):
+        return None
+    return header
+
+
+def _entries_of(header: dict[str, Any]) -> dict[int, _Entry]:
+    return {
+        document["doc_id"]: _Entry(
+            handle=DocumentHandle(document["doc_id"], document["name"]),
+            source=_SourceFile(document["file_size"], document["mtime_ns"]),
+            offset=document["offset"],
+            size=document["size"],
+        )
+        for document in header["documents"]
+    }
+
+
+def _sources_of(entries: dict[int, _Entry]) -> dict[str, _SourceFile]:
+    return {entry.handle.name: entry.source for entry in entries.values()}
+
+
+class PackedCorpus:
+    """Documents of a directory, served out of a memory-mapped packed file."""
+
+    def __init__(
+        self, directory: Path, packed_path: Path, pattern: str = "*.txt"
+    ) -> None:
+        """Init method.
+
+        Args:
+            directory (Path): The directory holding the documents.
+            packed_path (Path): Where to keep the packed file.
+            pattern (str): Which files of the directory are documents.
+        """
+        self._directory = directory
+        self._packed_path = packed_path
+        self._pattern = pattern
+        self._lock = threading.Lock()
+        self._mapping: _Mapping | None = None
+
+    @property
+    def directory(self) -> Path:
+        """The directory holding the documents."""
+        return self._directory
+
+    def refresh(self) -> bool:
+        """Makes sure the corpus reflects the content of the directory.
+
+        Only the size and modification time of the files are checked. The packed file
+        is rebuilt when they changed, unless another process already rebuilt it.
+
+        Returns:
+            Whether the documents changed.
+        """
+        sources = _scan(self._directory, self._pattern)
+        with self._lock:
+            if (
+                self._mapping is not None
+                and _sources_of(self._mapping.entries) == sources
+            ):
+                return False
+            header = _read_header(self._packed_path)
+            if self._mapping is None and header is not None:
+                # Reuses the ids and contents of a file built by a previous run.
+                self._mapping = self._open()
+            if header is None or _sources_of(_entries_of(header)) != sources:
+                self._build(sources)
+            self._mapping = self._open()
+        return True
+
+    def _read_contents(
+        self, sources: dict[str, _SourceFile]
+    ) -> dict[str, tuple[_SourceFile, bytes | memoryview]]:
+        """The contents of the documents, reused from the mapping when unchanged."""
+        mapping = self._mapping
+        unchanged: dict[str, _Entry] = {}
+        if mapping is not None:
+            unchanged = {
+                entry.handle.name: entry
+                for entry in mapping.entries.values()
+                if sources.get(entry.handle.name) == entry.source
+            }
+        contents: dict[str, tuple[_SourceFile, bytes | memoryview]] = {}
+        for name, source in sources.items():
+            entry = unchanged.get(name)
+            if mapping is not None and entry is not None:
+                contents[name] = (source, self._slice(mapping, entry))
+                continue
+            try:
+                with (self._directory / name).open("rb") as f:
+                    # The file may have changed since the directory was scanned.
+                    stat = os.fstat(f.fileno())
+                    contents[name] = (
+                        _SourceFile(stat.st_size, stat.st_mtime_ns),
+                        f.read(),
+                    )
+            except FileNotFoundError:
+                continue
+        logger.info(
+            "Packing {} documents of {}, {} of them unchanged.",
+            len(contents),
+            self._directory,
+            len(unchanged),
+        )
+        return contents
+
+    def _build(self, sources: dict[str, _SourceFile]) -> None:
+        """Writes the packed file, keeping the ids of the known documents."""
+        known_ids: dict[str, int] = {}
+        if self._mapping is not None:
+            known_ids = {
+                entry.handle.name: doc_id
+                for doc_id, entry in self._mapping.entries.items()
+            }
+        next_id = max(known_ids.values(), default=-1) + 1
+        contents = self._read_contents(sources)
+        documents: list[dict[str, Any]] = []
+        offset = 0
+        for name, (source, content) in contents.items():
+            doc_id = known_ids.get(name)
+            if doc_id is None:
+                doc_id = next_id
+                next_id += 1
+            documents.append({
+                "doc_id": doc_id,
+                "name": name,
+                "offset": offset,
+                "size": len(content),
+                "file_size": source.size,
+                "mtime_ns": source.mtime_ns,
+            })
+            offset = _aligned(offset + len(content))
+        header_bytes = json.dumps({"documents": documents}).encode()
+
+        self._packed_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._packed_path.with_name(
+            f"{self._packed_path.name}.{os.getpid()}.tmp"
+        )
+        try:
+            with tmp_path.open("wb") as out:
+                out.write(MAGIC)
+                out.write(_HEADER_SIZE.pack(len(header_bytes)))
+                out.write(header_bytes)
+                data_start = _aligned(out.tell())
+                for document, (_, content) in zip(
+                    documents, contents.values(), strict=True
+                ):
+                    out.seek(data_start + document["offset"])
+                    out.write(content)
+                out.truncate(data_start + offset)
+            tmp_path.replace(self._packed_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def _open(self) -> _Mapping:
+        with self._packed_path.open("rb") as f:
+            packed = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if packed[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self._packed_path} is not a packed corpus.")  # noqa: TRY003
+        (header_size,) = _HEADER_SIZE.unpack_from(packed, len(MAGIC))
+        header_bytes = packed[_PREAMBLE_SIZE : _PREAMBLE_SIZE + header_size]
+        header = json.loads(header_bytes)
+        # The previous mapping isn't closed: contents sliced out of it keep it alive
+        # until they are released.
+        return _Mapping(
+            packed=packed,
+            data_start=_aligned(_PREAMBLE_SIZE + header_size),
+            entries=_entries_of(header),
+            version=hashlib.sha256(header_bytes).hexdigest(),
+        )
+
+    @staticmethod
+    def _slice(mapping: _Mapping, entry: _Entry) -> memoryview:
+        start = mapping.data_start + entry.offset
+        return memoryview(mapping.packed)[start : start + entry.size]
+
+    def _current_mapping(self) -> _Mapping:
+        mapping = self._mapping
+        if mapping is None:
+            raise RuntimeError("The corpus was never refreshed.")  # noqa: TRY003
+        return mapping
+
+    @property
+    def version(self) -> str:
+        """Identifies the documents of the corpus, as of the last refresh."""
+        return self._current_mapping().version
+
+    def documents(self) -> list[DocumentHandle]:
+        """The documents of the corpus, as of the last refresh."""
+        return [entry.handle for entry in self._current_mapping().entries.values()]
+
+    def content(self, doc_id: int) -> memoryview | None:
+        """The content of a document, sliced out of the mapping without copying it.
+
+        Returns:
+            The content, or None if the document was removed since it was listed.
+        """
+        mapping = self._current_mapping()
+        entry = mapping.entries.get(doc_id)
+        return None if entry is None else self._slice(mapping, entry)
+
+    def text(self, doc_id: int, start: int = 0, end: int | None = None) -> str | None:
+        """The content of a document, or of its bytes from `start` to `end`, decoded.
+
+        Characters cut by the bounds, which happens if the document changed since they
+        were computed, are replaced.
+        """
+        content = self.content(doc_id)
+        if content is None:
+            return None
+        return str(content[start:end], encoding="utf-8", errors="replace")
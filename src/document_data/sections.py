@@ -0,0 +1,121 @@
+"""Sections of the documents, the unit the document agents retrieve and filter.
+
+A document is split at its blank lines into paragraphs, which are merged into sections
+of at most a given size. Every section has its own object id, `<document>/s<number>`,
+so that its ACL can differ from the one of its document. `#` would read better, but
+OpenFGA reserves it for usersets.
+"""
+
+import math
+import re
+from collections.abc import Sequence
+from typing import NamedTuple
+
+SECTION_SEPARATOR = "/"
+# Rough number of characters per token of the answering model.
+CHARS_PER_TOKEN = 4
+
+_PARAGRAPH_BREAK = re.compile(rb"\n[ \t\r]*\n\s*")
+_WHITESPACE = b" \t\r\n"
+_UTF8_CONTINUATION_MASK = 0xC0
+_UTF8_CONTINUATION = 0x80
+
+
+class Section(NamedTuple):
+    """A section of a document, spanning bytes `start` to `end` of its content."""
+
+    doc_id: int
+    name: str
+    number: int
+    start: int
+    end: int
+
+    @property
+    def object_id(self) -> str:
+        """The id of the section, e.g. `doc_alice.txt/s3`."""
+        return section_object_id(self.name, self.number)
+
+
+def section_object_id(document_object_id: str, number: int) -> str:
+    """The id of a section of a document."""
+    return f"{document_object_id}{SECTION_SEPARATOR}s{number}"
+
+
+def _paragraphs(content: bytes | memoryview) -> list[tuple[int, int]]:
+    paragraphs = []
+    start = 0
+    for match in _PARAGRAPH_BREAK.finditer(content):
+        paragraphs.append((start, match.start()))
+        start = match.end()
+    paragraphs.append((start, len(content)))
+    return [
+        (start, end)
+        for start, end in paragraphs
+        if bytes(content[start:end]).strip(_WHITESPACE)
+    ]
+
+
+def _cut(content: bytes | memoryview, start: int, limit: int) -> int:
+    """Where to end a piece of `content` starting at `start`, at or before `limit`.
+
+    The piece ends after the last whitespace if any, and never inside a character.
+    """
+    piece = bytes(content[start:limit])
+    last_whitespace = max(piece.rfind(byte) for byte in (b" ", b"\n", b"\t"))
+    if last_whitespace > 0:
+        return start + last_whitespace + 1
+    end = limit
+    while (
+        end > start + 1 and content[end] & _UTF8_CONTINUATION_MASK == _UTF8_CONTINUATION
+    ):
+        end -= 1
+    return end
+
+
+def split_sections(
+    content: bytes | memoryview, max_bytes: int
+) -> list[tuple[int, int]]:
+    """Splits the content of a document into sections.
+
+    Consecutive paragraphs are merged as long as the section stays within `max_bytes`.
+    Paragraphs longer than that are cut at whitespaces.
+
+    Returns:
+        The start and end of each section, in bytes.
+    """
+    sections: list[tuple[int, int]] = []
+    for paragraph_start, paragraph_end in _paragraphs(content):
+        if sections and paragraph_end - sections[-1][0] <= max_bytes:
+            sections[-1] = (sections[-1][0], paragraph_end)
+            continue
+        start = paragraph_start
+        while paragraph_end - start > max_bytes:
+            end = _cut(content, start, start + max_bytes)
+            sections.append((start, end))
+            start = end
+        sections.append((start, paragraph_end))
+    return sections
+
+
+def estimate_tokens(text: str) -> int:
+    """The approximate number of tokens of a text."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def fit_token_budget(texts: Sequence[str], token_budget: int) -> list[int]:
+    """Picks the texts to keep within a token budget, in order of preference.
+
+    Texts that don't fit in what is left of the budget are skipped, so that a shorter
+    text coming after them may still be kept.
+
+    Returns:
+        The positions of the kept texts.
+    """
+    kept = []
+    remaining_tokens = token_budget
+    for position, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if tokens <= remaining_tokens:
+            kept.append(position)
+            remaining_tokens -= tokens
+    return kept
@@ -0,0 +1,220 @@
+"""Caching of authorization decisions."""
+
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+from typing import TYPE_CHECKING, NamedTuple, override
+
+from loguru import logger
+from openfga_sdk import ClientConfiguration
+from openfga_sdk.client import ClientCheckRequest
+from openfga_sdk.client.models import ClientBatchCheckItem
+from pydantic import BaseModel, Field
+
+from src.ofga_operations.clients import ClientOptions, LocalFirstOpenFgaClient
+from src.ofga_operations.watcher import Invalidation, InvalidationKind, StoreChanges
+
+if TYPE_CHECKING:
+    from src.configuration.configuration_model import DecisionCacheConfiguration
+
+
+class DecisionCacheKey(NamedTuple):
+    """Identifies a single authorization decision."""
+
+    store_id: str | None
+    authorization_model_id: str | None
+    user: str
+    relation: str
+    object: str
+
+
+class DecisionCacheStats(BaseModel):
+    """Counters describing how the cache is performing."""
+
+    hits: int = Field(description="Lookups answered by the cache.")
+    misses: int = Field(description="Lookups that had to go to the server.")
+    evictions: int = Field(description="Entries dropped to respect the size bound.")
+    size: int = Field(description="Entries currently held by the cache.")
+
+
+class DecisionCache:
+    """Bounded LRU cache of authorization decisions.
+
+    Allowed and denied decisions expire after different amounts of time: a stale
+    allow leaks data that was revoked, while a stale deny only delays a new grant.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        allow_ttl_seconds: float,
+        deny_ttl_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Init method.
+
+        Args:
+            max_entries (int): Maximum number of decisions to keep. The least recently
+                used ones are evicted first.
+            allow_ttl_seconds (float): For how long an allowed decision is valid.
+            deny_ttl_seconds (float): For how long a denied decision is valid.
+            clock (Callable[[], float]): Source of the current time, in seconds.
+        """
+        if max_entries <= 0:
+            raise ValueError("max_entries must be positive.")  # noqa: TRY003
+        self._max_entries = max_entries
+        self._allow_ttl_seconds = allow_ttl_seconds
+        self._deny_ttl_seconds = deny_ttl_seconds
+        self._clock = clock
+        # Maps each key to the decision and the time at which it expires.
+        self._entries: OrderedDict[DecisionCacheKey, tuple[bool, float]] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @classmethod
+    def from_configuration(
+        cls, configuration: "DecisionCacheConfiguration"
+    ) -> "DecisionCache":
+        """Builds a cache out of its configuration."""
+        return cls(
+            max_entries=configuration.max_entries,
+            allow_ttl_seconds=configuration.allow_ttl_seconds,
+            deny_ttl_seconds=configuration.deny_ttl_seconds,
+        )
+
+    def get(self, key: DecisionCacheKey) -> bool | None:
+        """Returns the cached decision, or None if it is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return None
+        allowed, expires_at = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            self._misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return allowed
+
+    def put(self, key: DecisionCacheKey, allowed: bool) -> None:  # noqa: FBT001
+        """Stores a decision."""
+        ttl = self._allow_ttl_seconds if allowed else self._deny_ttl_seconds
+        if ttl <= 0:
+            return
+        self._entries[key] = (allowed, self._clock() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def clear(self) -> None:
+        """Drops every cached decision."""
+        self._entries.clear()
+
+    def invalidate(
+        self, store_id: str | None, invalidations: Iterable[Invalidation]
+    ) -> int:
+        """Drops the decisions of the store affected by the invalidations.
+
+        The cache doesn't know who belongs to which group, so a group invalidation
+        drops every decision of the store.
+
+        Returns:
+            The number of dropped decisions.
+        """
+        objects: set[str] = set()
+        users: set[str] = set()
+        wildcard_types: set[str] = set()
+        drop_all = False
+        for invalidation in invalidations:
+            match invalidation.kind:
+                case InvalidationKind.OBJECT:
+                    objects.add(invalidation.value)
+                case InvalidationKind.USER if invalidation.value.endswith(":*"):
+                    wildcard_types.add(invalidation.value.split(":", maxsplit=1)[0])
+                case InvalidationKind.USER:
+                    users.add(invalidation.value)
+                case InvalidationKind.GROUP:
+                    drop_all = True
+
+        stale_keys = [
+            key
+            for key in self._entries
+            if key.store_id == store_id
+            and (
+                drop_all
+                or key.object in objects
+                or key.user in users
+                or key.user.split(":", maxsplit=1)[0] in wildcard_types
+            )
+        ]
+        for key in stale_keys:
+            del self._entries[key]
+        return len(stale_keys)
+
+    def stats(self) -> DecisionCacheStats:
+        """Returns the current counters."""
+        return DecisionCacheStats(
+            hits=self._hits,
+            misses=self._misses,
+            evictions=self._evictions,
+            size=len(self._entries),
+        )
+
+
+class CachedOpenFgaClient(LocalFirstOpenFgaClient):
+    """OpenFGA client that answers repeated checks out of a `DecisionCache`.
+
+    Only `check` and `batch_check` are cached, which covers `can_user_read` and
+    `can_user_read_many`.
+    """
+
+    def __init__(
+        self, configuration: ClientConfiguration, decision_cache: DecisionCache
+    ) -> None:
+        """Init method."""
+        super().__init__(configuration)
+        self.decision_cache: DecisionCache = decision_cache
+
+    def _cache_key(
+        self,
+        body: ClientCheckRequest | ClientBatchCheckItem,
+        options: ClientOptions | None,
+    ) -> DecisionCacheKey:
+        return DecisionCacheKey(
+            store_id=self.get_store_id(),
+            authorization_model_id=self._get_authorization_model_id(options),
+            user=body.user,
+            relation=body.relation,
+            object=body.object,
+        )
+
+    @override
+    def _answer_check_locally(
+        self,
+        body: ClientCheckRequest | ClientBatchCheckItem,
+        options: ClientOptions | None,
+    ) -> bool | None:
+        return self.decision_cache.get(self._cache_key(body, options))
+
+    @override
+    def on_store_changes(self, store_changes: StoreChanges) -> None:
+        if store_changes.store_id != self.get_store_id():
+            return
+        dropped = self.decision_cache.invalidate(
+            store_changes.store_id, store_changes.invalidations
+        )
+        logger.debug(
+            "Dropped {} cached decisions of store {}", dropped, store_changes.store_id
+        )
+
+    @override
+    def _on_remote_check_answer(
+        self,
+        body: ClientCheckRequest | ClientBatchCheckItem,
+        options: ClientOptions | None,
+        allowed: bool,
+    ) -> None:
+        self.decision_cache.put(self._cache_key(body, options), allowed)
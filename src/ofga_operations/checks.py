@@ -1,13 +1,29 @@
 """Methods to perform checks."""
 
+import asyncio
+from collections.abc import Iterable
+from http import HTTPStatus
 from typing import TYPE_CHECKING, cast
 
+from loguru import logger
 from openfga_sdk import OpenFgaClient
 from openfga_sdk.client import ClientCheckRequest
+from openfga_sdk.client.models import ClientBatchCheckItem, ClientBatchCheckRequest
+from openfga_sdk.exceptions import ApiException
 
 if TYPE_CHECKING:
+    from openfga_sdk.client.models import ClientBatchCheckResponse
     from openfga_sdk.models.check_response import CheckResponse
 
+# Upper bound of concurrent Check calls when we can't use BatchCheck.
+DEFAULT_MAX_PARALLEL_CHECKS = 10
+
+# Status codes returned by OpenFGA servers that don't expose BatchCheck (< 1.8).
+_BATCH_CHECK_UNAVAILABLE_STATUSES = frozenset({
+    HTTPStatus.NOT_FOUND,
+    HTTPStatus.NOT_IMPLEMENTED,
+})
+
 
 async def can_user_read(
     client: OpenFgaClient,
@@ -23,3 +39,103 @@ async def can_user_read(
     result: CheckResponse = cast("CheckResponse", await client.check(check_request))
 
     return bool(result.allowed)
+
+
+async def _can_user_read_many_with_checks(  # noqa: PLR0913, PLR0917
+    client: OpenFgaClient,
+    user_id: str,
+    document_ids: list[str],
+    relation: str,
+    object_type: str,
+    max_parallel_requests: int,
+) -> dict[str, bool]:
+    semaphore = asyncio.Semaphore(max_parallel_requests)
+
+    async def _check(document_id: str) -> bool:
+        async with semaphore:
+            return await can_user_read(
+                client=client,
+                user_id=user_id,
+                document_id=document_id,
+                relation=relation,
+                object_type=object_type,
+            )
+
+    results = await asyncio.gather(*(_check(d) for d in document_ids))
+    return dict(zip(document_ids, results, strict=True))
+
+
+async def can_user_read_many(  # noqa: PLR0913, PLR0917
+    client: OpenFgaClient,
+    user_id: str,
+    document_ids: Iterable[str],
+    relation: str = "can_read",
+    object_type: str = "item",
+    max_parallel_requests: int = DEFAULT_MAX_PARALLEL_CHECKS,
+) -> dict[str, bool]:
+    """Checks, in bulk, which of the given documents the user can read.
+
+    The checks are sent through the server side BatchCheck endpoint, which the SDK
+    splits in requests of at most 50 checks each. Servers that predate BatchCheck
+    are queried with plain Check calls instead, at most `max_parallel_requests` at a
+    time.
+
+    Checks that come back with an error are treated as denied.
+
+    Returns:
+        A mapping from each of the provided document ids to whether the user can
+        read it.
+    """
+    # Preserve the order while dropping duplicates.
+    unique_document_ids = list(dict.fromkeys(document_ids))
+    if not unique_document_ids:
+        return {}
+
+    # Correlation ids are restricted to `[\w\d-]{1,36}`, so we can't use the
+    # document ids (e.g. file names) directly.
+    checks = [
+        ClientBatchCheckItem(
+            user=f"user:{user_id}",
+            relation=relation,
+            object=f"{object_type}:{document_id}",
+            correlation_id=str(index),
+        )
+        for index, document_id in enumerate(unique_document_ids)
+    ]
+    try:
+        response: ClientBatchCheckResponse = cast(
+            "ClientBatchCheckResponse",
+            await client.batch_check(
+                ClientBatchCheckRequest(checks=checks),
+                options={"max_parallel_requests": max_parallel_requests},
+            ),
+        )
+    except ApiException as e:
+        if e.status not in _BATCH_CHECK_UNAVAILABLE_STATUSES:
+            raise
+        logger.warning(
+            "BatchCheck is not available (status {}). Falling back to single checks.",
+            e.status,
+        )
+        return await _can_user_read_many_with_checks(
+            client=client,
+            user_id=user_id,
+            document_ids=unique_document_ids,
+            relation=relation,
+            object_type=object_type,
+            max_parallel_requests=max_parallel_requests,
+        )
+
+    result = dict.fromkeys(unique_document_ids, False)
+    for single_response in response.result:
+        document_id = unique_document_ids[int(single_response.correlation_id)]
+        if single_response.error is not None:
+            logger.warning(
+                "Check for user {} on {} failed: {}",
+                user_id,
+                document_id,
+                single_response.error,
+            )
+            continue
+        result[document_id] = bool(single_response.allowed)
+    return result
@@ -0,0 +1,147 @@
+"""Specialized OpenFGA clients."""
+
+import uuid
+from typing import TYPE_CHECKING, cast, override
+
+from loguru import logger
+from openfga_sdk import OpenFgaClient
+from openfga_sdk.client import ClientCheckRequest
+from openfga_sdk.client.models import (
+    ClientBatchCheckItem,
+    ClientBatchCheckRequest,
+    ClientBatchCheckResponse,
+    ClientBatchCheckSingleResponse,
+)
+from openfga_sdk.client.models.list_objects_request import ClientListObjectsRequest
+from openfga_sdk.models.check_response import CheckResponse
+from openfga_sdk.models.consistency_preference import ConsistencyPreference
+
+from src.ofga_operations.watcher import StoreChanges
+
+if TYPE_CHECKING:
+    from openfga_sdk.client.models.tuple import ClientTuple
+
+ClientOptions = dict[str, int | str | dict[str, int | str]]
+
+
+class LocalFirstOpenFgaClient(OpenFgaClient):
+    """OpenFGA client that tries to answer checks without a network hop.
+
+    Subclasses decide how a check is answered locally by overriding
+    `_answer_check_locally`, and can learn from the answers of the server by
+    overriding `_on_remote_check_answer`. Whatever can't be answered locally is sent
+    to the server, batched when possible.
+
+    The clients are `StoreChangeListener`s, so that the local state can be kept in sync
+    with the server.
+    """
+
+    @staticmethod
+    def _can_answer_locally(
+        body: ClientCheckRequest | ClientBatchCheckItem | ClientListObjectsRequest,
+        options: ClientOptions | None,
+    ) -> bool:
+        """Whether the request may be answered by something else than the server.
+
+        Requests carrying contextual tuples, a context or asking for higher
+        consistency always go to the server.
+        """
+        if body.contextual_tuples or body.context:
+            return False
+        return (
+            options is None
+            or options.get("consistency") != ConsistencyPreference.HIGHER_CONSISTENCY
+        )
+
+    def on_store_changes(self, store_changes: StoreChanges) -> None:
+        """Called by the `ChangeWatcher` with the changes of every store.
+
+        Subclasses holding local state override this to keep it fresh.
+        """
+
+    def _answer_check_locally(  # noqa: PLR6301
+        self,
+        body: ClientCheckRequest | ClientBatchCheckItem,  # noqa: ARG002
+        options: ClientOptions | None,  # noqa: ARG002
+    ) -> bool | None:
+        """Returns the decision for the check, or None if it needs the server."""
+        return None
+
+    def _on_remote_check_answer(
+        self,
+        body: ClientCheckRequest | ClientBatchCheckItem,
+        options: ClientOptions | None,
+        allowed: bool,  # noqa: FBT001
+    ) -> None:
+        """Hook called with every decision obtained from the server."""
+
+    def _try_answer_check_locally(
+        self,
+        body: ClientCheckRequest | ClientBatchCheckItem,
+        options: ClientOptions | None,
+    ) -> bool | None:
+        if not self._can_answer_locally(body, options):
+            return None
+        return self._answer_check_locally(body, options)
+
+    @override
+    async def check(
+        self,
+        body: ClientCheckRequest,
+        options: ClientOptions | None = None,
+    ) -> CheckResponse:
+        allowed = self._try_answer_check_locally(body, options)
+        if allowed is not None:
+            return CheckResponse(allowed=allowed, resolution="")
+
+        response = cast("CheckResponse", await super().check(body, options))
+        if self._can_answer_locally(body, options):
+            self._on_remote_check_answer(body, options, bool(response.allowed))
+        return response
+
+    @override
+    async def batch_check(
+        self,
+        body: ClientBatchCheckRequest,
+        options: ClientOptions | None = None,
+    ) -> ClientBatchCheckResponse:
+        local_results: list[ClientBatchCheckSingleResponse] = []
+        remote_checks: dict[str, ClientBatchCheckItem] = {}
+        for check in body.checks:
+            if check.correlation_id is None:
+                check.correlation_id = str(uuid.uuid4())
+            allowed = self._try_answer_check_locally(check, options)
+            if allowed is None:
+                remote_checks[check.correlation_id] = check
+                continue
+            local_results.append(
+                ClientBatchCheckSingleResponse(
+                    allowed=allowed,
+                    request=cast("ClientTuple", check),
+                    correlation_id=check.correlation_id,
+                )
+            )
+
+        logger.debug(
+            "Batch check: {} answered locally, {} sent to the server.",
+            len(local_results),
+            len(remote_checks),
+        )
+        if not remote_checks:
+            return ClientBatchCheckResponse(local_results)
+
+        response = cast(
+            "ClientBatchCheckResponse",
+            await super().batch_check(
+                ClientBatchCheckRequest(checks=list(remote_checks.values())), options
+            ),
+        )
+        for single_response in response.result:
+            check = remote_checks[single_response.correlation_id]
+            if single_response.error is None and self._can_answer_locally(
+                check, options
+            ):
+                self._on_remote_check_answer(
+                    check, options, bool(single_response.allowed)
+                )
+        return ClientBatchCheckResponse(local_results + response.result)
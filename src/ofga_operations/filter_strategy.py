@@ -0,0 +1,324 @@
+"""Picks the cheapest way of filtering candidate objects for a user.
+
+Two strategies are available:
+
+* *LIST_OBJECTS* lists every object the user can access, then intersects the list with
+  the candidates. Lists are cached per user, so the following requests of the user
+  cost nothing until the list expires or the tuples of the user change.
+* *BATCH_CHECK* checks the candidates, in batches.
+
+The selector estimates the cost of both out of the latencies it observed: few
+candidates favour the checks, while users making many requests, or whose lists are
+short, hence cheap to stream and intersect, favour listing. Every decision is
+recorded, for tuning.
+"""
+
+import math
+import time
+from collections import OrderedDict, deque
+from collections.abc import Callable, Iterable
+from enum import StrEnum
+from typing import NamedTuple
+
+from loguru import logger
+from openfga_sdk import OpenFgaClient
+
+from src.ofga_operations.checks import DEFAULT_MAX_PARALLEL_CHECKS, can_user_read_many
+from src.ofga_operations.objects import all_objects_for_user
+from src.ofga_operations.watcher import StoreChanges
+
+# Checks sent by the SDK in a single BatchCheck request.
+CHECKS_PER_BATCH = 50
+# Relative variance below which the sizes observed are considered the same.
+_MIN_VARIANCE = 1e-9
+
+
+class FilterStrategy(StrEnum):
+    """How candidates are filtered."""
+
+    LIST_OBJECTS = "LIST_OBJECTS"
+    BATCH_CHECK = "BATCH_CHECK"
+
+
+class FilterDecision(NamedTuple):
+    """A strategy picked by the selector, with what motivated it."""
+
+    user_id: str
+    relation: str
+    object_type: str
+    strategy: FilterStrategy
+    candidate_count: int
+    estimated_list_objects_seconds: float
+    estimated_batch_check_seconds: float
+    listed_object_count: int | None
+    elapsed_seconds: float
+
+
+class _ListKey(NamedTuple):
+    store_id: str | None
+    authorization_model_id: str | None
+    user_id: str
+    relation: str
+    object_type: str
+
+
+class _ListedObjects(NamedTuple):
+    object_ids: frozenset[str]
+    expires_at: float
+
+
+class _MovingAverage:
+    """Exponentially weighted moving average."""
+
+    def __init__(self, initial_value: float, weight: float = 0.2) -> None:
+        self.value = initial_value
+        self._weight = weight
+
+    def update(self, observed_value: float) -> None:
+        self.value += self._weight * (observed_value - self.value)
+
+
+class _LinearFit:
+    """Least squares line through the observations, the recent ones weighing more."""
+
+    def __init__(self, weight: float = 0.2) -> None:
+        self._weight = weight
+        # Moving averages of x, y, x * x and x * y.
+        self._means: list[float] | None = None
+
+    def update(self, x: float, y: float) -> None:
+        observed = [x, y, x * x, x * y]
+        if self._means is None:
+            self._means = observed
+            return
+        self._means = [
+            mean + self._weight * (value - mean)
+            for mean, value in zip(self._means, observed, strict=True)
+        ]
+
+    def predict(self, x: float, default: float) -> float:
+        if self._means is None:
+            return default
+        mean_x, mean_y, mean_xx, mean_xy = self._means
+        variance = mean_xx - mean_x * mean_x
+        # Flat until observations of different sizes were made.
+        slope = (
+            max((mean_xy - mean_x * mean_y) / variance, 0.0)
+            if variance > _MIN_VARIANCE * max(mean_xx, 1.0)
+            else 0.0
+        )
+        return mean_y + slope * (x - mean_x)
+
+
+class FilterStrategySelector:
+    """Filters candidate objects, through ListObjects or checks, whichever is cheaper.
+
+    The selector listens to the tuple changes, to drop the lists of the users whose
+    tuples changed.
+    """
+
+    def __init__(  # noqa: PLR0913, PLR0917
+        self,
+        client: OpenFgaClient,
+        list_objects_ttl_seconds: float = 30.0,
+        initial_list_objects_seconds: float = 0.05,
+        initial_batch_check_seconds: float = 0.02,
+        max_parallel_requests: int = DEFAULT_MAX_PARALLEL_CHECKS,
+        max_recorded_decisions: int = 1_000,
+        max_tracked_users: int = 10_000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Init method.
+
+        Args:
+            client (OpenFgaClient): The client of the store the objects belong to.
+            list_objects_ttl_seconds (float): For how long a list of objects is valid.
+            initial_list_objects_seconds (float): Expected latency of a ListObjects
+                request, until one is observed.
+            initial_batch_check_seconds (float): Expected latency of a round of
+                BatchCheck requests, until one is observed.
+            max_parallel_requests (int): BatchCheck requests sent at once.
+            max_recorded_decisions (int): How many of the last decisions are kept.
+            max_tracked_users (int): How many users the lists and latencies are kept
+                for. The least recently used ones are forgotten first.
+            clock (Callable[[], float]): Source of the current time, in seconds.
+        """
+        self._client = client
+        self._list_objects_ttl_seconds = list_objects_ttl_seconds
+        self._max_parallel_requests = max_parallel_requests
+        self._max_tracked_users = max_tracked_users
+        self._clock = clock
+        self._listed: dict[_ListKey, _ListedObjects] = {}
+        self._list_objects_seconds = _MovingAverage(initial_list_objects_seconds)
+        # Latency of the lists by their size, as streaming and intersecting them
+        # takes longer the more objects they hold.
+        self._list_objects_seconds_by_size = _LinearFit()
+        # Of every user, how much longer than predicted by their size the lists take,
+        # and the size of the last one.
+        self._list_stats: OrderedDict[_ListKey, tuple[_MovingAverage, int]] = (
+            OrderedDict()
+        )
+        self._batch_check_seconds = _MovingAverage(initial_batch_check_seconds)
+        self._decisions: deque[FilterDecision] = deque(maxlen=max_recorded_decisions)
+
+    def _list_key(self, user_id: str, relation: str, object_type: str) -> _ListKey:
+        return _ListKey(
+            store_id=self._client.get_store_id(),
+            authorization_model_id=self._client.get_authorization_model_id(),
+            user_id=user_id,
+            relation=relation,
+            object_type=object_type,
+        )
+
+    def _cached_list(self, key: _ListKey) -> frozenset[str] | None:
+        listed = self._listed.get(key)
+        if listed is None:
+            return None
+        if listed.expires_at <= self._clock():
+            del self._listed[key]
+            return None
+        return listed.object_ids
+
+    def _check_rounds(self, candidate_count: int) -> int:
+        return math.ceil(
+            candidate_count / (CHECKS_PER_BATCH * self._max_parallel_requests)
+        )
+
+    def _predicted_list_objects_seconds(self, object_count: int) -> float:
+        return self._list_objects_seconds_by_size.predict(
+            object_count, default=self._list_objects_seconds.value
+        )
+
+    def _estimate(self, key: _ListKey, candidate_count: int) -> tuple[float, float]:
+        """The expected seconds spent listing objects, and checking the candidates.
+
+        Listing is expected to take as long as for the users whose lists were as
+        long as the last one of the user, corrected by how the user compared to them.
+        """
+        if self._cached_list(key) is not None:
+            list_objects_seconds = 0.0
+        elif (stats := self._list_stats.get(key)) is None:
+            list_objects_seconds = self._list_objects_seconds.value
+        else:
+            extra_seconds, object_count = stats
+            list_objects_seconds = max(
+                self._predicted_list_objects_seconds(object_count)
+                + extra_seconds.value,
+                0.0,
+            )
+        batch_check_seconds = self._batch_check_seconds.value * self._check_rounds(
+            candidate_count
+        )
+        return list_objects_seconds, batch_check_seconds
+
+    async def _list_object_ids(self, key: _ListKey) -> frozenset[str]:
+        object_ids = self._cached_list(key)
+        if object_ids is not None:
+            return object_ids
+        start = self._clock()
+        object_ids = frozenset(
+            object_.split(":", maxsplit=1)[-1]
+            for object_ in await all_objects_for_user(
+                user_id=key.user_id,
+                relation=key.relation,
+                object_type=key.object_type,
+                client=self._client,
+            )
+        )
+        elapsed_seconds = self._clock() - start
+        self._list_objects_seconds.update(elapsed_seconds)
+        self._list_objects_seconds_by_size.update(len(object_ids), elapsed_seconds)
+        extra_seconds = elapsed_seconds - self._predicted_list_objects_seconds(
+            len(object_ids)
+        )
+        previous_stats = self._list_stats.pop(key, None)
+        user_extra_seconds = (
+            _MovingAverage(extra_seconds)
+            if previous_stats is None
+            else previous_stats[0]
+        )
+        user_extra_seconds.update(extra_seconds)
+        self._list_stats[key] = (user_extra_seconds, len(object_ids))
+        if len(self._list_stats) > self._max_tracked_users:
+            forgotten_key, _ = self._list_stats.popitem(last=False)
+            self._listed.pop(forgotten_key, None)
+        self._listed[key] = _ListedObjects(
+            object_ids, self._clock() + self._list_objects_ttl_seconds
+        )
+        return object_ids
+
+    async def filter(
+        self,
+        user_id: str,
+        object_ids: Iterable[str],
+        relation: str = "can_read",
+        object_type: str = "item",
+    ) -> dict[str, bool]:
+        """Checks which of the given objects the user has the relation with.
+
+        Returns:
+            A mapping from each of the provided object ids to whether the user has the
+            relation with it.
+        """
+        candidates = list(dict.fromkeys(object_ids))
+        if not candidates:
+            return {}
+        key = self._list_key(user_id, relation, object_type)
+        list_objects_seconds, batch_check_seconds = self._estimate(key, len(candidates))
+        strategy = (
+            FilterStrategy.LIST_OBJECTS
+            if list_objects_seconds <= batch_check_seconds
+            else FilterStrategy.BATCH_CHECK
+        )
+
+        start = self._clock()
+        if strategy == FilterStrategy.LIST_OBJECTS:
+            listed = await self._list_object_ids(key)
+            result = {candidate: candidate in listed for candidate in candidates}
+        else:
+            result = await can_user_read_many(
+                client=self._client,
+                user_id=user_id,
+                document_ids=candidates,
+                relation=relation,
+                object_type=object_type,
+                max_parallel_requests=self._max_parallel_requests,
+            )
+            self._batch_check_seconds.update(
+                (self._clock() - start) / self._check_rounds(len(candidates))
+            )
+
+        decision = FilterDecision(
+            user_id=user_id,
+            relation=relation,
+            object_type=object_type,
+            strategy=strategy,
+            candidate_count=len(candidates),
+            estimated_list_objects_seconds=list_objects_seconds,
+            estimated_batch_check_seconds=batch_check_seconds,
+            listed_object_count=(
+                stats[1] if (stats := self._list_stats.get(key)) else None
+            ),
+            elapsed_seconds=self._clock() - start,
+        )
+        self._decisions.append(decision)
+        logger.debug("Filter decision: {}", decision)
+        return result
+
+    def decisions(self) -> list[FilterDecision]:
+        """The last decisions, oldest first."""
+        return list(self._decisions)
+
+    def on_store_changes(self, store_changes: StoreChanges) -> None:
+        """Drops the lists of the users whose tuples changed.
+
+        Changes to groups or wildcards may affect anyone, and drop every list of the
+        store.
+        """
+        stale_keys = [
+            key
+            for key in self._listed
+            if store_changes.affects_user(key.store_id, key.user_id)
+        ]
+        for key in stale_keys:
+            del self._listed[key]
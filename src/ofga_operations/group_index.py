@@ -0,0 +1,149 @@
+"""Materialized transitive closure of group memberships.
+
+Inspired by the Leopard indexing system described in the Zanzibar paper: instead of
+walking nested `group#member` usersets on every request, we keep, for every subject,
+the set of groups it belongs to either directly or through nesting. Answering "is X
+a member of G" becomes a set lookup, and "which objects can X reach through groups"
+becomes an intersection between the subjects X stands for and the subjects related
+to the objects.
+
+The index is maintained incrementally as membership tuples are written and deleted.
+"""
+
+from collections import defaultdict, deque
+from collections.abc import Iterable
+
+from src.ofga_operations.tuples import TupleKey
+
+
+def _userset(group: str, member_relation: str) -> str:
+    return f"{group}#{member_relation}"
+
+
+class GroupClosureIndex:
+    """Maps subjects to every group they are a member of, directly or transitively.
+
+    Subjects are either concrete users (`user:bob`), wildcards (`user:*`) or the
+    members of another group (`group:a#member`).
+    """
+
+    def __init__(
+        self,
+        tuples: Iterable[TupleKey] = (),
+        group_type: str = "group",
+        member_relation: str = "member",
+    ) -> None:
+        """Init method.
+
+        Args:
+            tuples (Iterable[TupleKey]): Tuples to build the index from. Tuples that
+                don't describe group memberships are ignored.
+            group_type (str): The type of the groups.
+            member_relation (str): The relation linking groups to their members.
+        """
+        self._group_type = group_type
+        self._member_relation = member_relation
+        # subject -> groups it is directly a member of.
+        self._direct_groups: defaultdict[str, set[str]] = defaultdict(set)
+        # subject -> groups it is a member of, directly or transitively.
+        self._closure: defaultdict[str, set[str]] = defaultdict(set)
+        # group -> subjects that are a member of it, directly or transitively.
+        self._reverse_closure: defaultdict[str, set[str]] = defaultdict(set)
+        for tuple_key in tuples:
+            self.write(tuple_key)
+
+    def _is_membership(self, tuple_key: TupleKey) -> bool:
+        return (
+            tuple_key.relation == self._member_relation
+            and tuple_key.object.startswith(f"{self._group_type}:")
+        )
+
+    def _subjects_reaching(self, subject: str) -> set[str]:
+        """The subjects whose groups change when `subject` joins or leaves a group."""
+        subjects = {subject}
+        group, _, relation = subject.partition("#")
+        if relation == self._member_relation:
+            subjects |= self._reverse_closure.get(group, set())
+        return subjects
+
+    def _compute_closure(self, subject: str) -> set[str]:
+        groups: set[str] = set()
+        to_visit = deque(self._direct_groups.get(subject, ()))
+        while to_visit:
+            group = to_visit.popleft()
+            if group in groups:
+                continue
+            groups.add(group)
+            to_visit.extend(
+                self._direct_groups.get(_userset(group, self._member_relation), ())
+            )
+        return groups
+
+    def write(self, tuple_key: TupleKey) -> None:
+        """Adds a membership to the index."""
+        if not self._is_membership(tuple_key):
+            return
+        subject, group = tuple_key.user, tuple_key.object
+        if group in self._direct_groups[subject]:
+            return
+        self._direct_groups[subject].add(group)
+
+        gained_groups = {group} | self._closure.get(
+            _userset(group, self._member_relation), set()
+        )
+        for affected in self._subjects_reaching(subject):
+            self._closure[affected] |= gained_groups
+            for gained_group in gained_groups:
+                self._reverse_closure[gained_group].add(affected)
+
+    def delete(self, tuple_key: TupleKey) -> None:
+        """Removes a membership from the index."""
+        if not self._is_membership(tuple_key):
+            return
+        subject, group = tuple_key.user, tuple_key.object
+        if group not in self._direct_groups.get(subject, set()):
+            return
+        affected_subjects = self._subjects_reaching(subject)
+        self._direct_groups[subject].discard(group)
+        if not self._direct_groups[subject]:
+            del self._direct_groups[subject]
+
+        # Removing an edge can't be undone by a set difference (the group might still
+        # be reachable through another path), so we recompute the closure of the
+        # affected subjects only.
+        for affected in affected_subjects:
+            old_groups = self._closure.pop(affected, set())
+            new_groups = self._compute_closure(affected)
+            if new_groups:
+                self._closure[affected] = new_groups
+            for lost_group in old_groups - new_groups:
+                self._reverse_closure[lost_group].discard(affected)
+                if not self._reverse_closure[lost_group]:
+                    del self._reverse_closure[lost_group]
+
+    def groups_for(self, user: str) -> frozenset[str]:
+        """Every group the user belongs to, directly, transitively or by wildcard."""
+        groups = set(self._closure.get(user, set()))
+        user_type, _, user_id = user.partition(":")
+        if "#" not in user and user_id != "*":
+            groups |= self._closure.get(f"{user_type}:*", set())
+        return frozenset(groups)
+
+    def subjects_for(self, user: str) -> frozenset[str]:
+        """Every subject a tuple may reference to grant something to the user.
+
+        These are the user itself, the wildcard of its type and the members of all the
+        groups it belongs to.
+        """
+        subjects = {user}
+        user_type, _, user_id = user.partition(":")
+        if "#" not in user and user_id != "*":
+            subjects.add(f"{user_type}:*")
+        subjects.update(
+            _userset(group, self._member_relation) for group in self.groups_for(user)
+        )
+        return frozenset(subjects)
+
+    def members_of(self, group: str) -> frozenset[str]:
+        """Every subject that is a member of the group, directly or transitively."""
+        return frozenset(self._reverse_closure.get(group, set()))
@@ -0,0 +1,392 @@
+"""In-process evaluation of authorization models.
+
+The evaluator mirrors the tuples of a store in memory and answers `check` and
+`list_objects` requests without a network hop. It only understands the subset of the
+schema 1.1 language used by the models under `data/authorization_models`:
+
+* direct relationships (`[user]`, `[group]`), including wildcards (`[user:*]`),
+* usersets (`[group#member]`), possibly nested,
+* computed relations (`define can_read: reader`).
+
+Any other rewrite (unions, intersections, exclusions, tuple to userset) raises
+`UnsupportedEvaluationError`, which `EmbeddedOpenFgaClient` turns into a request to
+the server.
+"""
+
+from collections import Counter, defaultdict
+from collections.abc import AsyncGenerator, Iterable, Mapping
+from typing import TYPE_CHECKING, Any, cast, override
+
+from loguru import logger
+from openfga_sdk import ClientConfiguration
+from openfga_sdk.client import ClientCheckRequest
+from openfga_sdk.client.models import ClientBatchCheckItem
+from openfga_sdk.client.models.list_objects_request import ClientListObjectsRequest
+from openfga_sdk.models.list_objects_response import ListObjectsResponse
+from openfga_sdk.models.read_request_tuple_key import ReadRequestTupleKey
+from openfga_sdk.models.streamed_list_objects_response import (
+    StreamedListObjectsResponse,
+)
+
+from src.ofga_operations.clients import ClientOptions, LocalFirstOpenFgaClient
+from src.ofga_operations.group_index import GroupClosureIndex
+from src.ofga_operations.tuples import TupleKey
+from src.ofga_operations.watcher import ChangeOperation, StoreChanges
+
+if TYPE_CHECKING:
+    from openfga_sdk.models.read_response import ReadResponse
+
+
+class UnsupportedEvaluationError(Exception):
+    """Raised when a request can't be evaluated locally."""
+
+
+def _object_type(object_or_user: str) -> str:
+    return object_or_user.split(":", maxsplit=1)[0]
+
+
+class LocalEvaluator:
+    """Evaluates checks and list objects requests against an in-memory tuple mirror.
+
+    When the model defines `group#member` as a plain direct relation, memberships are
+    served by a `GroupClosureIndex` instead of walking the nested usersets.
+    """
+
+    def __init__(
+        self,
+        authorization_model: Mapping[str, Any],
+        tuples: Iterable[TupleKey] = (),
+        group_type: str = "group",
+        member_relation: str = "member",
+    ) -> None:
+        """Init method.
+
+        Args:
+            authorization_model (Mapping[str, Any]): The authorization model, in the
+                JSON format accepted by the WriteAuthorizationModel api.
+            tuples (Iterable[TupleKey]): The tuples the store contains.
+            group_type (str): The type whose memberships are indexed.
+            member_relation (str): The relation linking groups to their members.
+        """
+        self._rewrites: dict[tuple[str, str], Mapping[str, Any]] = {}
+        # (type, relation) -> (type, relation) of the usersets it admits.
+        self._admitted_usersets: dict[tuple[str, str], set[tuple[str, str]]] = {}
+        for type_definition in authorization_model["type_definitions"]:
+            object_type = type_definition["type"]
+            relations = type_definition.get("relations") or {}
+            for relation, rewrite in relations.items():
+                self._rewrites[object_type, relation] = rewrite
+            metadata = (type_definition.get("metadata") or {}).get("relations") or {}
+            for relation, relation_metadata in metadata.items():
+                self._admitted_usersets[object_type, relation] = {
+                    (related_type["type"], related_type["relation"])
+                    for related_type in relation_metadata.get(
+                        "directly_related_user_types", []
+                    )
+                    if related_type.get("relation")
+                }
+
+        self._indexed_userset = (group_type, member_relation)
+        self._group_index: GroupClosureIndex | None = None
+        if self._rewrites.get(self._indexed_userset) == {"this": {}}:
+            self._group_index = GroupClosureIndex(
+                group_type=group_type, member_relation=member_relation
+            )
+
+        # (object, relation) -> users directly related to the object.
+        self._users: defaultdict[tuple[str, str], set[str]] = defaultdict(set)
+        # (user, relation) -> objects the user is directly related to.
+        self._objects: defaultdict[tuple[str, str], set[str]] = defaultdict(set)
+        # type -> objects of that type mentioned by any tuple, with the tuple count.
+        self._objects_by_type: defaultdict[str, Counter[str]] = defaultdict(Counter)
+        for tuple_key in tuples:
+            self.write(tuple_key)
+
+    @property
+    def group_index(self) -> GroupClosureIndex | None:
+        """The index of the group memberships, if the model allows using one."""
+        return self._group_index
+
+    def write(self, tuple_key: TupleKey) -> None:
+        """Adds a tuple to the mirror."""
+        users = self._users[tuple_key.object, tuple_key.relation]
+        if tuple_key.user in users:
+            return
+        users.add(tuple_key.user)
+        self._objects[tuple_key.user, tuple_key.relation].add(tuple_key.object)
+        self._objects_by_type[_object_type(tuple_key.object)][tuple_key.object] += 1
+        if self._group_index is not None:
+            self._group_index.write(tuple_key)
+
+    def delete(self, tuple_key: TupleKey) -> None:
+        """Removes a tuple from the mirror."""
+        users = self._users.get((tuple_key.object, tuple_key.relation))
+        if not users or tuple_key.user not in users:
+            return
+        users.remove(tuple_key.user)
+        self._objects[tuple_key.user, tuple_key.relation].discard(tuple_key.object)
+        objects = self._objects_by_type[_object_type(tuple_key.object)]
+        objects[tuple_key.object] -= 1
+        if objects[tuple_key.object] <= 0:
+            del objects[tuple_key.object]
+        if self._group_index is not None:
+            self._group_index.delete(tuple_key)
+
+    def _rewrite(self, object_type: str, relation: str) -> Mapping[str, Any]:
+        try:
+            return self._rewrites[object_type, relation]
+        except KeyError as e:
+            raise UnsupportedEvaluationError(  # noqa: TRY003
+                f"Relation {relation} is not defined on type {object_type}."
+            ) from e
+
+    def _direct_relation(self, object_type: str, relation: str) -> str:
+        """Follows computed relations until reaching a direct one."""
+        seen = set()
+        while relation not in seen:
+            seen.add(relation)
+            rewrite = self._rewrite(object_type, relation)
+            if rewrite.keys() == {"this"}:
+                return relation
+            if rewrite.keys() != {"computedUserset"}:
+                break
+            relation = rewrite["computedUserset"]["relation"]
+        raise UnsupportedEvaluationError(  # noqa: TRY003
+            f"Unsupported rewrite for {object_type}#{relation}: "
+            f"{list(self._rewrite(object_type, relation).keys())}"
+        )
+
+    def _is_indexed(self, userset_object: str, userset_relation: str) -> bool:
+        return (
+            self._group_index is not None
+            and (
+                _object_type(userset_object),
+                userset_relation,
+            )
+            == self._indexed_userset
+        )
+
+    def _subjects_for(self, user: str) -> frozenset[str]:
+        if self._group_index is not None:
+            return self._group_index.subjects_for(user)
+        if "#" in user:
+            return frozenset({user})
+        return frozenset({user, f"{_object_type(user)}:*"})
+
+    def _check_direct(
+        self,
+        user: str,
+        relation: str,
+        object: str,  # noqa: A002
+        visited: set[TupleKey],
+    ) -> bool:
+        users = self._users.get((object, relation))
+        if not users:
+            return False
+        if not users.isdisjoint(self._subjects_for(user)):
+            return True
+        for userset in users:
+            userset_object, _, userset_relation = userset.partition("#")
+            if not userset_relation or self._is_indexed(
+                userset_object, userset_relation
+            ):
+                continue
+            if self._check(user, userset_relation, userset_object, visited):
+                return True
+        return False
+
+    def _check(
+        self,
+        user: str,
+        relation: str,
+        object: str,  # noqa: A002
+        visited: set[TupleKey],
+    ) -> bool:
+        key = TupleKey(user, relation, object)
+        if key in visited:
+            # Cycles in usersets don't grant anything by themselves.
+            return False
+        visited.add(key)
+
+        direct_relation = self._direct_relation(_object_type(object), relation)
+        return self._check_direct(user, direct_relation, object, visited)
+
+    def check(self, user: str, relation: str, object: str) -> bool:  # noqa: A002
+        """Whether the user has the relation with the object."""
+        return self._check(user, relation, object, visited=set())
+
+    def list_objects(self, user: str, relation: str, object_type: str) -> list[str]:
+        """Lists the objects of the given type the user has the relation with."""
+        direct_relation = self._direct_relation(object_type, relation)
+        admitted_usersets = self._admitted_usersets.get((object_type, direct_relation))
+        # Usersets other than the indexed one need to be walked object by object.
+        can_intersect = admitted_usersets is not None and (
+            not admitted_usersets
+            or (
+                self._group_index is not None
+                and admitted_usersets == {self._indexed_userset}
+            )
+        )
+        if not can_intersect:
+            return self._list_objects_by_checks(user, relation, object_type)
+
+        # Every subject that can grant the relation is known upfront, so we only need
+        # to collect the objects they are related to.
+        prefix = f"{object_type}:"
+        objects: set[str] = set()
+        for subject in self._subjects_for(user):
+            objects.update(
+                object_
+                for object_ in self._objects.get((subject, direct_relation), ())
+                if object_.startswith(prefix)
+            )
+        return list(objects)
+
+    def _list_objects_by_checks(
+        self, user: str, relation: str, object_type: str
+    ) -> list[str]:
+        return [
+            object_
+            for object_ in self._objects_by_type.get(object_type, ())
+            if self.check(user, relation, object_)
+        ]
+
+
+class EmbeddedOpenFgaClient(LocalFirstOpenFgaClient):
+    """OpenFGA client that evaluates checks and list objects requests in process.
+
+    Requests the `LocalEvaluator` can't handle, or that target a different
+    authorization model, are sent to the server. So is every request until the tuples
+    are mirrored, when the evaluator is created empty.
+    """
+
+    def __init__(
+        self,
+        configuration: ClientConfiguration,
+        evaluator: LocalEvaluator,
+        *,
+        mirrored: bool = True,
+        mirror_page_size: int = 100,
+    ) -> None:
+        """Init method.
+
+        Args:
+            configuration (ClientConfiguration): The configuration of the client.
+            evaluator (LocalEvaluator): Evaluates the requests answered locally.
+            mirrored (bool): Whether the evaluator holds the tuples of the store
+                already. Otherwise they have to be read with `mirror_store`.
+            mirror_page_size (int): Maximum number of tuples per read request of
+                `mirror_store`.
+        """
+        super().__init__(configuration)
+        self.evaluator: LocalEvaluator = evaluator
+        self._mirrored = mirrored
+        self._mirror_page_size = mirror_page_size
+
+    async def mirror_store(self) -> int:
+        """Reads every tuple of the store into the evaluator.
+
+        Call it once, before the `ChangeWatcher` starts, so that the changes made
+        meanwhile are applied after.
+
+        Returns:
+            The number of tuples read.
+        """
+        read_tuples = 0
+        continuation_token = None
+        while True:
+            options: dict[str, int | str | dict[str, int | str]] = {
+                "page_size": self._mirror_page_size
+            }
+            if continuation_token:
+                options["continuation_token"] = continuation_token
+            response = cast(
+                "ReadResponse",
+                await self.read(ReadRequestTupleKey(), options=options),
+            )
+            for tuple_ in response.tuples or []:
+                self.evaluator.write(
+                    TupleKey(
+                        user=tuple_.key.user,
+                        relation=tuple_.key.relation,
+                        object=tuple_.key.object,
+                    )
+                )
+            read_tuples += len(response.tuples or [])
+            continuation_token = response.continuation_token
+            if not continuation_token:
+                break
+        self._mirrored = True
+        return read_tuples
+
+    @override
+    def on_store_changes(self, store_changes: StoreChanges) -> None:
+        if store_changes.store_id != self.get_store_id():
+            return
+        for change in store_changes.changes:
+            if change.operation == ChangeOperation.WRITE:
+                self.evaluator.write(change.tuple_key)
+            else:
+                self.evaluator.delete(change.tuple_key)
+
+    def _targets_mirrored_model(self, options: ClientOptions | None) -> bool:
+        return self._mirrored and (
+            options is None
+            or "authorization_model_id" not in options
+            or options["authorization_model_id"] == self.get_authorization_model_id()
+        )
+
+    @override
+    def _answer_check_locally(
+        self,
+        body: ClientCheckRequest | ClientBatchCheckItem,
+        options: ClientOptions | None,
+    ) -> bool | None:
+        if not self._targets_mirrored_model(options):
+            return None
+        try:
+            return self.evaluator.check(body.user, body.relation, body.object)
+        except UnsupportedEvaluationError as e:
+            logger.debug("Falling back to the server for check: {}", e)
+            return None
+
+    @override
+    async def list_objects(
+        self,
+        body: ClientListObjectsRequest,
+        options: ClientOptions | None = None,
+    ) -> ListObjectsResponse:
+        if not (
+            self._can_answer_locally(body, options)
+            and self._targets_mirrored_model(options)
+        ):
+            return await super().list_objects(body, options)  # type: ignore
+        try:
+            objects = self.evaluator.list_objects(body.user, body.relation, body.type)
+        except UnsupportedEvaluationError as e:
+            logger.debug("Falling back to the server for list objects: {}", e)
+            return await super().list_objects(body, options)  # type: ignore
+        return ListObjectsResponse(objects=objects)
+
+    @override
+    async def streamed_list_objects(
+        self,
+        body: ClientListObjectsRequest,
+        options: ClientOptions | None = None,
+    ) -> AsyncGenerator[StreamedListObjectsResponse, None]:
+        objects = None
+        if self._can_answer_locally(body, options) and self._targets_mirrored_model(
+            options
+        ):
+            try:
+                objects = self.evaluator.list_objects(
+                    body.user, body.relation, body.type
+                )
+            except UnsupportedEvaluationError as e:
+                logger.debug("Falling back to the server for list objects: {}", e)
+        if objects is None:
+            async for response in super().streamed_list_objects(body, options):
+                yield response
+            return
+        for object_ in objects:
+            yield StreamedListObjectsResponse(object=object_)
@@ -0,0 +1,74 @@
+"""Sharing of the ACL lookups between concurrent requests.
+
+Requests running within `shared_lookups()`, e.g. the messages of a batch, see the same
+`LookupMemo`: the first one listing the objects of a user does the request, the others
+wait for its result. Nothing outlives the scope, so the memo never serves stale lists
+to later requests.
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable, Generator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from typing import NamedTuple
+
+
+class ObjectListKey(NamedTuple):
+    """Identifies a ListObjects request."""
+
+    store_id: str | None
+    authorization_model_id: str | None
+    user_id: str
+    relation: str
+    object_type: str
+
+
+class LookupMemo:
+    """Lookups shared by the requests of a scope, including the ones in flight."""
+
+    def __init__(self) -> None:
+        """Init method."""
+        self._object_lists: dict[ObjectListKey, asyncio.Future[list[str]]] = {}
+
+    def _forget_failure(
+        self, key: ObjectListKey, future: asyncio.Future[list[str]]
+    ) -> None:
+        if (future.cancelled() or future.exception() is not None) and (
+            self._object_lists.get(key) is future
+        ):
+            del self._object_lists[key]
+
+    async def objects_for_user(
+        self, key: ObjectListKey, load: Callable[[], Awaitable[list[str]]]
+    ) -> list[str]:
+        """The objects listed by the request, loading them unless already done.
+
+        Failed loads aren't kept, so the next caller tries again.
+        """
+        future = self._object_lists.get(key)
+        if future is None:
+            future = asyncio.ensure_future(load())
+            future.add_done_callback(partial(self._forget_failure, key))
+            self._object_lists[key] = future
+        # A caller being cancelled doesn't cancel the load the others wait for.
+        return await asyncio.shield(future)
+
+
+_current_memo: ContextVar[LookupMemo | None] = ContextVar("lookup_memo", default=None)
+
+
+@contextmanager
+def shared_lookups() -> Generator[LookupMemo, None, None]:
+    """Shares the lookups of the tasks created within the scope."""
+    memo = LookupMemo()
+    token = _current_memo.set(memo)
+    try:
+        yield memo
+    finally:
+        _current_memo.reset(token)
+
+
+def current_lookup_memo() -> LookupMemo | None:
+    """The memo of the enclosing `shared_lookups()` scope, if any."""
+    return _current_memo.get()
@@ -1,9 +1,15 @@
 """Utility methods that target objects."""
 
+from collections.abc import AsyncGenerator
+
 from loguru import logger
 from openfga_sdk import OpenFgaClient
 from openfga_sdk.client.models.list_objects_request import ClientListObjectsRequest
 
+from src.ofga_operations.lookup_memo import ObjectListKey, current_lookup_memo
+
+DEFAULT_STREAM_CHUNK_SIZE = 500
+
 
 async def list_objects_for_user(
     user_id: str, relation: str, object_type: str, client: OpenFgaClient
@@ -15,3 +21,78 @@ async def list_objects_for_user(
     )
     raw_response = await client.list_objects(req)
     return raw_response.objects  # type: ignore
+
+
+async def stream_objects_for_user(
+    user_id: str, relation: str, object_type: str, client: OpenFgaClient
+) -> AsyncGenerator[str, None]:
+    """Performs a streamed list objects request, yielding objects as they arrive.
+
+    Unlike `list_objects_for_user`, the results aren't truncated by the maximum number
+    of results and the deadline the server applies to ListObjects.
+    """
+    logger.debug("user_id {}, relation {}, type {}", user_id, relation, object_type)
+    req = ClientListObjectsRequest(
+        user=f"user:{user_id}", relation=relation, type=object_type
+    )
+    async for response in client.streamed_list_objects(req):
+        yield response.object
+
+
+async def all_objects_for_user(
+    user_id: str, relation: str, object_type: str, client: OpenFgaClient
+) -> list[str]:
+    """Collects the objects of `stream_objects_for_user`.
+
+    Within `shared_lookups()`, concurrent and later calls for the same user share a
+    single request.
+    """
+
+    async def _load() -> list[str]:
+        return [
+            object_
+            async for object_ in stream_objects_for_user(
+                user_id, relation, object_type, client
+            )
+        ]
+
+    memo = current_lookup_memo()
+    if memo is None:
+        return await _load()
+    key = ObjectListKey(
+        store_id=client.get_store_id(),
+        authorization_model_id=client.get_authorization_model_id(),
+        user_id=user_id,
+        relation=relation,
+        object_type=object_type,
+    )
+    return await memo.objects_for_user(key, _load)
+
+
+async def stream_object_chunks_for_user(
+    user_id: str,
+    relation: str,
+    object_type: str,
+    client: OpenFgaClient,
+    chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE,
+) -> AsyncGenerator[list[str], None]:
+    """Same as `stream_objects_for_user`, but yields lists of at most `chunk_size`.
+
+    Within `shared_lookups()`, the objects are collected, and shared, before being
+    yielded.
+    """
+    if current_lookup_memo() is not None:
+        objects = await all_objects_for_user(user_id, relation, object_type, client)
+        for start in range(0, len(objects), chunk_size):
+            yield objects[start : start + chunk_size]
+        return
+    chunk: list[str] = []
+    async for object_ in stream_objects_for_user(
+        user_id, relation, object_type, client
+    ):
+        chunk.append(object_)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,192 @@
+"""Index of the sections whose ACL overrides the one of their document.
+
+The object id of a section is the one of its document followed by a separator, e.g.
+`doc_alice.txt/s3`. A section inherits the tuples of its document, unless a tuple
+targets the section itself: from then on, only the tuples of the section apply. So
+sections are checked under the id of their document, unless the index knows of a
+tuple targeting them.
+"""
+
+import asyncio
+import time
+from collections.abc import Callable, Iterable
+from typing import TYPE_CHECKING, cast
+
+from loguru import logger
+from openfga_sdk import OpenFgaClient
+from openfga_sdk.models.read_request_tuple_key import ReadRequestTupleKey
+
+from src.ofga_operations.tuples import TupleKey
+from src.ofga_operations.watcher import ChangeOperation, StoreChanges, TupleChange
+
+if TYPE_CHECKING:
+    from openfga_sdk.models.read_response import ReadResponse
+
+
+class SectionOverrideIndex:
+    """Tracks the tuples targeting sections, to know which object to check for them.
+
+    The tuples of a section are read the first time it is checked, filtering the read
+    on the section, then kept up to date with the changes published by the change
+    watcher. Sections read more than `ttl_seconds` ago are read again in the
+    background, so that a tuple targeting a section is eventually seen even when the
+    watcher is disabled or failing, without the requests waiting for it. Otherwise
+    the section would be checked against the ACL of its document, and could be read
+    by anyone able to read the document.
+    """
+
+    def __init__(  # noqa: PLR0913, PLR0917
+        self,
+        client: OpenFgaClient,
+        object_type: str = "item",
+        separator: str = "/",
+        page_size: int = 100,
+        ttl_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Init method.
+
+        Args:
+            client (OpenFgaClient): The client of the store the sections belong to.
+            object_type (str): The type of the documents and of their sections.
+            separator (str): What separates the id of a document from the one of its
+                sections.
+            page_size (int): Maximum number of tuples per read request.
+            ttl_seconds (float): For how long the tuples read are used before being
+                read again, in the background.
+            clock (Callable[[], float]): Source of the current time, in seconds.
+        """
+        self._client = client
+        self._object_type = object_type
+        self._separator = separator
+        self._page_size = page_size
+        self._ttl_seconds = ttl_seconds
+        self._clock = clock
+        # Section id -> tuples targeting it, for the sections read.
+        self._tuples: dict[str, set[TupleKey]] = {}
+        self._expires_at: dict[str, float] = {}
+        self._reads: dict[str, asyncio.Task[None]] = {}
+        # Changes published while the tuples of a section are being read.
+        self._missed_changes: dict[str, list[TupleChange]] = {}
+
+    def _section_id(self, object_: str) -> str | None:
+        object_type, _, object_id = object_.partition(":")
+        if object_type != self._object_type or self._separator not in object_id:
+            return None
+        return object_id
+
+    @staticmethod
+    def _apply(tuples: set[TupleKey], change: TupleChange) -> None:
+        if change.operation == ChangeOperation.WRITE:
+            tuples.add(change.tuple_key)
+        else:
+            tuples.discard(change.tuple_key)
+
+    async def _read_tuples(self, section_id: str) -> set[TupleKey]:
+        tuples: set[TupleKey] = set()
+        continuation_token = None
+        while True:
+            options: dict[str, int | str | dict[str, int | str]] = {
+                "page_size": self._page_size
+            }
+            if continuation_token:
+                options["continuation_token"] = continuation_token
+            response = cast(
+                "ReadResponse",
+                await self._client.read(
+                    ReadRequestTupleKey(object=f"{self._object_type}:{section_id}"),
+                    options=options,
+                ),
+            )
+            tuples.update(
+                TupleKey(
+                    user=tuple_.key.user,
+                    relation=tuple_.key.relation,
+                    object=tuple_.key.object,
+                )
+                for tuple_ in response.tuples or []
+            )
+            continuation_token = response.continuation_token
+            if not continuation_token:
+                return tuples
+
+    async def _read(self, section_id: str) -> None:
+        self._missed_changes[section_id] = []
+        try:
+            tuples = await self._read_tuples(section_id)
+            for change in self._missed_changes[section_id]:
+                self._apply(tuples, change)
+        finally:
+            del self._missed_changes[section_id]
+        self._tuples[section_id] = tuples
+        self._expires_at[section_id] = self._clock() + self._ttl_seconds
+
+    def _reading(self, section_id: str) -> asyncio.Task[None]:
+        """The read of the tuples of the section, started unless already running."""
+        task = self._reads.get(section_id)
+        if task is not None:
+            return task
+
+        def done(task: asyncio.Task[None]) -> None:
+            del self._reads[section_id]
+            if not task.cancelled() and task.exception() is not None:
+                logger.warning(
+                    "Failed reading the tuples of section {}: {}",
+                    section_id,
+                    task.exception(),
+                )
+
+        task = asyncio.create_task(self._read(section_id))
+        task.add_done_callback(done)
+        self._reads[section_id] = task
+        return task
+
+    def __len__(self) -> int:
+        """The number of sections with tuples of their own."""
+        return sum(1 for tuples in self._tuples.values() if tuples)
+
+    async def objects_to_check(self, object_ids: Iterable[str]) -> dict[str, str]:
+        """Maps every object id to the one its ACL is read from.
+
+        Returns:
+            For sections, the id of their document unless they have tuples of their
+            own. Other ids are mapped to themselves.
+        """
+        object_ids = list(object_ids)
+        section_ids = {
+            object_id for object_id in object_ids if self._separator in object_id
+        }
+        unread = [
+            self._reading(section_id)
+            for section_id in section_ids
+            if section_id not in self._tuples
+        ]
+        if unread:
+            # Not cancelled with the request, as other requests may wait for them.
+            await asyncio.wait(unread)
+            for read in unread:
+                read.result()
+        now = self._clock()
+        for section_id in section_ids:
+            if self._expires_at[section_id] <= now:
+                # Answered out of the tuples read before, meanwhile.
+                self._reading(section_id)
+        return {
+            object_id: object_id
+            if self._tuples.get(object_id)
+            else object_id.split(self._separator, maxsplit=1)[0]
+            for object_id in object_ids
+        }
+
+    def on_store_changes(self, store_changes: StoreChanges) -> None:
+        """Applies the tuples written or deleted in the store."""
+        if store_changes.store_id != self._client.get_store_id():
+            return
+        for change in store_changes.changes:
+            section_id = self._section_id(change.tuple_key.object)
+            if section_id is None:
+                continue
+            if section_id in self._missed_changes:
+                self._missed_changes[section_id].append(change)
+            if section_id in self._tuples:
+                self._apply(self._tuples[section_id], change)
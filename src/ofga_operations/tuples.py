@@ -1 +1,28 @@
 """Operations on the tuples."""
+
+from typing import NamedTuple
+
+from src.cli_commands.write_tuples.entities import TupleCollection
+from src.project_types.utils import load_json_from_file_path_as_pydantic_model
+
+
+class TupleKey(NamedTuple):
+    """A relationship tuple."""
+
+    user: str
+    relation: str
+    object: str
+
+
+def load_tuple_mirror(tuples_file: str, store_name: str) -> list[TupleKey]:
+    """Loads the tuples of a store out of a tuples document.
+
+    The document has the same format used by the `write_tuples` command.
+    """
+    collection = load_json_from_file_path_as_pydantic_model(
+        tuples_file, model=TupleCollection
+    )
+    return [
+        TupleKey(*tuple_.split_relation_body())
+        for tuple_ in collection.store_to_tuples.get(store_name, [])
+    ]
@@ -14,6 +14,9 @@ from src.configuration.configuration_model import (
     GeneralConfiguration,
     OFGAStoreConfiguration,
 )
+from src.ofga_operations.cache import CachedOpenFgaClient, DecisionCache
+from src.ofga_operations.local_evaluation import EmbeddedOpenFgaClient, LocalEvaluator
+from src.project_types.utils import load_json_from_file_path
 
 
 # --- Helper Function to Get ID Token ---
@@ -34,10 +37,44 @@ def get_gcp_id_token(audience_url: str) -> str | None:
         return token  # type: ignore
 
 
+def _get_embedded_client(
+    client_configuration: ClientConfiguration, store_conf: OFGAStoreConfiguration
+) -> EmbeddedOpenFgaClient:
+    if store_conf.local_evaluation is None:
+        raise ValueError("Local evaluation is not configured.")  # noqa: TRY003
+    if store_conf.authorization_model_file is None:
+        raise ValueError(  # noqa: TRY003
+            "Local evaluation needs the authorization model file."
+        )
+    if store_conf.decision_cache:
+        logger.warning(
+            "Store {} evaluates checks locally, its decision cache is ignored.",
+            store_conf.store_name,
+        )
+    logger.info(
+        "Evaluating checks for store {} locally, once its tuples are mirrored.",
+        store_conf.store_name,
+    )
+    evaluator = LocalEvaluator(
+        load_json_from_file_path(store_conf.authorization_model_file)
+    )
+    return EmbeddedOpenFgaClient(
+        client_configuration,
+        evaluator=evaluator,
+        mirrored=False,
+        mirror_page_size=store_conf.local_evaluation.page_size,
+    )
+
+
 def get_client(
     config: GeneralConfiguration, maybe_store_conf: OFGAStoreConfiguration | None
 ) -> OpenFgaClient:
-    """Gets an open-fga client."""
+    """Gets an open-fga client.
+
+    If the store configuration enables local evaluation, the returned client answers
+    checks and list objects requests in process. Otherwise, if it enables the decision
+    cache, the returned client serves repeated checks from it.
+    """
     gcp_id_token = get_gcp_id_token(config.server_configuration.api_url)
     fga_credentials = Credentials(
         method="api_token",  # This tells the SDK to use a bearer token
@@ -53,4 +90,16 @@ def get_client(
         else None,
         credentials=fga_credentials,
     )
+    if maybe_store_conf and maybe_store_conf.local_evaluation:
+        return _get_embedded_client(client_configuration, maybe_store_conf)
+    if maybe_store_conf and maybe_store_conf.decision_cache:
+        logger.info(
+            "Enabling the decision cache for store {}", maybe_store_conf.store_name
+        )
+        return CachedOpenFgaClient(
+            client_configuration,
+            decision_cache=DecisionCache.from_configuration(
+                maybe_store_conf.decision_cache
+            ),
+        )
     return OpenFgaClient(client_configuration)
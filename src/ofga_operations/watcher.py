@@ -0,0 +1,261 @@
+"""Watches the stores for tuple changes, so that caches can be invalidated."""
+
+import asyncio
+import contextlib
+import functools
+from collections.abc import Sequence
+from datetime import UTC, datetime, timedelta
+from enum import StrEnum
+from typing import TYPE_CHECKING, NamedTuple, Protocol, cast
+
+from loguru import logger
+from openfga_sdk import OpenFgaClient
+from openfga_sdk.client.models.read_changes_request import ClientReadChangesRequest
+from openfga_sdk.models.tuple_operation import TupleOperation
+
+from src.ofga_operations.tuples import TupleKey
+
+if TYPE_CHECKING:
+    from openfga_sdk.models.read_changes_response import ReadChangesResponse
+    from openfga_sdk.models.tuple_change import TupleChange as RawTupleChange
+
+
+# How far behind the clocks of the servers may be.
+_CLOCK_SKEW = timedelta(minutes=1)
+
+
+class ChangeOperation(StrEnum):
+    """What happened to a tuple."""
+
+    WRITE = "WRITE"
+    DELETE = "DELETE"
+
+
+class InvalidationKind(StrEnum):
+    """What a cache has to forget after a change.
+
+    *OBJECT* means that the relations of a given object changed.
+    *USER* means that the relations of a given user (or, for wildcards, of every user
+        of that type) changed.
+    *GROUP* means that the groups all the members of a given group belong to changed.
+    """
+
+    OBJECT = "OBJECT"
+    USER = "USER"
+    GROUP = "GROUP"
+
+
+class Invalidation(NamedTuple):
+    """Something a cache has to forget."""
+
+    kind: InvalidationKind
+    value: str
+
+
+class TupleChange(NamedTuple):
+    """A tuple that was written or deleted."""
+
+    tuple_key: TupleKey
+    operation: ChangeOperation
+
+
+@functools.lru_cache(maxsize=16)
+def _affected_users(invalidations: frozenset[Invalidation]) -> frozenset[str] | None:
+    """The users whose relations changed, or None when it may be anyone."""
+    users: set[str] = set()
+    for invalidation in invalidations:
+        match invalidation.kind:
+            case InvalidationKind.USER if invalidation.value.endswith(":*"):
+                return None
+            case InvalidationKind.USER:
+                users.add(invalidation.value)
+            case InvalidationKind.GROUP:
+                return None
+    return frozenset(users)
+
+
+class StoreChanges(NamedTuple):
+    """Batch of changes that happened in a store."""
+
+    store_id: str
+    changes: list[TupleChange]
+    invalidations: frozenset[Invalidation]
+
+    def affects_user(self, store_id: str | None, user_id: str) -> bool:
+        """Whether the objects a user of a store is related to may have changed.
+
+        Changes to an object alone don't matter, only those to the tuples of the user.
+        Changes to groups or wildcards may affect anyone.
+
+        Args:
+            store_id (str | None): The store of the user.
+            user_id (str): The id of the user, without the `user:` type.
+        """
+        if store_id != self.store_id:
+            return False
+        users = _affected_users(self.invalidations)
+        return users is None or f"user:{user_id}" in users
+
+
+class StoreChangeListener(Protocol):
+    """Anything that needs to know about the changes happening in the stores."""
+
+    def on_store_changes(self, store_changes: StoreChanges) -> None:
+        """Called with every batch of changes read from a store."""
+        ...
+
+
+def invalidations_for(tuple_key: TupleKey) -> set[Invalidation]:
+    """Computes what caches have to forget after a tuple changed.
+
+    Besides the object, the change affects its user. For usersets (`group:a#member`)
+    that means every member of the group.
+    """
+    invalidations = {Invalidation(InvalidationKind.OBJECT, tuple_key.object)}
+    group, _, relation = tuple_key.user.partition("#")
+    if relation:
+        invalidations.add(Invalidation(InvalidationKind.GROUP, group))
+    else:
+        invalidations.add(Invalidation(InvalidationKind.USER, tuple_key.user))
+    return invalidations
+
+
+def _parse_change(raw_change: "RawTupleChange") -> TupleChange:
+    raw_tuple_key = raw_change.tuple_key
+    operation = (
+        ChangeOperation.DELETE
+        if raw_change.operation == TupleOperation.DELETE
+        else ChangeOperation.WRITE
+    )
+    return TupleChange(
+        tuple_key=TupleKey(
+            user=raw_tuple_key.user,
+            relation=raw_tuple_key.relation,
+            object=raw_tuple_key.object,
+        ),
+        operation=operation,
+    )
+
+
+class ChangeWatcher:
+    """Polls the ReadChanges api of every store and notifies the listeners.
+
+    Each store keeps its own continuation token, so after the first request only new
+    changes are read. Changes that happened before the watcher was created are
+    skipped, so the state read from the stores after creating it, e.g. the tuples
+    mirrored by `EmbeddedOpenFgaClient.mirror_store`, is kept up to date. The changes
+    of the last `_CLOCK_SKEW` before that are read too, in case the clocks of the
+    servers are behind, as applying a change twice makes no difference.
+    """
+
+    def __init__(
+        self,
+        clients: dict[str, OpenFgaClient],
+        poll_interval_seconds: float = 2.0,
+        page_size: int = 100,
+        *,
+        enabled: bool = True,
+    ) -> None:
+        """Init method.
+
+        Args:
+            clients (dict[str, OpenFgaClient]): Clients for each of the stores to watch.
+            poll_interval_seconds (float): How long to wait after having read all the
+                pending changes of a store.
+            page_size (int): Maximum number of changes per request.
+            enabled (bool): Whether to watch the stores at all. Listeners can register
+                either way, but a disabled watcher never starts.
+        """
+        self._clients = clients
+        self._poll_interval_seconds = poll_interval_seconds
+        self._page_size = page_size
+        self._enabled = enabled
+        self._listeners: list[StoreChangeListener] = []
+        self._continuation_tokens: dict[str, str] = {}
+        self._start_time = (datetime.now(UTC) - _CLOCK_SKEW).strftime(
+            "%Y-%m-%dT%H:%M:%SZ"
+        )
+        self._tasks: list[asyncio.Task[None]] = []
+
+    def register(self, listener: StoreChangeListener) -> None:
+        """Registers a listener that will receive the changes of every store."""
+        self._listeners.append(listener)
+
+    def _publish(self, store_changes: StoreChanges) -> None:
+        for listener in self._listeners:
+            try:
+                listener.on_store_changes(store_changes)
+            except Exception:  # noqa: BLE001
+                logger.exception("Listener {} failed handling changes.", listener)
+
+    async def poll_once(self, store_key: str) -> int:
+        """Reads the pending changes of a store and publishes them.
+
+        Returns:
+            The number of changes read.
+        """
+        client = self._clients[store_key]
+        store_id = client.get_store_id()
+        read_changes = 0
+        while True:
+            options: dict[str, int | str | dict[str, int | str]] = {
+                "page_size": self._page_size
+            }
+            token = self._continuation_tokens.get(store_key)
+            if token:
+                options["continuation_token"] = token
+            response = cast(
+                "ReadChangesResponse",
+                await client.read_changes(
+                    ClientReadChangesRequest(type="", start_time=self._start_time),
+                    options=options,
+                ),
+            )
+            if response.continuation_token:
+                self._continuation_tokens[store_key] = response.continuation_token
+            changes = [_parse_change(c) for c in response.changes or []]
+            if not changes:
+                return read_changes
+            read_changes += len(changes)
+            invalidations: set[Invalidation] = set()
+            for change in changes:
+                invalidations |= invalidations_for(change.tuple_key)
+            logger.debug("Read {} changes from store {}", len(changes), store_key)
+            self._publish(
+                StoreChanges(
+                    store_id=store_id,
+                    changes=changes,
+                    invalidations=frozenset(invalidations),
+                )
+            )
+
+    async def _watch(self, store_key: str) -> None:
+        while True:
+            try:
+                await self.poll_once(store_key)
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # noqa: BLE001
+                logger.exception("Error reading the changes of store {}", store_key)
+            await asyncio.sleep(self._poll_interval_seconds)
+
+    def start(self, store_keys: Sequence[str] | None = None) -> None:
+        """Starts watching the given stores (all of them by default)."""
+        if not self._enabled:
+            logger.info("Change watcher disabled, not watching the stores.")
+            return
+        if not self._listeners:
+            logger.info("No listener registered, not watching the stores.")
+            return
+        for store_key in store_keys or list(self._clients):
+            logger.info("Watching store {} for changes.", store_key)
+            self._tasks.append(asyncio.create_task(self._watch(store_key)))
+
+    async def stop(self) -> None:
+        """Stops watching the stores."""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._tasks.clear()
@@ -0,0 +1 @@
+"""Storage of the tabular datasets served by the tabular agents."""
@@ -0,0 +1,302 @@
+"""Aggregations over the rows of a dataset visible through an ACL.
+
+Rather than returning every visible row, a tabular agent can compute an
+`AggregateQuery` and only return its result. Queries are restricted to a whitelist of
+aggregate functions and comparison operators on known columns, so they can be compiled
+to SQL without interpolating any text coming from the LLM.
+"""
+
+import operator
+from collections.abc import Callable, Collection, Iterable, Sequence
+from enum import StrEnum
+from typing import Any, Self
+
+from pydantic import BaseModel, Field, model_validator
+
+from src.tabular_data.sqlite_cache import quote_identifier
+
+Row = tuple[Any, ...]
+
+MAX_AGGREGATE_ROWS = 1_000
+
+
+class InvalidAggregateQueryError(ValueError):
+    """Raised when a query doesn't fit the dataset it targets."""
+
+
+class AggregateFunction(StrEnum):
+    """The aggregate functions a query may use."""
+
+    COUNT = "COUNT"
+    SUM = "SUM"
+    AVG = "AVG"
+    MIN = "MIN"
+    MAX = "MAX"
+
+
+class FilterOperator(StrEnum):
+    """The comparisons a filter may use."""
+
+    EQ = "="
+    NE = "!="
+    LT = "<"
+    LE = "<="
+    GT = ">"
+    GE = ">="
+
+
+_COMPARISONS: dict[FilterOperator, Callable[[Any, Any], bool]] = {
+    FilterOperator.EQ: operator.eq,
+    FilterOperator.NE: operator.ne,
+    FilterOperator.LT: operator.lt,
+    FilterOperator.LE: operator.le,
+    FilterOperator.GT: operator.gt,
+    FilterOperator.GE: operator.ge,
+}
+
+
+class Aggregate(BaseModel):
+    """An aggregate function applied to a column."""
+
+    function: AggregateFunction
+    column: str | None = Field(
+        default=None,
+        description="The aggregated column. Only COUNT accepts none, counting rows.",
+    )
+
+    @model_validator(mode="after")
+    def _check_column(self) -> Self:
+        if self.column is None and self.function != AggregateFunction.COUNT:
+            raise ValueError(f"{self.function} needs a column.")  # noqa: TRY003
+        return self
+
+    @property
+    def label(self) -> str:
+        """The name of the result column, e.g. `sum(items sold)`."""
+        return f"{self.function.lower()}({self.column or '*'})"
+
+
+class ColumnFilter(BaseModel):
+    """Keeps the rows whose column compares to the value."""
+
+    column: str
+    operator: FilterOperator
+    value: float | str
+
+
+class OrderBy(BaseModel):
+    """Sorts the result on one of its columns."""
+
+    key: str = Field(
+        description="A group by column, or the label of an aggregate, e.g. sum(sales)."
+    )
+    descending: bool = Field(default=False)
+
+
+class AggregateQuery(BaseModel):
+    """A query computing aggregates over the rows visible to a user."""
+
+    aggregates: list[Aggregate] = Field(
+        default_factory=list,
+        description="The aggregates to compute. None when raw rows are needed.",
+    )
+    group_by: list[str] = Field(default_factory=list)
+    filters: list[ColumnFilter] = Field(default_factory=list)
+    order_by: list[OrderBy] = Field(default_factory=list)
+    limit: int = Field(default=100, gt=0, le=MAX_AGGREGATE_ROWS)
+
+    @property
+    def output_columns(self) -> list[str]:
+        """The columns of the result: the group by ones then the aggregates."""
+        return [*self.group_by, *(a.label for a in self.aggregates)]
+
+    @property
+    def input_columns(self) -> list[str]:
+        """The columns of the dataset the query reads, without duplicates."""
+        columns = [
+            *self.group_by,
+            *(a.column for a in self.aggregates if a.column is not None),
+            *(f.column for f in self.filters),
+        ]
+        return list(dict.fromkeys(columns))
+
+    def validate_columns(self, columns: Collection[str]) -> None:
+        """Checks the query only references the given columns.
+
+        Raises:
+            InvalidAggregateQueryError: If it doesn't, or doesn't aggregate anything.
+        """
+        if not self.aggregates:
+            raise InvalidAggregateQueryError("The query has no aggregate.")  # noqa: TRY003
+        unknown_columns = [c for c in self.input_columns if c not in columns]
+        if unknown_columns:
+            raise InvalidAggregateQueryError(  # noqa: TRY003
+                f"Unknown columns: {unknown_columns}. Available columns: {columns}"
+            )
+        unknown_keys = [
+            o.key for o in self.order_by if o.key not in self.output_columns
+        ]
+        if unknown_keys:
+            raise InvalidAggregateQueryError(  # noqa: TRY003
+                f"Unknown order by keys: {unknown_keys}. "
+                f"Available keys: {self.output_columns}"
+            )
+
+    def to_sql(self, visible_rows: str) -> str:
+        """Compiles the query.
+
+        Args:
+            visible_rows (str): Query selecting the input columns of the visible rows.
+
+        Returns:
+            The query, whose parameters are those of `visible_rows`, then the values of
+            the filters, then the limit.
+        """
+        selected = [quote_identifier(c) for c in self.group_by]
+        selected.extend(
+            f"{a.function}({'*' if a.column is None else quote_identifier(a.column)})"
+            f" AS {quote_identifier(a.label)}"
+            for a in self.aggregates
+        )
+        sql = f"WITH visible AS ({visible_rows}) SELECT {', '.join(selected)}"
+        sql += " FROM visible"
+        if self.filters:
+            sql += " WHERE " + " AND ".join(
+                f"{quote_identifier(f.column)} {f.operator} ?" for f in self.filters
+            )
+        if self.group_by:
+            sql += " GROUP BY " + ", ".join(quote_identifier(c) for c in self.group_by)
+        if self.order_by:
+            sql += " ORDER BY " + ", ".join(
+                f"{quote_identifier(o.key)}{' DESC' if o.descending else ''}"
+                for o in self.order_by
+            )
+        return f"{sql} LIMIT ?"
+
+    def sql_parameters(self) -> list[Any]:
+        """The parameters of the compiled query following those of the visible rows."""
+        return [*(f.value for f in self.filters), self.limit]
+
+
+def _sort_key(value: Any) -> tuple[int, Any]:  # noqa: ANN401
+    """Orders values like sqlite does: nulls, then numbers, then text."""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, int | float):
+        return (1, value)
+    return (2, str(value))
+
+
+def _comparable(value: float | str, cell: Any) -> float | str:  # noqa: ANN401
+    """Applies the affinity of the cell to the value, like sqlite does."""
+    if isinstance(cell, int | float) and isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    if isinstance(cell, str) and not isinstance(value, str):
+        return str(value)
+    return value
+
+
+class _Accumulator:
+    def __init__(self, function: AggregateFunction) -> None:
+        self._function = function
+        self._count = 0
+        self._value: Any = None
+
+    def add(self, value: Any) -> None:  # noqa: ANN401
+        if value is None:
+            return
+        if self._function in {AggregateFunction.SUM, AggregateFunction.AVG}:
+            # Non numeric values are skipped.
+            if not isinstance(value, int | float):
+                return
+            self._value = value if self._value is None else self._value + value
+        elif self._function != AggregateFunction.COUNT and (
+            self._value is None
+            or (_sort_key(value) < _sort_key(self._value))
+            == (self._function == AggregateFunction.MIN)
+        ):
+            self._value = value
+        self._count += 1
+
+    def result(self) -> Any:  # noqa: ANN401
+        if self._function == AggregateFunction.COUNT:
+            return self._count
+        if self._function == AggregateFunction.AVG and self._count:
+            return self._value / self._count
+        return self._value
+
+
+class RowAggregation:
+    """Computes a query in process, for backends without a query engine.
+
+    The results match those of the compiled query, except for non numeric values,
+    which sums and averages skip instead of casting.
+    """
+
+    def __init__(self, query: AggregateQuery, columns: Sequence[str]) -> None:
+        """Init method.
+
+        Args:
+            query (AggregateQuery): The query, validated against `columns`.
+            columns (Sequence[str]): The columns of the rows that will be added.
+        """
+        self._query = query
+        position = {column: i for i, column in enumerate(columns)}
+        self._filters = [
+            (position[f.column], _COMPARISONS[f.operator], f.value)
+            for f in query.filters
+        ]
+        self._group_positions = [position[c] for c in query.group_by]
+        self._aggregate_positions = [
+            None if a.column is None else position[a.column] for a in query.aggregates
+        ]
+        self._groups: dict[Row, list[_Accumulator]] = {}
+
+    def _matches(self, row: Row) -> bool:
+        for position, compare, value in self._filters:
+            cell = row[position]
+            if cell is None or not compare(
+                _sort_key(cell), _sort_key(_comparable(value, cell))
+            ):
+                return False
+        return True
+
+    def _accumulators(self) -> list[_Accumulator]:
+        return [_Accumulator(a.function) for a in self._query.aggregates]
+
+    def add(self, rows: Iterable[Row]) -> None:
+        """Adds visible rows to the aggregation."""
+        for row in rows:
+            if not self._matches(row):
+                continue
+            key = tuple(row[p] for p in self._group_positions)
+            accumulators = self._groups.get(key)
+            if accumulators is None:
+                accumulators = self._groups[key] = self._accumulators()
+            for accumulator, position in zip(
+                accumulators, self._aggregate_positions, strict=True
+            ):
+                # COUNT(*) counts the rows, whatever their values.
+                accumulator.add(True if position is None else row[position])
+
+    def rows(self) -> list[Row]:
+        """The result of the query."""
+        groups = self._groups
+        if not self._query.group_by and not groups:
+            # Like in sql, aggregating no row without grouping still yields a row.
+            groups = {(): self._accumulators()}
+        rows = [
+            (*key, *(accumulator.result() for accumulator in accumulators))
+            for key, accumulators in groups.items()
+        ]
+        output_columns = self._query.output_columns
+        for order_by in reversed(self._query.order_by):
+            position = output_columns.index(order_by.key)
+            rows.sort(
+                key=lambda row: _sort_key(row[position]),
+                reverse=order_by.descending,
+            )
+        return rows[: self._query.limit]
@@ -0,0 +1,450 @@
+"""Backends the tabular agents read their datasets from.
+
+A backend selects the rows of a dataset that are visible through an ACL, i.e. the ids
+returned by a ListObjects request:
+
+* for `ACLType.DEFAULT_DENY` stores, the rows whose id is in the ACL,
+* for `ACLType.DEFAULT_ALLOW_WITH_EXPLICIT_DENY` stores, the rows whose id isn't.
+"""
+
+import asyncio
+import csv
+import uuid
+from abc import ABC, abstractmethod
+from collections.abc import (
+    AsyncGenerator,
+    AsyncIterable,
+    Callable,
+    Iterator,
+    Sequence,
+)
+from contextlib import aclosing
+from pathlib import Path
+from sqlite3 import Connection
+from textwrap import dedent
+from typing import Any, override
+
+import numpy as np
+import numpy.typing as npt
+from loguru import logger
+
+from src.project_types import ACLType
+from src.tabular_data.aggregates import AggregateQuery, Row, RowAggregation
+from src.tabular_data.columnar import ColumnarDataset, ColumnKind, infer_column_kind
+from src.tabular_data.query_runner import (
+    QueryRunnerStats,
+    QuerySession,
+    SQLiteQueryRunner,
+)
+from src.tabular_data.sqlite_cache import (
+    DATA_TABLE,
+    ID_COLUMN,
+    file_sha256,
+    quote_identifier,
+    stored_fingerprint,
+)
+
+# Ids of the ACL, scoped by request.
+_CREATE_ACL_TABLE = dedent("""
+    CREATE TEMP TABLE IF NOT EXISTS acl_ids (
+        request_id TEXT NOT NULL,
+        id TEXT NOT NULL,
+        PRIMARY KEY (request_id, id)
+    ) WITHOUT ROWID
+""")
+_INSERT_ACL_IDS = "INSERT OR IGNORE INTO temp.acl_ids (request_id, id) VALUES (?, ?)"
+_DELETE_ACL_IDS = "DELETE FROM temp.acl_ids WHERE request_id = ?"
+# Semi-join, driven by the ACL ids and the index on data.id.
+_SELECT_ALLOWED_ROWS = dedent("""
+    SELECT {columns} FROM temp.acl_ids AS acl
+    JOIN data ON data.id = acl.id
+    WHERE acl.request_id = ?
+    LIMIT ?
+""")
+# Anti-join, driven by the rows of data and the primary key of the ACL ids.
+_SELECT_NOT_EXCLUDED_ROWS = dedent("""
+    SELECT {columns} FROM data
+    WHERE NOT EXISTS (
+        SELECT 1 FROM temp.acl_ids AS acl
+        WHERE acl.request_id = ? AND acl.id = data.id
+    )
+    LIMIT ?
+""")
+# A negative limit means no limit for sqlite.
+_NO_LIMIT = -1
+# Rows read at a time by the in-process aggregations.
+_AGGREGATION_CHUNK_SIZE = 10_000
+
+
+def create_acl_table(connection: Connection) -> None:
+    """Creates the temporary table holding the ACL ids, if it doesn't exist.
+
+    Temporary tables are private to a connection, so this has to be called for every
+    connection a `SQLiteBackend` queries.
+    """
+    connection.execute(_CREATE_ACL_TABLE)
+
+
+class TabularBackend(ABC):
+    """Selects the rows of a dataset visible through an ACL."""
+
+    @property
+    @abstractmethod
+    def version(self) -> str:
+        """Identifies the content of the dataset, changing whenever it does."""
+
+    @abstractmethod
+    def column_names(self) -> list[str]:
+        """The columns of the dataset, in order."""
+
+    @abstractmethod
+    def select(
+        self,
+        acl_ids: AsyncIterable[list[str]],
+        acl_type: ACLType,
+        columns: Sequence[str] | None,
+        limit: int | None,
+        chunk_size: int,
+    ) -> AsyncGenerator[list[Row], None]:
+        """Yields the visible rows, at most `chunk_size` at a time.
+
+        Args:
+            acl_ids (AsyncIterable[list[str]]): Chunks of ids of the ACL.
+            acl_type (ACLType): Whether the ACL lists the visible or hidden rows.
+            columns (Sequence[str] | None): The columns to return, all when None.
+            limit (int | None): Maximum number of rows, unbounded when None.
+            chunk_size (int): Maximum number of rows per chunk.
+        """
+
+    async def aggregate(
+        self,
+        acl_ids: AsyncIterable[list[str]],
+        acl_type: ACLType,
+        query: AggregateQuery,
+    ) -> list[Row]:
+        """Computes the query over the visible rows.
+
+        By default the visible rows are streamed through a `RowAggregation`. Backends
+        with a query engine should rather push the query down to it.
+
+        Args:
+            acl_ids (AsyncIterable[list[str]]): Chunks of ids of the ACL.
+            acl_type (ACLType): Whether the ACL lists the visible or hidden rows.
+            query (AggregateQuery): The query, validated against the columns.
+
+        Returns:
+            The rows of the result, with the columns `query.output_columns`.
+        """
+        columns = query.input_columns or [ID_COLUMN]
+        aggregation = RowAggregation(query, columns)
+        async with aclosing(
+            self.select(
+                acl_ids,
+                acl_type,
+                columns,
+                limit=None,
+                chunk_size=_AGGREGATION_CHUNK_SIZE,
+            )
+        ) as chunks:
+            async for chunk in chunks:
+                aggregation.add(chunk)
+        return aggregation.rows()
+
+    def stats(self) -> QueryRunnerStats | None:  # noqa: PLR6301
+        """Usage of the connections of the backend, None when it has none."""
+        return None
+
+    def close(self) -> None:  # noqa: B027
+        """Releases the resources held by the backend."""
+
+
+class SQLiteBackend(TabularBackend):
+    """Backend joining the ACL ids, loaded in a temporary table, with the data."""
+
+    def __init__(self, query_runner: SQLiteQueryRunner) -> None:
+        """Init method.
+
+        Args:
+            query_runner (SQLiteQueryRunner): Runs the queries on the data. Its
+                connections must be initialized with `create_acl_table`.
+        """
+        self._query_runner = query_runner
+        self._column_names = query_runner.table_columns(DATA_TABLE)
+        fingerprint = stored_fingerprint(query_runner.db_path)
+        self._version = "" if fingerprint is None else fingerprint.sha256
+        self._queries: dict[tuple[ACLType, tuple[str, ...] | None], str] = {}
+
+    @property
+    @override
+    def version(self) -> str:
+        return self._version
+
+    def column_names(self) -> list[str]:  # noqa: D102
+        return list(self._column_names)
+
+    def _query(self, acl_type: ACLType, columns: Sequence[str] | None) -> str:
+        """The query for the ACL type and columns.
+
+        The texts are built once, so sqlite reuses the prepared statements.
+        """
+        key = (acl_type, None if columns is None else tuple(columns))
+        if key not in self._queries:
+            template = (
+                _SELECT_ALLOWED_ROWS
+                if acl_type == ACLType.DEFAULT_DENY
+                else _SELECT_NOT_EXCLUDED_ROWS
+            )
+            projection = (
+                "data.*"
+                if columns is None
+                else ", ".join(f"data.{quote_identifier(c)}" for c in columns)
+            )
+            self._queries[key] = template.format(columns=projection)
+        return self._queries[key]
+
+    @staticmethod
+    async def _load_acl_ids(
+        session: QuerySession, acl_id_chunks: list[list[str]]
+    ) -> str:
+        """Loads the ACL ids in the temporary table.
+
+        Returns:
+            The request id the ids were stored under.
+        """
+        request_id = str(uuid.uuid4())
+        try:
+            for chunk in acl_id_chunks:
+                rows = [(request_id, id_) for id_ in chunk]
+                await session.run(
+                    lambda conn: conn.executemany(_INSERT_ACL_IDS, rows)  # noqa: B023
+                )
+        except BaseException:
+            await SQLiteBackend._release_acl_ids(session, request_id)
+            raise
+        return request_id
+
+    @staticmethod
+    async def _release_acl_ids(session: QuerySession, request_id: str) -> None:
+        def release(conn: Connection) -> None:
+            conn.execute(_DELETE_ACL_IDS, (request_id,))
+            conn.commit()
+
+        await session.run(release)
+
+    async def _fetch(
+        self,
+        acl_ids: AsyncIterable[list[str]],
+        sql: str,
+        parameters: Callable[[str], Sequence[Any]],
+    ) -> list[Row]:
+        """Runs the query over the ACL ids, with the parameters of its request id.
+
+        The ids are read before taking a connection, and the rows are fetched before
+        giving it back, so that the connection is only held while sqlite works, and
+        not while waiting for OpenFGA or for the caller.
+        """
+        acl_id_chunks = [chunk async for chunk in acl_ids]
+        async with self._query_runner.session() as session:
+            request_id = await self._load_acl_ids(session, acl_id_chunks)
+            try:
+                return await session.run(
+                    lambda conn: conn.execute(sql, parameters(request_id)).fetchall()
+                )
+            finally:
+                await self._release_acl_ids(session, request_id)
+
+    async def select(  # noqa: D102
+        self,
+        acl_ids: AsyncIterable[list[str]],
+        acl_type: ACLType,
+        columns: Sequence[str] | None,
+        limit: int | None,
+        chunk_size: int,
+    ) -> AsyncGenerator[list[Row], None]:
+        rows = await self._fetch(
+            acl_ids,
+            self._query(acl_type, columns),
+            lambda request_id: (request_id, _NO_LIMIT if limit is None else limit),
+        )
+        for start in range(0, len(rows), chunk_size):
+            yield rows[start : start + chunk_size]
+
+    @override
+    async def aggregate(
+        self,
+        acl_ids: AsyncIterable[list[str]],
+        acl_type: ACLType,
+        query: AggregateQuery,
+    ) -> list[Row]:
+        visible_rows = self._query(acl_type, query.input_columns or [ID_COLUMN])
+        return await self._fetch(
+            acl_ids,
+            query.to_sql(visible_rows),
+            lambda request_id: (request_id, _NO_LIMIT, *query.sql_parameters()),
+        )
+
+    @override
+    def stats(self) -> QueryRunnerStats:
+        return self._query_runner.stats()
+
+    def close(self) -> None:  # noqa: D102
+        self._query_runner.close()
+
+
+def _typed_column(values: list[str]) -> npt.NDArray[Any]:
+    """The narrowest of int64, float64 and str able to hold every value.
+
+    Inferred like the columns of the columnar datasets, so that both backends type
+    the same file the same way.
+    """
+    kind = infer_column_kind(values)
+    if kind == ColumnKind.INT64:
+        return np.array([int(value) for value in values], dtype=np.int64)
+    if kind == ColumnKind.FLOAT64:
+        return np.array([float(value) for value in values], dtype=np.float64)
+    return np.array(values, dtype=np.str_)
+
+
+class NumPyBackend(TabularBackend):
+    """Backend keeping the dataset in memory as typed NumPy column arrays.
+
+    Ids are dictionary encoded, so filtering boils down to a vectorized membership
+    test between integer codes.
+    """
+
+    def __init__(self, columns: dict[str, npt.NDArray[Any]], version: str) -> None:
+        """Init method.
+
+        Args:
+            columns (dict[str, npt.NDArray[Any]]): The columns of the dataset, all of
+                the same length. One of them must be the id column.
+            version (str): Identifies the content of the columns.
+        """
+        if ID_COLUMN not in columns:
+            raise ValueError(f"The dataset has no '{ID_COLUMN}' column.")  # noqa: TRY003
+        self._columns = columns
+        self._version = version
+        unique_ids, self._id_codes = np.unique(
+            columns[ID_COLUMN].astype(np.str_), return_inverse=True
+        )
+        # Hash lookups are cheaper than a binary search between numpy strings.
+        self._code_by_id: dict[str, int] = {
+            id_: code for code, id_ in enumerate(unique_ids.tolist())
+        }
+
+    @classmethod
+    def from_csv(cls, csv_path: Path) -> "NumPyBackend":
+        """Loads a CSV file, inferring the type of every column but the id."""
+        with csv_path.open(newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            values: list[list[str]] = [[] for _ in header]
+            for row in reader:
+                for column_values, value in zip(values, row, strict=True):
+                    column_values.append(value)
+        columns = {
+            name: np.array(column_values, dtype=np.str_)
+            if name == ID_COLUMN
+            else _typed_column(column_values)
+            for name, column_values in zip(header, values, strict=True)
+        }
+        logger.info("Loaded {} rows from {}.", len(columns[ID_COLUMN]), csv_path)
+        return cls(columns, version=file_sha256(csv_path))
+
+    @property
+    @override
+    def version(self) -> str:
+        return self._version
+
+    def column_names(self) -> list[str]:  # noqa: D102
+        return list(self._columns)
+
+    def _visible_rows(self, acl_ids: list[str], acl_type: ACLType) -> npt.NDArray[Any]:
+        """The indices of the rows visible through the ACL."""
+        code_by_id = self._code_by_id
+        known_codes = np.fromiter(
+            (code_by_id[id_] for id_ in acl_ids if id_ in code_by_id), dtype=np.intp
+        )
+        # Same as np.isin(self._id_codes, known_codes), but codes are dense so a
+        # lookup table indexed by code avoids any sorting or hashing.
+        in_acl = np.zeros(len(code_by_id), dtype=np.bool_)
+        in_acl[known_codes] = True
+        mask = in_acl[self._id_codes]
+        if acl_type != ACLType.DEFAULT_DENY:
+            np.logical_not(mask, out=mask)
+        return np.flatnonzero(mask)
+
+    async def select(  # noqa: D102
+        self,
+        acl_ids: AsyncIterable[list[str]],
+        acl_type: ACLType,
+        columns: Sequence[str] | None,
+        limit: int | None,
+        chunk_size: int,
+    ) -> AsyncGenerator[list[Row], None]:
+        ids = [id_ async for chunk in acl_ids for id_ in chunk]
+        indices = await asyncio.to_thread(self._visible_rows, ids, acl_type)
+        selected_columns = [
+            self._columns[c] for c in (self._columns if columns is None else columns)
+        ]
+        indices = indices[:limit]
+        for start in range(0, len(indices), chunk_size):
+            chunk_indices = indices[start : start + chunk_size]
+            yield list(
+                zip(*(c[chunk_indices].tolist() for c in selected_columns), strict=True)
+            )
+
+
+class ColumnarBackend(TabularBackend):
+    """Backend reading a memory-mapped columnar file.
+
+    The ACL ids are binary searched in the sorted id index of the file, and only the
+    rows visible through the ACL are read, chunk by chunk.
+    """
+
+    def __init__(self, dataset: ColumnarDataset) -> None:
+        """Init method.
+
+        Args:
+            dataset (ColumnarDataset): The dataset, as written by `write_columnar`.
+        """
+        self._dataset = dataset
+
+    @property
+    @override
+    def version(self) -> str:
+        return self._dataset.source_version
+
+    def column_names(self) -> list[str]:  # noqa: D102
+        return self._dataset.column_names()
+
+    async def select(  # noqa: D102
+        self,
+        acl_ids: AsyncIterable[list[str]],
+        acl_type: ACLType,
+        columns: Sequence[str] | None,
+        limit: int | None,
+        chunk_size: int,
+    ) -> AsyncGenerator[list[Row], None]:
+        ids = {id_ async for chunk in acl_ids for id_ in chunk}
+        selected_columns = self.column_names() if columns is None else list(columns)
+        acl_rows = await asyncio.to_thread(self._dataset.rows_with_ids, ids)
+        if acl_type == ACLType.DEFAULT_DENY:
+            acl_rows = acl_rows[:limit]
+            row_chunks: Iterator[npt.NDArray[Any]] = (
+                acl_rows[start : start + chunk_size]
+                for start in range(0, len(acl_rows), chunk_size)
+            )
+        else:
+            row_chunks = self._dataset.rows_without(acl_rows, chunk_size)
+        remaining = limit
+        for rows in row_chunks:
+            if remaining is not None:
+                if remaining <= 0:
+                    return
+                rows = rows[:remaining]  # noqa: PLW2901
+                remaining -= len(rows)
+            yield await asyncio.to_thread(self._dataset.gather, rows, selected_columns)
+
+    def close(self) -> None:  # noqa: D102
+        self._dataset.close()
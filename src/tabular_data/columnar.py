@@ -0,0 +1,425 @@
+"""Memory-mapped columnar storage of the tabular datasets.
+
+Layout of a file, little endian:
+
+    magic (8 bytes) | header size (uint64) | header (JSON) | padding | buffers
+
+The header lists the columns and, for every buffer, its offset from the start of the
+buffers section, which is aligned to 8 bytes, and its size. The buffers are:
+
+* for `int64` and `float64` columns, the values, one per row;
+* for `str` columns, `offsets` (uint64, one per row plus one) into `data`, the
+  concatenated utf-8 encoded values;
+* for the id column, the ids as zero padded, fixed width bytes;
+* for the id index, `sorted_ids`, the ids in ascending order, and `sorted_rows`, the
+  row each of them comes from.
+
+Readers map the file instead of loading it, so the workers serving a dataset share a
+single copy of it in the page cache and only touch the pages of the rows they return.
+"""
+
+import csv
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+from collections.abc import Collection, Generator, Iterable
+from enum import StrEnum
+from pathlib import Path
+from typing import IO, Any
+
+import numpy as np
+import numpy.typing as npt
+from loguru import logger
+
+from src.tabular_data.sqlite_cache import ID_COLUMN
+
+MAGIC = b"OFGACOL1"
+_HEADER_SIZE = struct.Struct("<Q")
+_PREAMBLE_SIZE = len(MAGIC) + _HEADER_SIZE.size
+_ALIGNMENT = 8
+_WRITE_BATCH_SIZE = 65_536
+
+
+class ColumnKind(StrEnum):
+    """How the values of a column are stored."""
+
+    INT64 = "int64"
+    FLOAT64 = "float64"
+    STR = "str"
+
+
+_NUMERIC_DTYPES = {ColumnKind.INT64: "<i8", ColumnKind.FLOAT64: "<f8"}
+# At most 19 digits, the longer values can't be held anyway.
+_INT64_PATTERN = re.compile(r"[+-]?[0-9]{1,19}")
+_INT64_MIN, _INT64_MAX = int(np.iinfo(np.int64).min), int(np.iinfo(np.int64).max)
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def _parses(kind: ColumnKind, value: str) -> bool:
+    if kind == ColumnKind.INT64:
+        # `int` also accepts underscores and values `<i8` can't hold.
+        return _INT64_PATTERN.fullmatch(value) is not None and (
+            _INT64_MIN <= int(value) <= _INT64_MAX
+        )
+    try:
+        float(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _narrowest_kind(kind: ColumnKind, value: str) -> ColumnKind:
+    """The narrowest kind able to hold the values of `kind` and `value`."""
+    widening = list(ColumnKind)
+    for candidate in widening[widening.index(kind) :]:
+        if candidate == ColumnKind.STR or _parses(candidate, value):
+            return candidate
+    return ColumnKind.STR
+
+
+def infer_column_kind(values: Iterable[str]) -> ColumnKind:
+    """The narrowest kind able to hold every value."""
+    kind = ColumnKind.INT64
+    for value in values:
+        if kind == ColumnKind.STR:
+            break
+        kind = _narrowest_kind(kind, value)
+    return kind
+
+
+def _scan(csv_path: Path) -> tuple[list[str], list[ColumnKind]]:
+    """First pass over the CSV, inferring the kind of every column."""
+    with csv_path.open(newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        if ID_COLUMN not in header:
+            raise ValueError(f"{csv_path} has no '{ID_COLUMN}' column.")  # noqa: TRY003
+        kinds = [ColumnKind.INT64] * len(header)
+        for row in reader:
+            for i, value in enumerate(row):
+                if kinds[i] != ColumnKind.STR:
+                    kinds[i] = _narrowest_kind(kinds[i], value)
+    kinds[header.index(ID_COLUMN)] = ColumnKind.STR
+    return header, kinds
+
+
+class _ColumnWriter:
+    """Spools the values of a column to temporary files."""
+
+    def __init__(self, kind: ColumnKind, spool_dir: Path, index: int) -> None:
+        self.kind = kind
+        self.values: list[Any] = []
+        self.files: dict[str, IO[bytes]] = {}
+        names = ["values"] if kind in _NUMERIC_DTYPES else ["offsets", "data"]
+        for name in names:
+            self.files[name] = (spool_dir / f"{index}.{name}").open("w+b")
+        self._data_size = 0
+        if kind == ColumnKind.STR:
+            np.zeros(1, dtype="<u8").tofile(self.files["offsets"])
+
+    def append(self, value: str) -> None:
+        self.values.append(value)
+        if len(self.values) >= _WRITE_BATCH_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.kind in _NUMERIC_DTYPES:
+            np.asarray(
+                [
+                    float(v) if self.kind == ColumnKind.FLOAT64 else int(v)
+                    for v in self.values
+                ],
+                dtype=_NUMERIC_DTYPES[self.kind],
+            ).tofile(self.files["values"])
+        else:
+            encoded = [value.encode() for value in self.values]
+            sizes = np.fromiter(
+                (len(e) for e in encoded), dtype="<u8", count=len(encoded)
+            )
+            (self._data_size + np.cumsum(sizes, dtype="<u8")).tofile(
+                self.files["offsets"]
+            )
+            self._data_size += int(sizes.sum())
+            self.files["data"].write(b"".join(encoded))
+        self.values.clear()
+
+
+_Buffer = tuple[str, IO[bytes] | bytes]
+
+
+def _spool_rows(
+    csv_path: Path, id_position: int, writers: list[_ColumnWriter]
+) -> list[bytes]:
+    """Second pass over the CSV, spooling the values of the columns but the id.
+
+    Returns:
+        The ids, in the order of the rows.
+    """
+    ids: list[bytes] = []
+    with csv_path.open(newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader)
+        for row in reader:
+            ids.append(row[id_position].encode())
+            values = row[:id_position] + row[id_position + 1 :]
+            for writer, value in zip(writers, values, strict=True):
+                writer.append(value)
+    for writer in writers:
+        writer.flush()
+    return ids
+
+
+def _write_file(
+    output_path: Path, header: dict[str, Any], buffers: list[_Buffer]
+) -> None:
+    """Lays the header and the buffers out, then renames the file to `output_path`."""
+    locations: dict[str, tuple[int, int]] = {}
+    size = 0
+    for key, content in buffers:
+        content_size = len(content) if isinstance(content, bytes) else content.tell()
+        locations[key] = (size, content_size)
+        size = _aligned(size + content_size)
+    header_bytes = json.dumps({**header, "buffers": locations}).encode()
+
+    tmp_path = output_path.with_name(f"{output_path.name}.{os.getpid()}.tmp")
+    try:
+        with tmp_path.open("wb") as out:
+            out.write(MAGIC)
+            out.write(_HEADER_SIZE.pack(len(header_bytes)))
+            out.write(header_bytes)
+            data_start = _aligned(out.tell())
+            for key, content in buffers:
+                out.seek(data_start + locations[key][0])
+                if isinstance(content, bytes):
+                    out.write(content)
+                    continue
+                content.seek(0)
+                while block := content.read(1 << 20):
+                    out.write(block)
+            out.truncate(data_start + size)
+        tmp_path.replace(output_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def write_columnar(csv_path: Path, output_path: Path) -> None:
+    """Converts a CSV file to the columnar format.
+
+    The CSV is read twice, first to infer the kind of the columns then to spool their
+    values to disk. Only the ids are held in memory, to sort them. The file is written
+    next to `output_path` then renamed, so readers never see a partial file.
+    """
+    header, kinds = _scan(csv_path)
+    id_position = header.index(ID_COLUMN)
+    stat = csv_path.stat()
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=output_path.parent) as spool:
+        writers = {
+            i: _ColumnWriter(kind, Path(spool), i)
+            for i, kind in enumerate(kinds)
+            if i != id_position
+        }
+        try:
+            ids = _spool_rows(csv_path, id_position, list(writers.values()))
+            id_width = max((len(id_) for id_ in ids), default=1)
+            id_values = np.array(ids, dtype=f"S{id_width}")
+            sorted_rows = np.argsort(id_values, kind="stable").astype("<u8")
+            buffers: list[_Buffer] = [
+                (f"{id_position}:values", id_values.tobytes()),
+                ("index:sorted_ids", id_values[sorted_rows].tobytes()),
+                ("index:sorted_rows", sorted_rows.tobytes()),
+            ]
+            for i, writer in writers.items():
+                buffers.extend((f"{i}:{part}", f) for part, f in writer.files.items())
+            _write_file(
+                output_path,
+                {
+                    "row_count": len(ids),
+                    "id_width": id_width,
+                    "id_column": id_position,
+                    "columns": [
+                        {"name": name, "kind": kind}
+                        for name, kind in zip(header, kinds, strict=True)
+                    ],
+                    "source": {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns},
+                },
+                buffers,
+            )
+        finally:
+            for writer in writers.values():
+                for f in writer.files.values():
+                    f.close()
+    logger.info("Wrote {} rows of {} to {}.", len(ids), csv_path, output_path)
+
+
+def _read_header(path: Path) -> dict[str, Any]:
+    with path.open("rb") as f:
+        preamble = f.read(_PREAMBLE_SIZE)
+        if preamble[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a columnar dataset.")  # noqa: TRY003
+        (header_size,) = _HEADER_SIZE.unpack(preamble[len(MAGIC) :])
+        header: dict[str, Any] = json.loads(f.read(header_size))
+        return header
+
+
+def ensure_columnar_dataset(csv_path: Path, cache_dir: Path) -> Path:
+    """Makes sure an up to date columnar copy of the CSV exists in the cache directory.
+
+    Returns:
+        The path of the columnar file.
+    """
+    output_path = cache_dir / f"{csv_path.stem}.columnar"
+    stat = csv_path.stat()
+    try:
+        source = _read_header(output_path)["source"]
+        if source == {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}:
+            return output_path
+    except (OSError, ValueError, KeyError):
+        pass
+    logger.info("Building columnar dataset {} from {}.", output_path, csv_path)
+    write_columnar(csv_path, output_path)
+    return output_path
+
+
+class ColumnarDataset:
+    """Reads a columnar file through `mmap`."""
+
+    def __init__(self, path: Path) -> None:
+        """Init method.
+
+        Args:
+            path (Path): The file, as written by `write_columnar`.
+        """
+        self._path = path
+        header = _read_header(path)
+        with path.open("rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._data_start = _aligned(
+            _PREAMBLE_SIZE + _HEADER_SIZE.unpack_from(self._mmap, len(MAGIC))[0]
+        )
+        source = header["source"]
+        self._source_version = f"{source['size']}-{source['mtime_ns']}"
+        self._buffers: dict[str, list[int]] = header["buffers"]
+        self._row_count: int = header["row_count"]
+        self._id_column: int = header["id_column"]
+        self._column_names = [column["name"] for column in header["columns"]]
+        self._kinds = [ColumnKind(column["kind"]) for column in header["columns"]]
+        id_dtype = f"S{header['id_width']}"
+        self._ids = self._array(f"{self._id_column}:values", id_dtype)
+        self._sorted_ids = self._array("index:sorted_ids", id_dtype)
+        self._sorted_rows = self._array("index:sorted_rows", "<u8")
+
+    def _array(self, key: str, dtype: str) -> npt.NDArray[Any]:
+        offset, size = self._buffers[key]
+        item_size = np.dtype(dtype).itemsize
+        return np.frombuffer(
+            self._mmap,
+            dtype=dtype,
+            count=size // item_size,
+            offset=self._data_start + offset,
+        )
+
+    @property
+    def source_version(self) -> str:
+        """Identifies the CSV the file was written from, by its size and mtime."""
+        return self._source_version
+
+    @property
+    def row_count(self) -> int:
+        """Number of rows of the dataset."""
+        return self._row_count
+
+    def column_names(self) -> list[str]:
+        """The columns of the dataset, in order."""
+        return list(self._column_names)
+
+    def rows_with_ids(self, ids: Collection[str]) -> npt.NDArray[np.uint64]:
+        """The rows having one of the ids, in ascending order.
+
+        Ids are binary searched in the sorted id index.
+        """
+        id_width = self._sorted_ids.dtype.itemsize
+        encoded = np.unique(
+            np.array(
+                [e for e in (id_.encode() for id_ in ids) if len(e) <= id_width],
+                dtype=self._sorted_ids.dtype,
+            )
+        )
+        starts = np.searchsorted(self._sorted_ids, encoded, side="left")
+        counts = np.searchsorted(self._sorted_ids, encoded, side="right") - starts
+        total = int(counts.sum())
+        if total == 0:
+            return np.array([], dtype=np.uint64)
+        # Positions starts[i], ..., starts[i] + counts[i] - 1 for every id.
+        positions = np.repeat(starts, counts) + (
+            np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        )
+        return np.sort(self._sorted_rows[positions])
+
+    def rows_without(
+        self, excluded_rows: npt.NDArray[np.uint64], chunk_size: int
+    ) -> Generator[npt.NDArray[np.int64], None, None]:
+        """Yields, in ascending order, the rows not in `excluded_rows`.
+
+        Args:
+            excluded_rows (npt.NDArray[np.uint64]): Rows to skip, in ascending order.
+            chunk_size (int): The rows are yielded at most `chunk_size` at a time.
+        """
+        for start in range(0, self._row_count, chunk_size):
+            stop = min(start + chunk_size, self._row_count)
+            rows: npt.NDArray[np.int64] = np.arange(start, stop)
+            window = excluded_rows[
+                np.searchsorted(excluded_rows, start) : np.searchsorted(
+                    excluded_rows, stop
+                )
+            ]
+            if window.size:
+                keep = np.ones(len(rows), dtype=np.bool_)
+                keep[window.astype(np.int64) - start] = False
+                rows = rows[keep]
+            if rows.size:
+                yield rows
+
+    def _column_values(self, position: int, rows: npt.NDArray[Any]) -> list[Any]:
+        kind = self._kinds[position]
+        if position == self._id_column:
+            return [id_.decode() for id_ in self._ids[rows].tolist()]
+        if kind in _NUMERIC_DTYPES:
+            values = self._array(f"{position}:values", _NUMERIC_DTYPES[kind])
+            numbers: list[Any] = values[rows].tolist()
+            return numbers
+        offsets = self._array(f"{position}:offsets", "<u8")
+        data_start = self._data_start + self._buffers[f"{position}:data"][0]
+        return [
+            self._mmap[data_start + start : data_start + end].decode()
+            for start, end in zip(
+                offsets[rows].tolist(), offsets[rows + 1].tolist(), strict=True
+            )
+        ]
+
+    def gather(
+        self, rows: npt.NDArray[Any], columns: Iterable[str]
+    ) -> list[tuple[Any, ...]]:
+        """Reads the given rows, keeping only the given columns."""
+        positions = [self._column_names.index(column) for column in columns]
+        return list(
+            zip(*(self._column_values(p, rows) for p in positions), strict=True)
+        )
+
+    def close(self) -> None:
+        """Unmaps the file.
+
+        The mapping stays open while rows previously gathered still reference it, and
+        is then released by the garbage collector.
+        """
+        del self._ids, self._sorted_ids, self._sorted_rows
+        try:
+            self._mmap.close()
+        except BufferError:
+            logger.debug("{} is still referenced, not unmapping it.", self._path)
@@ -0,0 +1,154 @@
+"""Runs the SQLite queries of the tabular agents off the event loop."""
+
+import asyncio
+import sqlite3
+import threading
+from collections.abc import AsyncGenerator, Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, closing
+from pathlib import Path
+from typing import TypeVar
+
+from loguru import logger
+from pydantic import BaseModel
+
+from src.tabular_data.sqlite_cache import open_read_only
+
+T = TypeVar("T")
+
+
+class QueryRunnerStats(BaseModel):
+    """Usage of the connections of a `SQLiteQueryRunner`."""
+
+    pool_size: int
+    busy: int
+    waiting: int
+    max_waiting: int
+    completed_sessions: int
+
+
+class _Lane:
+    """A connection, and the single thread allowed to use it."""
+
+    def __init__(
+        self,
+        name: str,
+        db_path: Path,
+        initializer: Callable[[sqlite3.Connection], None] | None,
+    ) -> None:
+        self._db_path = db_path
+        self._initializer = initializer
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._connection: sqlite3.Connection | None = None
+
+    def _call(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        if self._connection is None:
+            logger.debug("Opening {} in {}", self._db_path, threading.current_thread())
+            self._connection = open_read_only(self._db_path)
+            if self._initializer is not None:
+                self._initializer(self._connection)
+        return fn(self._connection)
+
+    async def run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._call, fn
+        )
+
+    def _close_connection(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def close(self) -> None:
+        self._executor.submit(self._close_connection)
+        self._executor.shutdown(wait=True)
+
+
+class QuerySession:
+    """Exclusive use of one of the connections of a `SQLiteQueryRunner`.
+
+    Everything run through a session uses the same connection, so temporary tables
+    and cursors can be shared between calls.
+    """
+
+    def __init__(self, lane: _Lane) -> None:
+        """Init method."""
+        self._lane = lane
+
+    async def run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        """Runs `fn` with the connection of the session, in its thread."""
+        return await self._lane.run(fn)
+
+
+class SQLiteQueryRunner:
+    """Bounded pool of read-only connections to a SQLite file, one thread each.
+
+    Queries run in the threads of the pool, so a slow query doesn't block the event
+    loop, and concurrent requests use as many cores as there are connections. Requests
+    wait for a free connection once all of them are busy.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        pool_size: int = 4,
+        initializer: Callable[[sqlite3.Connection], None] | None = None,
+    ) -> None:
+        """Init method.
+
+        Args:
+            db_path (Path): The SQLite file to query.
+            pool_size (int): Number of connections, hence of queries running at once.
+            initializer (Callable[[sqlite3.Connection], None] | None): Called with
+                every connection right after it was opened.
+        """
+        self._db_path = db_path
+        self._lanes = [
+            _Lane(f"{db_path.stem}-{i}", db_path, initializer) for i in range(pool_size)
+        ]
+        self._free_lanes: asyncio.Queue[_Lane] = asyncio.Queue()
+        for lane in self._lanes:
+            self._free_lanes.put_nowait(lane)
+        self._waiting = 0
+        self._max_waiting = 0
+        self._completed_sessions = 0
+
+    @property
+    def db_path(self) -> Path:
+        """The SQLite file queried."""
+        return self._db_path
+
+    def table_columns(self, table: str) -> list[str]:
+        """The columns of a table, read synchronously."""
+        with closing(open_read_only(self._db_path)) as conn:
+            return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+    @asynccontextmanager
+    async def session(self) -> AsyncGenerator[QuerySession, None]:
+        """Waits for a free connection and keeps it until exiting the context."""
+        self._waiting += 1
+        self._max_waiting = max(self._max_waiting, self._waiting)
+        try:
+            lane = await self._free_lanes.get()
+        finally:
+            self._waiting -= 1
+        try:
+            yield QuerySession(lane)
+        finally:
+            self._completed_sessions += 1
+            self._free_lanes.put_nowait(lane)
+
+    def stats(self) -> QueryRunnerStats:
+        """Current usage of the pool."""
+        return QueryRunnerStats(
+            pool_size=len(self._lanes),
+            busy=len(self._lanes) - self._free_lanes.qsize(),
+            waiting=self._waiting,
+            max_waiting=self._max_waiting,
+            completed_sessions=self._completed_sessions,
+        )
+
+    def close(self) -> None:
+        """Closes every connection and stops the threads."""
+        for lane in self._lanes:
+            lane.close()
@@ -0,0 +1,158 @@
+"""On-disk SQLite copies of the CSV datasets.
+
+Each CSV is ingested once into a SQLite file with an index on `id`. The file records
+the size, modification time and hash of the CSV it was built from, and is only rebuilt
+when they change. Workers open the file read-only, so they share its pages through the
+OS cache instead of holding a private in-memory copy each.
+"""
+
+import csv
+import hashlib
+import os
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import NamedTuple
+
+from loguru import logger
+
+DATA_TABLE = "data"
+ID_COLUMN = "id"
+_META_TABLE = "_meta"
+_HASH_BLOCK_SIZE = 1 << 20
+_INSERT_BATCH_SIZE = 10_000
+
+
+class DatasetFingerprint(NamedTuple):
+    """What identifies the version of a CSV file."""
+
+    size: int
+    mtime_ns: int
+    sha256: str
+
+
+def file_sha256(path: Path) -> str:
+    """The hash of the content of a file."""
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while block := f.read(_HASH_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def quote_identifier(identifier: str) -> str:
+    """Quotes a table or column name for use in a statement."""
+    escaped = identifier.replace('"', '""')
+    return f'"{escaped}"'
+
+
+def stored_fingerprint(db_path: Path) -> DatasetFingerprint | None:
+    """The fingerprint of the CSV a dataset cache was built from, if readable."""
+    if not db_path.exists():
+        return None
+    try:
+        with closing(open_read_only(db_path)) as conn:
+            meta = dict(conn.execute(f"SELECT key, value FROM {_META_TABLE}"))  # noqa: S608
+        return DatasetFingerprint(
+            size=int(meta["size"]),
+            mtime_ns=int(meta["mtime_ns"]),
+            sha256=meta["sha256"],
+        )
+    except (sqlite3.Error, KeyError, ValueError):
+        logger.warning("Unreadable dataset cache {}, rebuilding it.", db_path)
+        return None
+
+
+def _write_fingerprint(
+    conn: sqlite3.Connection, fingerprint: DatasetFingerprint
+) -> None:
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {_META_TABLE} (key TEXT PRIMARY KEY, value TEXT)"
+    )
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {_META_TABLE} (key, value) VALUES (?, ?)",  # noqa: S608
+        [(field, str(value)) for field, value in fingerprint._asdict().items()],
+    )
+
+
+def _ingest(csv_path: Path, db_path: Path, fingerprint: DatasetFingerprint) -> None:
+    with csv_path.open(newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        if ID_COLUMN not in header:
+            raise ValueError(f"{csv_path} has no '{ID_COLUMN}' column.")  # noqa: TRY003
+        # Ids are compared with the object ids returned by OpenFGA, so they stay text.
+        # NUMERIC affinity stores the other values as numbers when they look like one.
+        columns = ", ".join(
+            f"{quote_identifier(c)} {'TEXT' if c == ID_COLUMN else 'NUMERIC'}"
+            for c in header
+        )
+        insert = f"INSERT INTO {DATA_TABLE} VALUES ({', '.join('?' * len(header))})"  # noqa: S608
+        conn = sqlite3.connect(db_path)
+        try:
+            conn.execute(f"CREATE TABLE {DATA_TABLE} ({columns})")
+            batch: list[list[str | None]] = []
+            for row in reader:
+                batch.append([value or None for value in row])
+                if len(batch) >= _INSERT_BATCH_SIZE:
+                    conn.executemany(insert, batch)
+                    batch.clear()
+            conn.executemany(insert, batch)
+            conn.execute(
+                f"CREATE INDEX {DATA_TABLE}_{ID_COLUMN} ON {DATA_TABLE} ({ID_COLUMN})"
+            )
+            _write_fingerprint(conn, fingerprint)
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def ensure_sqlite_dataset(csv_path: Path, cache_dir: Path) -> Path:
+    """Makes sure an up to date SQLite copy of the CSV exists in the cache directory.
+
+    The cheap size and modification time are compared first, the hash only when they
+    differ, so touching a file doesn't trigger a rebuild. Rebuilds are written to a
+    temporary file then renamed, so readers never see a partial database.
+
+    Returns:
+        The path of the SQLite file.
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    db_path = cache_dir / f"{csv_path.stem}.sqlite"
+    stat = csv_path.stat()
+    stored = stored_fingerprint(db_path)
+    if (
+        stored is not None
+        and stored.size == stat.st_size
+        and stored.mtime_ns == stat.st_mtime_ns
+    ):
+        logger.debug("Dataset cache {} is up to date.", db_path)
+        return db_path
+
+    fingerprint = DatasetFingerprint(
+        size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=file_sha256(csv_path)
+    )
+    if stored is not None and stored.sha256 == fingerprint.sha256:
+        logger.debug("Content of {} didn't change, updating its metadata.", csv_path)
+        with closing(sqlite3.connect(db_path)) as conn:
+            _write_fingerprint(conn, fingerprint)
+            conn.commit()
+        return db_path
+
+    logger.info("Building dataset cache {} from {}.", db_path, csv_path)
+    tmp_path = db_path.with_name(f"{db_path.name}.{os.getpid()}.tmp")
+    tmp_path.unlink(missing_ok=True)
+    try:
+        _ingest(csv_path, tmp_path, fingerprint)
+        tmp_path.replace(db_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return db_path
+
+
+def open_read_only(db_path: Path) -> sqlite3.Connection:
+    """Opens a read-only connection to a dataset cache.
+
+    Temporary tables can still be created on it.
+    """
+    return sqlite3.connect(f"{db_path.absolute().as_uri()}?mode=ro", uri=True)
@@ -0,0 +1,115 @@
+"""Tests on the admission control of the messages."""
+
+import asyncio
+from http import HTTPStatus
+
+import pytest
+
+from src.agent.admission import (
+    AdmissionController,
+    AdmissionRejectedError,
+    RejectionReason,
+)
+
+
+def _controller(**kwargs: float) -> AdmissionController:
+    options: dict[str, float] = {
+        "max_in_flight": 1,
+        "max_queued": 4,
+        "max_queued_per_user": 2,
+        "queue_timeout_seconds": 1.0,
+    }
+    options.update(kwargs)
+    return AdmissionController(
+        max_in_flight=int(options["max_in_flight"]),
+        max_queued=int(options["max_queued"]),
+        max_queued_per_user=int(options["max_queued_per_user"]),
+        queue_timeout_seconds=options["queue_timeout_seconds"],
+    )
+
+
+@pytest.mark.asyncio
+async def test_waiting_messages_take_turns_across_users() -> None:
+    """Test that a user with many waiting messages doesn't delay the others."""
+    controller = _controller()
+    admitted: list[str] = []
+    release = asyncio.Event()
+
+    async def message(user_id: str, label: str) -> None:
+        async with controller.admit(user_id):
+            admitted.append(label)
+            await release.wait()
+
+    first = asyncio.create_task(message("heavy", "heavy-1"))
+    await asyncio.sleep(0)
+    waiting = [
+        asyncio.create_task(message(user_id, label))
+        for user_id, label in (
+            ("heavy", "heavy-2"),
+            ("heavy", "heavy-3"),
+            ("light", "light-1"),
+        )
+    ]
+    await asyncio.sleep(0)
+    stats = controller.stats()
+    assert (stats.in_flight, stats.queued, stats.queued_users) == (1, 3, 2)
+
+    release.set()
+    await asyncio.gather(first, *waiting)
+    assert admitted == ["heavy-1", "heavy-2", "light-1", "heavy-3"]
+    assert controller.stats().in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_messages_are_rejected_when_they_cannot_wait() -> None:
+    """Test the rejections, and what they tell the client."""
+    controller = _controller(max_queued=3, max_queued_per_user=1)
+    release = asyncio.Event()
+
+    async def message(user_id: str) -> None:
+        async with controller.admit(user_id):
+            await release.wait()
+
+    tasks = [asyncio.create_task(message(user_id)) for user_id in ("a", "b", "c")]
+    await asyncio.sleep(0)
+
+    with pytest.raises(AdmissionRejectedError) as user_queue_full:
+        await message("b")
+    assert user_queue_full.value.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    tasks.append(asyncio.create_task(message("d")))
+    await asyncio.sleep(0)
+    with pytest.raises(AdmissionRejectedError) as queue_full:
+        await message("e")
+    assert queue_full.value.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert queue_full.value.headers == {"Retry-After": "1"}
+
+    release.set()
+    await asyncio.gather(*tasks)
+    rejected = controller.stats().rejected
+    assert rejected[RejectionReason.USER_QUEUE_FULL] == 1
+    assert rejected[RejectionReason.QUEUE_FULL] == 1
+
+
+@pytest.mark.asyncio
+async def test_messages_waiting_too_long_are_rejected() -> None:
+    """Test the queue timeout, and that cancelled waiters give their turn."""
+    controller = _controller(queue_timeout_seconds=0.01)
+    release = asyncio.Event()
+
+    async def message(user_id: str) -> None:
+        async with controller.admit(user_id):
+            await release.wait()
+
+    busy = asyncio.create_task(message("a"))
+    await asyncio.sleep(0)
+    with pytest.raises(AdmissionRejectedError) as timed_out:
+        await message("b")
+    assert timed_out.value.reason == RejectionReason.QUEUE_TIMEOUT
+
+    cancelled = asyncio.create_task(message("c"))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    release.set()
+    await busy
+    stats = controller.stats()
+    assert (stats.in_flight, stats.queued) == (0, 0)
@@ -0,0 +1,113 @@
+"""Tests on the artifacts kept within a memory budget."""
+
+from pathlib import Path
+
+import pytest
+from google.genai import types
+
+from src.agent.artifacts import BoundedArtifactService
+
+APP = "app"
+USER = "anne"
+SESSION = "s1"
+PART_SIZE = 10
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _part(text: str) -> types.Part:
+    return types.Part(text=text * PART_SIZE)
+
+
+async def _save(service: BoundedArtifactService, filename: str, text: str) -> int:
+    return await service.save_artifact(
+        app_name=APP,
+        user_id=USER,
+        session_id=SESSION,
+        filename=filename,
+        artifact=_part(text),
+    )
+
+
+async def _load(
+    service: BoundedArtifactService, filename: str, version: int | None = None
+) -> types.Part | None:
+    return await service.load_artifact(
+        app_name=APP,
+        user_id=USER,
+        session_id=SESSION,
+        filename=filename,
+        version=version,
+    )
+
+
+@pytest.mark.asyncio
+async def test_only_the_last_versions_are_kept() -> None:
+    """Test that versions keep being numbered while the oldest ones are dropped."""
+    service = BoundedArtifactService(max_resident_bytes=1_000, max_versions=2)
+    versions = [await _save(service, "context", text) for text in "abc"]
+
+    assert versions == [0, 1, 2]
+    assert await service.list_versions(
+        app_name=APP, user_id=USER, session_id=SESSION, filename="context"
+    ) == [1, 2]
+    assert await _load(service, "context", version=0) is None
+    assert await _load(service, "context") == _part("c")
+    assert service.stats().resident_bytes == 2 * PART_SIZE
+
+
+@pytest.mark.asyncio
+async def test_evicted_versions_spill_to_disk(tmp_path: Path) -> None:
+    """Test that the least recently used versions are moved to disk, then read."""
+    service = BoundedArtifactService(
+        max_resident_bytes=2 * PART_SIZE, spill_dir=tmp_path
+    )
+    for filename in ("a", "b", "c"):
+        await _save(service, filename, filename)
+
+    stats = service.stats()
+    assert stats.resident_bytes == 2 * PART_SIZE
+    assert stats.spilled_versions == 1
+    assert stats.evictions == 1
+    assert await _load(service, "a") == _part("a")
+
+    service.close()
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.asyncio
+async def test_evicted_versions_are_dropped_without_spill_dir() -> None:
+    """Test that the budget is respected by dropping versions."""
+    service = BoundedArtifactService(max_resident_bytes=2 * PART_SIZE)
+    for filename in ("a", "b", "c"):
+        await _save(service, filename, filename)
+
+    assert await _load(service, "a") is None
+    assert await service.list_artifact_keys(
+        app_name=APP, user_id=USER, session_id=SESSION
+    ) == ["b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_artifacts_expire() -> None:
+    """Test that artifacts not saved within the TTL are dropped."""
+    clock = _Clock()
+    service = BoundedArtifactService(
+        max_resident_bytes=1_000, ttl_seconds=10, clock=clock
+    )
+    await _save(service, "old", "a")
+    clock.now = 5
+    await _save(service, "recent", "b")
+    clock.now = 10
+
+    assert await _load(service, "old") is None
+    assert await _load(service, "recent") == _part("b")
+    stats = service.stats()
+    assert stats.expirations == 1
+    assert stats.resident_bytes == PART_SIZE
@@ -0,0 +1,62 @@
+"""Tests on the concurrent execution of batches of messages."""
+
+import asyncio
+
+import pytest
+
+from src.agent.batch import MessageResult, run_messages
+from src.agent.custom_types import Message
+
+MAX_CONCURRENT_MESSAGES = 2
+
+
+@pytest.mark.asyncio
+async def test_messages_run_concurrently_within_the_limit() -> None:
+    """Test the limits, the order within sessions, and failures being isolated."""
+    running = 0
+    max_running = 0
+    max_tasks = 0
+    answered: list[str] = []
+    other_answered = asyncio.Event()
+
+    async def answer(message: Message) -> str:
+        nonlocal running, max_running, max_tasks
+        running += 1
+        max_running = max(max_running, running)
+        # The test's own task, and those of the messages.
+        max_tasks = max(max_tasks, len(asyncio.all_tasks()) - 1)
+        if message.body == "slow":
+            await other_answered.wait()
+        await asyncio.sleep(0)
+        running -= 1
+        if message.body == "fail":
+            raise RuntimeError
+        answered.append(message.body)
+        if message.body == "other":
+            other_answered.set()
+        return message.body.upper()
+
+    messages = [
+        Message(body="slow", user_id="anne", session_id="s1"),
+        Message(body="after slow", user_id="anne", session_id="s1"),
+        Message(body="fail", user_id="bob"),
+        Message(body="other", user_id="bob"),
+    ]
+    results = [
+        result
+        async for result in run_messages(
+            messages, answer, max_concurrent_messages=MAX_CONCURRENT_MESSAGES
+        )
+    ]
+
+    assert max_running == MAX_CONCURRENT_MESSAGES
+    assert max_tasks == MAX_CONCURRENT_MESSAGES
+    assert answered == ["other", "slow", "after slow"]
+    # The slow message's session is answered last, as results come as they complete.
+    assert results[-1].index == 1
+    assert sorted(results, key=lambda result: result.index) == [
+        MessageResult(index=0, answer="SLOW"),
+        MessageResult(index=1, answer="AFTER SLOW"),
+        MessageResult(index=2, error="The request failed."),
+        MessageResult(index=3, answer="OTHER"),
+    ]
@@ -0,0 +1,26 @@
+"""Tests on the handoff between the document agents."""
+
+import pytest
+
+from src.agent.sub_agents.handoff import DocumentHandoff
+from src.document_data.sections import Section
+
+
+def test_handoff_is_scoped_to_the_invocation() -> None:
+    """Test invocations only see what they sent, until they release it."""
+    handoff = DocumentHandoff()
+    sections = [Section(0, "doc.txt", 0, 0, 10)]
+    handoff.send_sections("first", sections)
+    handoff.send_context("first", {"doc.txt": "content"})
+    handoff.send_sections("second", [])
+
+    assert handoff.receive_sections("first") is sections
+    assert handoff.receive_context("first") == {"doc.txt": "content"}
+    assert handoff.receive_sections("second") == []
+    with pytest.raises(RuntimeError):
+        handoff.receive_context("second")
+
+    handoff.release("first")
+    assert len(handoff) == 1
+    with pytest.raises(RuntimeError):
+        handoff.receive_sections("first")
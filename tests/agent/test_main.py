@@ -0,0 +1,158 @@
+"""Tests on the app factory of the agent server."""
+
+import asyncio
+from collections.abc import AsyncGenerator
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+from google.adk.events import Event
+from google.adk.runners import Runner
+from google.adk.sessions import BaseSessionService, InMemorySessionService
+from google.genai import types
+from httpx import ASGITransport, AsyncClient
+from openfga_sdk import ClientConfiguration, OpenFgaClient
+
+from src.agent.admission import AdmissionController
+from src.agent.custom_types import AppName, HRDataBackend, TabularBackendKind
+from src.agent.main import create_app
+from src.agent.settings import ServerSettings
+from src.ofga_operations.cache import CachedOpenFgaClient, DecisionCache
+from src.ofga_operations.watcher import ChangeWatcher
+
+WORKERS = 4
+
+
+def test_settings_round_trip_through_the_environment() -> None:
+    """Test the settings exported by the entrypoint are read back by the workers."""
+    settings = ServerSettings(
+        configuration=Path("configuration.json"),
+        hr_data_backend=TabularBackendKind.COLUMNAR,
+        workers=WORKERS,
+    )
+    environ = settings.to_env()
+    assert environ["OFGA_AGENT_WORKERS"] == str(WORKERS)
+    assert ServerSettings.from_env(environ) == settings
+    assert ServerSettings.from_env(environ, app_name="other").app_name == "other"
+
+
+def test_create_app_builds_an_injector_per_app() -> None:
+    """Test every app gets its own injector, and the routes."""
+    settings = ServerSettings(configuration=Path("configuration.json"), app_name="app")
+    first_app = create_app(settings)
+    second_app = create_app(settings)
+
+    assert first_app.state.injector is not second_app.state.injector
+    assert first_app.state.injector.get(AppName) == "app"
+    paths = {getattr(route, "path", None) for route in first_app.routes}
+    assert {"/message", "/message/stream", "/messages"} <= paths
+
+
+@pytest.mark.asyncio
+async def test_metrics_show_the_load_of_the_worker(tmp_path: Path) -> None:
+    """Test the admission, cache and connection counters are served."""
+    settings = ServerSettings(
+        configuration=Path("configuration.json"),
+        max_in_flight_messages=WORKERS,
+        tabular_cache_dir=tmp_path,
+        financial_data_backend=TabularBackendKind.NUMPY,
+    )
+    app = create_app(settings)
+    clients: dict[str, OpenFgaClient] = {
+        "cached": CachedOpenFgaClient(
+            ClientConfiguration(api_url="http://localhost:8080"),
+            decision_cache=DecisionCache(
+                max_entries=10, allow_ttl_seconds=10, deny_ttl_seconds=10
+            ),
+        ),
+        "plain": OpenFgaClient(ClientConfiguration(api_url="http://localhost:8080")),
+    }
+    binder = app.state.injector.binder
+    # Instead of those of the configuration, which needs a server.
+    del binder._bindings[dict[str, OpenFgaClient]]  # noqa: SLF001
+    binder.multibind(dict[str, OpenFgaClient], to=clients)
+    binder.bind(ChangeWatcher, to=ChangeWatcher(clients, enabled=False))
+    async with AsyncClient(
+        transport=ASGITransport(app), base_url="http://test"
+    ) as http_client:
+        response = await http_client.get("/metrics")
+    for client in clients.values():
+        await client.close()
+    app.state.injector.get(HRDataBackend).close()
+
+    assert response.status_code == HTTPStatus.OK
+    metrics = response.json()
+    assert metrics["admission"]["max_in_flight"] == WORKERS
+    assert metrics["admission"]["queued"] == 0
+    assert metrics["artifacts"]["resident_bytes"] == 0
+    assert metrics["decision_caches"]["cached"]["size"] == 0
+    assert metrics["decision_caches"]["plain"] is None
+    assert metrics["tabular_results"]["hits"] == 0
+    assert metrics["tabular_queries"]["hr"]["pool_size"] == (
+        settings.tabular_query_pool_size
+    )
+    assert metrics["tabular_queries"]["financial"] is None
+
+
+def test_batches_are_bounded() -> None:
+    """Test batches holding too many messages are rejected before being answered."""
+    settings = ServerSettings(
+        configuration=Path("configuration.json"), max_batch_messages=1
+    )
+    message = {"body": "hi", "user_id": "anne"}
+    response = TestClient(create_app(settings)).post(
+        "/messages", json={"messages": [message, message]}
+    )
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+class _Runner:
+    """Answers right away, recording the messages in flight meanwhile."""
+
+    def __init__(self, admission: AdmissionController) -> None:
+        self.admission = admission
+        self.in_flight: list[int] = []
+
+    async def run_async(self, **_: Any) -> AsyncGenerator[Event, None]:  # noqa: ANN401
+        self.in_flight.append(self.admission.stats().in_flight)
+        # Lets the other messages try to get in meanwhile.
+        await asyncio.sleep(0)
+        yield Event(
+            author="agent",
+            content=types.Content(role="model", parts=[types.Part(text="done")]),
+        )
+
+
+def test_every_message_is_admitted() -> None:
+    """Test the batches and the streams go through the admission control."""
+    settings = ServerSettings(
+        configuration=Path("configuration.json"),
+        max_in_flight_messages=1,
+        max_queued_messages=0,
+    )
+    app = create_app(settings)
+    admission = app.state.injector.get(AdmissionController)
+    runner = _Runner(admission)
+    app.state.injector.binder.bind(Runner, to=runner)
+    app.state.injector.binder.bind(BaseSessionService, to=InMemorySessionService())
+    client = TestClient(app)
+
+    streamed = client.post("/message/stream", json={"body": "hi", "user_id": "anne"})
+    assert streamed.status_code == HTTPStatus.OK
+    assert '"answer": "done"' in streamed.text
+    message = {"body": "hi", "user_id": "anne"}
+    answered = client.post("/messages", json={"messages": [message, message]})
+    assert answered.status_code == HTTPStatus.OK
+    results = answered.json()["results"]
+    assert [result["answer"] for result in results].count("done") == 1
+    assert [result["error"] for result in results].count(
+        "Message rejected: queue_full."
+    ) == 1
+
+    # The stream and the answered message held the only slot.
+    assert runner.in_flight == [1, 1]
+    stats = admission.stats()
+    assert (stats.in_flight, stats.admitted) == (0, 2)
@@ -0,0 +1,177 @@
+"""Tests on the sessions kept in SQLite."""
+
+from collections.abc import AsyncGenerator
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+from google.adk.events import Event, EventActions
+from google.adk.sessions.base_session_service import GetSessionConfig
+
+from src.agent.sessions import SQLiteSessionService
+
+APP = "app"
+USER = "anne"
+TTL_SECONDS = 60.0
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> _Clock:
+    """A clock the tests move forward."""
+    return _Clock()
+
+
+def _service(db_path: Path, clock: _Clock, **kwargs: int) -> SQLiteSessionService:
+    return SQLiteSessionService(
+        db_path,
+        ttl_seconds=TTL_SECONDS,
+        flush_interval_seconds=60,
+        clock=clock,
+        **kwargs,
+    )
+
+
+@pytest_asyncio.fixture
+async def service(
+    tmp_path: Path, clock: _Clock
+) -> AsyncGenerator[SQLiteSessionService, None]:
+    """A session service on a fresh file."""
+    service = _service(tmp_path / "sessions.sqlite3", clock)
+    yield service
+    await service.close()
+
+
+def _event(clock: _Clock, text: str, state_delta: dict | None = None) -> Event:
+    return Event(
+        author="user",
+        timestamp=clock.now,
+        custom_metadata={"text": text},
+        actions=EventActions(state_delta=state_delta or {}),
+    )
+
+
+@pytest.mark.asyncio
+async def test_sessions_are_shared_through_the_file(
+    tmp_path: Path, clock: _Clock, service: SQLiteSessionService
+) -> None:
+    """Test that another worker sees the events and the state once written."""
+    session = await service.create_session(
+        app_name=APP, user_id=USER, session_id="s1", state={"topic": "todos"}
+    )
+    for text in ("first", "second"):
+        clock.now += 1
+        await service.append_event(
+            session,
+            _event(clock, text, {"last": text, "user:language": "it", "temp:x": 1}),
+        )
+
+    other_worker = _service(tmp_path / "sessions.sqlite3", clock)
+    try:
+        # Nothing is written yet.
+        assert (
+            await other_worker.get_session(app_name=APP, user_id=USER, session_id="s1")
+            is None
+        )
+        await service.flush()
+        shared = await other_worker.get_session(
+            app_name=APP, user_id=USER, session_id="s1"
+        )
+        assert shared is not None
+        assert [e.custom_metadata for e in shared.events] == [
+            {"text": "first"},
+            {"text": "second"},
+        ]
+        assert shared.state == {
+            "topic": "todos",
+            "last": "second",
+            "user:language": "it",
+        }
+
+        # The first worker reloads its cached copy once the other updated it.
+        clock.now += 1
+        await other_worker.append_event(shared, _event(clock, "third"))
+        await other_worker.flush()
+        updated = await service.get_session(
+            app_name=APP,
+            user_id=USER,
+            session_id="s1",
+            config=GetSessionConfig(num_recent_events=2),
+        )
+        assert updated is not None
+        assert [e.custom_metadata for e in updated.events] == [
+            {"text": "second"},
+            {"text": "third"},
+        ]
+    finally:
+        await other_worker.close()
+
+
+@pytest.mark.asyncio
+async def test_pending_events_are_written_when_too_many(
+    tmp_path: Path, clock: _Clock
+) -> None:
+    """Test that events are written in batches of at most `max_pending_events`."""
+    db_path = tmp_path / "sessions.sqlite3"
+    service = _service(db_path, clock, max_pending_events=2)
+    other_worker = _service(db_path, clock)
+    try:
+        session = await service.create_session(app_name=APP, user_id=USER)
+        await service.append_event(session, _event(clock, "first"))
+        await service.append_event(session, _event(clock, "second"))
+        shared = await other_worker.get_session(
+            app_name=APP, user_id=USER, session_id=session.id
+        )
+        assert shared is not None
+        assert len(shared.events) == 2  # noqa: PLR2004
+    finally:
+        await service.close()
+        await other_worker.close()
+
+
+@pytest.mark.asyncio
+async def test_cache_is_bounded(tmp_path: Path, clock: _Clock) -> None:
+    """Test that evicted sessions are reloaded from the file."""
+    service = _service(tmp_path / "sessions.sqlite3", clock, max_cached_sessions=1)
+    try:
+        first = await service.create_session(app_name=APP, user_id=USER)
+        await service.append_event(first, _event(clock, "first"))
+        await service.create_session(app_name=APP, user_id=USER)
+        assert len(service._cache) == 1  # noqa: SLF001
+        reloaded = await service.get_session(
+            app_name=APP, user_id=USER, session_id=first.id
+        )
+        assert reloaded is not None
+        assert [e.custom_metadata for e in reloaded.events] == [{"text": "first"}]
+    finally:
+        await service.close()
+
+
+@pytest.mark.asyncio
+async def test_idle_sessions_expire(
+    clock: _Clock, service: SQLiteSessionService
+) -> None:
+    """Test that sessions idle for longer than the TTL are gone."""
+    idle = await service.create_session(app_name=APP, user_id=USER)
+    active = await service.create_session(app_name=APP, user_id=USER)
+    clock.now += TTL_SECONDS
+    await service.append_event(active, _event(clock, "still here"))
+    clock.now += 1
+
+    listed = await service.list_sessions(app_name=APP, user_id=USER)
+    assert [s.id for s in listed.sessions] == [active.id]
+    assert (
+        await service.get_session(app_name=APP, user_id=USER, session_id=idle.id)
+        is None
+    )
+    assert (
+        await service.get_session(app_name=APP, user_id=USER, session_id=active.id)
+        is not None
+    )
@@ -0,0 +1,56 @@
+"""Tests on the Server-Sent Events streamed by the agent."""
+
+import json
+from collections.abc import AsyncGenerator
+
+import pytest
+from google.adk.events import Event
+from google.genai import types
+
+from src.agent.streaming import server_sent_events
+
+
+def _event(author: str, text: str, *, partial: bool = False) -> Event:
+    return Event(
+        author=author,
+        partial=partial,
+        content=types.Content(role="model", parts=[types.Part(text=text)]),
+    )
+
+
+def _parse(server_sent_event: str) -> tuple[str, dict[str, object]]:
+    kind_line, data_line = server_sent_event.strip().split("\n")
+    return kind_line.removeprefix("event: "), json.loads(
+        data_line.removeprefix("data: ")
+    )
+
+
+async def _run(*, fail: bool) -> AsyncGenerator[Event, None]:  # noqa: RUF029
+    yield Event(author="filter_agent", custom_metadata={"filtered_files": True})
+    yield _event("RAGAgent", "{}")
+    yield _event("answering_agent", "Hel", partial=True)
+    if fail:
+        raise RuntimeError
+    yield _event("answering_agent", "lo", partial=True)
+    yield _event("answering_agent", "Hello")
+
+
+@pytest.mark.asyncio
+async def test_events_are_streamed_then_the_answer() -> None:
+    """Test progress, partial and complete responses, then the last one as answer."""
+    streamed = [_parse(e) async for e in server_sent_events(_run(fail=False))]
+    assert streamed == [
+        ("progress", {"author": "filter_agent", "metadata": {"filtered_files": True}}),
+        ("message", {"author": "RAGAgent", "text": "{}"}),
+        ("token", {"author": "answering_agent", "text": "Hel"}),
+        ("token", {"author": "answering_agent", "text": "lo"}),
+        ("message", {"author": "answering_agent", "text": "Hello"}),
+        ("answer", {"answer": "Hello"}),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_failures_end_the_stream_with_an_error() -> None:
+    """Test a failing run ends with an error event instead of an answer."""
+    streamed = [_parse(e) async for e in server_sent_events(_run(fail=True))]
+    assert [kind for kind, _ in streamed] == ["progress", "message", "token", "error"]
@@ -0,0 +1,236 @@
+"""Tests on the tabular agents."""
+
+import json
+from collections.abc import AsyncGenerator, AsyncIterable, Sequence
+from typing import Any
+
+import pytest
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.artifacts import InMemoryArtifactService
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+from openfga_sdk import ClientConfiguration, OpenFgaClient
+from pydantic import ValidationError
+
+from src.agent.custom_types import (
+    FinancialDataBackend,
+    TabularResultMode,
+    TabularResultOptions,
+)
+from src.agent.sub_agents.tabular_agent import (
+    FilterTabulerAgentDefaultAllow,
+    TabularResultCache,
+    TabularResultCacheKey,
+)
+from src.ofga_operations.watcher import Invalidation, InvalidationKind, StoreChanges
+from src.tabular_data.aggregates import AggregateQuery, Row
+from src.tabular_data.backends import ACLType, TabularBackend
+
+STORE_ID = "01HVMMBCMGZNT3SED4Z17ECXCA"
+MAX_ROWS = 4
+CHUNK_SIZE = 2
+
+
+class _ListBackend(TabularBackend):
+    """Every row is visible, whatever the ACL."""
+
+    def __init__(self, row_count: int) -> None:
+        self._rows = [(str(i), i) for i in range(row_count)]
+
+    @property
+    def version(self) -> str:
+        return "version"
+
+    def column_names(self) -> list[str]:  # noqa: PLR6301
+        return ["id", "amount"]
+
+    async def select(
+        self,
+        acl_ids: AsyncIterable[list[str]],  # noqa: ARG002
+        acl_type: ACLType,  # noqa: ARG002
+        columns: Sequence[str] | None,  # noqa: ARG002
+        limit: int | None,
+        chunk_size: int,
+    ) -> AsyncGenerator[list[Row], None]:
+        rows = self._rows[:limit]
+        for start in range(0, len(rows), chunk_size):
+            yield rows[start : start + chunk_size]
+
+
+def _key(user_id: str, store_id: str = STORE_ID) -> TabularResultCacheKey:
+    return TabularResultCacheKey(
+        agent_name="FinancialAgent",
+        store_id=store_id,
+        authorization_model_id="model",
+        user_id=user_id,
+        dataset_version="version",
+        question="",
+    )
+
+
+def test_result_cache_eviction_and_expiry() -> None:
+    """Test results are evicted by size, least recently used first, and expire."""
+    now = [0.0]
+    cache = TabularResultCache(max_bytes=10, ttl_seconds=5, clock=lambda: now[0])
+    cache.put(_key("anne"), ["abcd"])
+    cache.put(_key("bob"), ["ef", "gh"])
+    assert cache.get(_key("anne")) == ["abcd"]
+
+    cache.put(_key("chris"), ["ijkl"])
+    assert cache.get(_key("bob")) is None
+    assert cache.get(_key("anne")) == ["abcd"]
+    cache.put(_key("dana"), ["x" * 11])
+    assert cache.get(_key("dana")) is None
+
+    now[0] = 5
+    assert cache.get(_key("chris")) is None
+    stats = cache.stats()
+    assert (stats.hits, stats.evictions, stats.size) == (2, 1, 1)
+
+
+def test_result_cache_invalidation() -> None:
+    """Test changes drop the results of their users, or of the whole store."""
+    cache = TabularResultCache(max_bytes=100, ttl_seconds=5)
+    keys = [_key("anne"), _key("bob"), _key("anne", store_id="other_store")]
+    for key in keys:
+        cache.put(key, ["rows"])
+
+    cache.on_store_changes(
+        StoreChanges(
+            store_id=STORE_ID,
+            changes=[],
+            invalidations=frozenset({
+                Invalidation(InvalidationKind.OBJECT, "item:a"),
+                Invalidation(InvalidationKind.USER, "user:anne"),
+            }),
+        )
+    )
+    assert [cache.get(key) for key in keys] == [None, ["rows"], ["rows"]]
+
+    cache.on_store_changes(
+        StoreChanges(
+            store_id=STORE_ID,
+            changes=[],
+            invalidations=frozenset({Invalidation(InvalidationKind.GROUP, "group:a")}),
+        )
+    )
+    assert [cache.get(key) for key in keys] == [None, None, ["rows"]]
+
+
+async def _chunks(row_count: int) -> list[dict[str, Any]]:
+    client = OpenFgaClient(
+        ClientConfiguration(api_url="http://localhost:8080", store_id=STORE_ID)
+    )
+    agent = FilterTabulerAgentDefaultAllow(
+        backend=FinancialDataBackend(_ListBackend(row_count)),
+        ofga_client=client,
+        description="Financial data.",
+        result_options=TabularResultOptions(
+            mode=TabularResultMode.CHUNKED, max_rows=MAX_ROWS, chunk_size=CHUNK_SIZE
+        ),
+    )
+    session_service = InMemorySessionService()
+    ctx = InvocationContext(
+        session_service=session_service,
+        artifact_service=InMemoryArtifactService(),
+        invocation_id="invocation",
+        agent=agent,
+        session=await session_service.create_session(app_name="app", user_id="anne"),
+    )
+    try:
+        return [
+            json.loads(event.content.parts[0].text or "")
+            async for event in agent.run_async(ctx)
+            if event.content and event.content.parts
+        ]
+    finally:
+        await client.close()
+
+
+def _summary(chunks: list[dict[str, Any]]) -> list[tuple[int, int, bool, bool]]:
+    return [
+        (c["chunk_index"], len(c["rows"]), c["is_last"], c["truncated"]) for c in chunks
+    ]
+
+
+@pytest.mark.asyncio
+async def test_chunks_of_exactly_max_rows_rows_are_complete() -> None:
+    """Test the last chunk is flagged, without truncation."""
+    assert _summary(await _chunks(MAX_ROWS)) == [
+        (0, 2, False, False),
+        (1, 2, True, False),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_chunks_beyond_max_rows_are_truncated() -> None:
+    """Test the extra row is dropped, and flags the result as truncated."""
+    assert _summary(await _chunks(MAX_ROWS + 1)) == [
+        (0, 2, False, False),
+        (1, 2, True, True),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_empty_result_is_a_single_last_chunk() -> None:
+    """Test an empty result still tells the client it is complete."""
+    chunks = await _chunks(0)
+    assert _summary(chunks) == [(0, 0, True, False)]
+    assert chunks[0]["columns"] == ["id", "amount"]
+
+
+def test_max_rows_must_be_positive() -> None:
+    """Test a row cap of zero is refused rather than returning empty chunks."""
+    with pytest.raises(ValidationError):
+        TabularResultOptions(mode=TabularResultMode.CHUNKED, max_rows=0)
+
+
+class _CountingPlannerAgent(FilterTabulerAgentDefaultAllow):
+    """Counts the questions planned, which ask for rows rather than aggregates."""
+
+    planned: int = 0
+
+    async def _plan_query(self, ctx: InvocationContext) -> AggregateQuery | None:  # noqa: ARG002
+        self.planned += 1
+        return None
+
+
+@pytest.mark.asyncio
+async def test_cached_results_skip_the_planner() -> None:
+    """Test a repeated question is answered from the cache before it is planned."""
+    client = OpenFgaClient(
+        ClientConfiguration(api_url="http://localhost:8080", store_id=STORE_ID)
+    )
+    agent = _CountingPlannerAgent(
+        backend=FinancialDataBackend(_ListBackend(MAX_ROWS)),
+        ofga_client=client,
+        description="Financial data.",
+        query_planner_model="gemini-2.0-flash",
+        result_cache=TabularResultCache(max_bytes=1000, ttl_seconds=60),
+    )
+    session_service = InMemorySessionService()
+    session = await session_service.create_session(app_name="app", user_id="anne")
+
+    async def ask(question: str) -> list[str]:
+        ctx = InvocationContext(
+            session_service=session_service,
+            artifact_service=InMemoryArtifactService(),
+            invocation_id="invocation",
+            agent=agent,
+            session=session,
+            user_content=types.Content(role="user", parts=[types.Part(text=question)]),
+        )
+        return [
+            event.content.parts[0].text or ""
+            async for event in agent.run_async(ctx)
+            if event.content and event.content.parts
+        ]
+
+    try:
+        first = await ask("What are the amounts?")
+        assert await ask("  what are the  AMOUNTS? ") == first
+        assert agent.planned == 1
+        await ask("Which ids are there?")
+        assert agent.planned == 2  # noqa: PLR2004
+    finally:
+        await client.close()
@@ -0,0 +1,77 @@
+"""Tests on the BM25 retrieval."""
+
+from pathlib import Path
+
+from src.document_data.bm25 import BM25Retriever, tokenize
+from src.document_data.corpus import PackedCorpus
+
+
+def test_tokenize() -> None:
+    """Test hyphenated words and plurals."""
+    assert tokenize("My To-Do items, class") == [
+        "my",
+        "to",
+        "do",
+        "todo",
+        "item",
+        "class",
+    ]
+
+
+def test_search_ranks_relevant_documents(tmp_path: Path) -> None:
+    """Test the ranking, top k, and the reuse of the persisted index."""
+    directory = tmp_path / "documents"
+    directory.mkdir()
+    (directory / "todo.txt").write_text("A to-do list: todo items.", encoding="utf-8")
+    (directory / "ci.txt").write_text("Set up CI with a todo.", encoding="utf-8")
+    (directory / "other.txt").write_text("Nothing relevant.", encoding="utf-8")
+    index_path = tmp_path / "cache" / "index.json"
+    corpus = PackedCorpus(directory, tmp_path / "cache" / "documents.packed")
+    retriever = BM25Retriever(corpus, index_path)
+    retriever.refresh()
+
+    matches = retriever.search("What are my todos?", top_k=5)
+    assert [match.section.name for match in matches] == ["todo.txt", "ci.txt"]
+    assert matches[0].score > matches[1].score
+    assert len(retriever.search("todos", top_k=1)) == 1
+    assert retriever.search("unknown", top_k=5) == []
+
+    index_mtime_ns = index_path.stat().st_mtime_ns
+    other_retriever = BM25Retriever(
+        PackedCorpus(directory, tmp_path / "cache" / "documents.packed"), index_path
+    )
+    other_retriever.refresh()
+    assert index_path.stat().st_mtime_ns == index_mtime_ns
+    assert other_retriever.search("What are my todos?", top_k=5) == matches
+
+
+def test_search_ranks_sections(tmp_path: Path) -> None:
+    """Test the sections of a document are ranked on their own."""
+    directory = tmp_path / "documents"
+    directory.mkdir()
+    (directory / "notes.txt").write_text(
+        "Groceries: milk and eggs.\n\nMy todo list: file taxes.", encoding="utf-8"
+    )
+    corpus = PackedCorpus(directory, tmp_path / "cache" / "documents.packed")
+    retriever = BM25Retriever(corpus, tmp_path / "index.json", max_section_bytes=30)
+    retriever.refresh()
+
+    [match] = retriever.search("todos", top_k=5)
+    assert match.section.object_id == "notes.txt/s1"
+    assert (
+        corpus.text(match.section.doc_id, match.section.start, match.section.end)
+        == "My todo list: file taxes."
+    )
+
+
+def test_search_skips_invalid_utf8(tmp_path: Path) -> None:
+    """Test a file that isn't valid UTF-8 doesn't break the index."""
+    directory = tmp_path / "documents"
+    directory.mkdir()
+    (directory / "latin1.txt").write_bytes("Caf\xe9 todo list.".encode("latin-1"))
+    corpus = PackedCorpus(directory, tmp_path / "cache" / "documents.packed")
+    retriever = BM25Retriever(corpus, tmp_path / "index.json")
+    retriever.refresh()
+
+    [match] = retriever.search("todos", top_k=5)
+    assert match.section.name == "latin1.txt"
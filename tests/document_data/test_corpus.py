@@ -0,0 +1,46 @@
+"""Tests on the packed document corpus."""
+
+import os
+from pathlib import Path
+
+from src.document_data.corpus import DocumentHandle, PackedCorpus
+
+
+def test_refresh_keeps_ids_and_reuses_the_packed_file(tmp_path: Path) -> None:
+    """Test changes to the directory are picked up, and ids survive them."""
+    directory = tmp_path / "documents"
+    directory.mkdir()
+    (directory / "a.txt").write_text("first", encoding="utf-8")
+    (directory / "b.txt").write_text("second", encoding="utf-8")
+    packed_path = tmp_path / "cache" / "documents.packed"
+    corpus = PackedCorpus(directory, packed_path)
+
+    assert corpus.refresh()
+    assert not corpus.refresh()
+    assert corpus.documents() == [
+        DocumentHandle(0, "a.txt"),
+        DocumentHandle(1, "b.txt"),
+    ]
+    assert bytes(corpus.content(1) or b"") == b"second"
+
+    (directory / "a.txt").unlink()
+    b_path = directory / "b.txt"
+    b_path.write_text("second, edited", encoding="utf-8")
+    os.utime(b_path, ns=(0, 0))
+    (directory / "c.txt").write_text("third", encoding="utf-8")
+    assert corpus.refresh()
+    assert corpus.documents() == [
+        DocumentHandle(1, "b.txt"),
+        DocumentHandle(2, "c.txt"),
+    ]
+    assert corpus.text(0) is None
+    assert corpus.text(1) == "second, edited"
+    assert corpus.text(2) == "third"
+
+    # Another worker maps the file built by the first one.
+    packed_mtime_ns = packed_path.stat().st_mtime_ns
+    other_corpus = PackedCorpus(directory, packed_path)
+    assert other_corpus.refresh()
+    assert packed_path.stat().st_mtime_ns == packed_mtime_ns
+    assert other_corpus.documents() == corpus.documents()
+    assert other_corpus.text(2) == "third"
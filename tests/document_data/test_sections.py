@@ -0,0 +1,30 @@
+"""Tests on the sections of the documents."""
+
+from src.document_data.sections import fit_token_budget, split_sections
+
+
+def test_split_sections_merges_paragraphs_and_cuts_long_ones() -> None:
+    """Test paragraphs are merged up to the maximum size, and cut past it."""
+    content = "First one.\n\nSecond.\n\n\n  \nA much longer paragraph, été.".encode()
+    sections = [content[start:end] for start, end in split_sections(content, 20)]
+    assert sections == [
+        b"First one.\n\nSecond.",
+        b"A much longer ",
+        "paragraph, été.".encode(),
+    ]
+    assert split_sections(b"\n\n  \n", 20) == []
+
+    # Without whitespaces, cuts never split a character.
+    unbroken = "éééé".encode()
+    assert [unbroken[start:end] for start, end in split_sections(unbroken, 3)] == [
+        "é".encode()
+    ] * 4
+
+
+def test_fit_token_budget_skips_what_does_not_fit() -> None:
+    """Test texts are kept in order, skipping the ones too long for what is left."""
+    assert fit_token_budget(["a" * 8, "b" * 12, "c" * 4, "d"], token_budget=3) == [
+        0,
+        2,
+    ]
+    assert fit_token_budget(["a" * 20], token_budget=4) == []
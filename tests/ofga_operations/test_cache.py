@@ -0,0 +1,163 @@
+"""Tests on the decision cache."""
+
+from collections.abc import AsyncGenerator
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+import pytest_asyncio
+from openfga_sdk import ClientConfiguration, OpenFgaClient
+from openfga_sdk.client import ClientCheckRequest
+from openfga_sdk.client.models import (
+    ClientBatchCheckItem,
+    ClientBatchCheckRequest,
+    ClientBatchCheckResponse,
+    ClientBatchCheckSingleResponse,
+)
+from openfga_sdk.models.check_response import CheckResponse
+
+from src.ofga_operations.cache import (
+    CachedOpenFgaClient,
+    DecisionCache,
+    DecisionCacheKey,
+)
+from src.ofga_operations.checks import can_user_read, can_user_read_many
+
+STORE_ID = "01HVMMBCMGZNT3SED4Z17ECXCA"
+
+
+class _FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _key(object_id: str) -> DecisionCacheKey:
+    return DecisionCacheKey(
+        store_id=STORE_ID,
+        authorization_model_id=None,
+        user="user:anne",
+        relation="can_read",
+        object=f"item:{object_id}",
+    )
+
+
+@pytest_asyncio.fixture
+async def cached_client() -> AsyncGenerator[CachedOpenFgaClient, None]:
+    """Fixture to create a caching client."""
+    client = CachedOpenFgaClient(
+        ClientConfiguration(api_url="http://localhost:8080", store_id=STORE_ID),
+        decision_cache=DecisionCache(
+            max_entries=100, allow_ttl_seconds=10, deny_ttl_seconds=10
+        ),
+    )
+    yield client
+    await client.close()
+
+
+def test_decision_cache_ttls() -> None:
+    """Test allowed and denied decisions expire independently."""
+    clock = _FakeClock()
+    cache = DecisionCache(
+        max_entries=10, allow_ttl_seconds=5, deny_ttl_seconds=1, clock=clock
+    )
+    cache.put(_key("allowed"), True)  # noqa: FBT003
+    cache.put(_key("denied"), False)  # noqa: FBT003
+
+    assert cache.get(_key("allowed")) is True
+    assert cache.get(_key("denied")) is False
+
+    clock.now = 2
+    assert cache.get(_key("allowed")) is True
+    assert cache.get(_key("denied")) is None
+
+    clock.now = 6
+    assert cache.get(_key("allowed")) is None
+
+    stats = cache.stats()
+    assert stats.hits == 3  # noqa: PLR2004
+    assert stats.misses == 2  # noqa: PLR2004
+    assert stats.size == 0
+
+
+def test_decision_cache_evicts_least_recently_used() -> None:
+    """Test the cache never grows beyond its bound."""
+    cache = DecisionCache(max_entries=2, allow_ttl_seconds=5, deny_ttl_seconds=5)
+    cache.put(_key("a"), True)  # noqa: FBT003
+    cache.put(_key("b"), True)  # noqa: FBT003
+    assert cache.get(_key("a")) is True
+    cache.put(_key("c"), True)  # noqa: FBT003
+
+    assert cache.get(_key("b")) is None
+    assert cache.get(_key("a")) is True
+    assert cache.get(_key("c")) is True
+    assert cache.stats().evictions == 1
+
+
+@pytest.mark.asyncio
+async def test_cached_client_check(
+    monkeypatch: pytest.MonkeyPatch, cached_client: CachedOpenFgaClient
+) -> None:
+    """Test repeated checks are only sent once to the server."""
+    server_check = AsyncMock(return_value=CheckResponse(allowed=True, resolution=""))
+    monkeypatch.setattr(OpenFgaClient, "check", server_check)
+
+    assert await can_user_read(cached_client, "anne", "doc1") is True
+    assert await can_user_read(cached_client, "anne", "doc1") is True
+
+    server_check.assert_awaited_once()
+    assert cached_client.decision_cache.stats().hits == 1
+
+
+@pytest.mark.asyncio
+async def test_cached_client_skips_contextual_checks(
+    monkeypatch: pytest.MonkeyPatch, cached_client: CachedOpenFgaClient
+) -> None:
+    """Test checks with contextual tuples bypass the cache."""
+    server_check = AsyncMock(return_value=CheckResponse(allowed=True, resolution=""))
+    monkeypatch.setattr(OpenFgaClient, "check", server_check)
+    request = ClientCheckRequest(
+        user="user:anne",
+        relation="can_read",
+        object="item:doc1",
+        context={"ip": "127.0.0.1"},
+    )
+
+    await cached_client.check(request)
+    await cached_client.check(request)
+
+    assert server_check.await_count == 2  # noqa: PLR2004
+    assert cached_client.decision_cache.stats().size == 0
+
+
+@pytest.mark.asyncio
+async def test_cached_client_batch_check_only_sends_misses(
+    monkeypatch: pytest.MonkeyPatch, cached_client: CachedOpenFgaClient
+) -> None:
+    """Test batch checks only carry the decisions the cache doesn't know."""
+    cached_client.decision_cache.put(_key("doc1"), True)  # noqa: FBT003
+
+    def _server_batch_check(
+        _self: OpenFgaClient, body: ClientBatchCheckRequest, _options: object = None
+    ) -> ClientBatchCheckResponse:
+        return ClientBatchCheckResponse([
+            ClientBatchCheckSingleResponse(
+                allowed=False, request=MagicMock(), correlation_id=c.correlation_id
+            )
+            for c in body.checks
+        ])
+
+    server_batch_check = AsyncMock(side_effect=_server_batch_check)
+    monkeypatch.setattr(
+        OpenFgaClient,
+        "batch_check",
+        lambda self, body, options=None: server_batch_check(self, body, options),
+    )
+
+    result = await can_user_read_many(cached_client, "anne", ["doc1", "doc2"])
+
+    assert result == {"doc1": True, "doc2": False}
+    sent_checks: list[ClientBatchCheckItem] = server_batch_check.call_args[0][1].checks
+    assert [c.object for c in sent_checks] == ["item:doc2"]
+    assert cached_client.decision_cache.get(_key("doc2")) is False
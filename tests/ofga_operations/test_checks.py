@@ -1,14 +1,21 @@
 """Tests on check operations."""
 
-from unittest.mock import AsyncMock
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
 import pytest_asyncio
 from openfga_sdk import OpenFgaClient
 from openfga_sdk.client import ClientCheckRequest
+from openfga_sdk.client.models import (
+    ClientBatchCheckRequest,
+    ClientBatchCheckResponse,
+    ClientBatchCheckSingleResponse,
+)
+from openfga_sdk.exceptions import NotFoundException
+from openfga_sdk.models.check_error import CheckError
 from openfga_sdk.models.check_response import CheckResponse
 
-from src.ofga_operations.checks import can_user_read
+from src.ofga_operations.checks import can_user_read, can_user_read_many
 
 
 @pytest_asyncio.fixture
@@ -89,3 +96,64 @@ async def test_can_user_read_custom_relation_and_object_type(
     assert called_with_request.user == f"user:{user_id}"
     assert called_with_request.relation == custom_relation
     assert called_with_request.object == f"{custom_object_type}:{document_id}"
+
+
+@pytest.mark.asyncio
+async def test_can_user_read_many_uses_batch_check(
+    mock_openfga_client: AsyncMock,
+) -> None:
+    """Test can_user_read_many maps the batch check results back to the ids."""
+    mock_openfga_client.batch_check.return_value = ClientBatchCheckResponse([
+        ClientBatchCheckSingleResponse(
+            allowed=True, request=MagicMock(), correlation_id="1"
+        ),
+        ClientBatchCheckSingleResponse(
+            allowed=False, request=MagicMock(), correlation_id="0"
+        ),
+        ClientBatchCheckSingleResponse(
+            allowed=True,
+            request=MagicMock(),
+            correlation_id="2",
+            error=CheckError(message="boom"),
+        ),
+    ])
+
+    result = await can_user_read_many(
+        mock_openfga_client, "anne", ["doc1", "doc2", "doc3", "doc1"]
+    )
+
+    assert result == {"doc1": False, "doc2": True, "doc3": False}
+    mock_openfga_client.batch_check.assert_awaited_once()
+    mock_openfga_client.check.assert_not_awaited()
+
+    called_with_request = mock_openfga_client.batch_check.call_args[0][0]
+    assert isinstance(called_with_request, ClientBatchCheckRequest)
+    assert [c.object for c in called_with_request.checks] == [
+        "item:doc1",
+        "item:doc2",
+        "item:doc3",
+    ]
+    assert {c.user for c in called_with_request.checks} == {"user:anne"}
+
+
+@pytest.mark.asyncio
+async def test_can_user_read_many_falls_back_to_checks(
+    mock_openfga_client: AsyncMock,
+) -> None:
+    """Test can_user_read_many when the server doesn't support BatchCheck."""
+    mock_openfga_client.batch_check.side_effect = NotFoundException(status=404)
+    mock_openfga_client.check.side_effect = lambda request: CheckResponse(
+        allowed=request.object == "item:doc2", resolution=""
+    )
+
+    result = await can_user_read_many(mock_openfga_client, "anne", ["doc1", "doc2"])
+
+    assert result == {"doc1": False, "doc2": True}
+    assert mock_openfga_client.check.await_count == 2  # noqa: PLR2004
+
+
+@pytest.mark.asyncio
+async def test_can_user_read_many_empty(mock_openfga_client: AsyncMock) -> None:
+    """Test can_user_read_many doesn't hit the server without documents."""
+    assert await can_user_read_many(mock_openfga_client, "anne", []) == {}
+    mock_openfga_client.batch_check.assert_not_awaited()
@@ -0,0 +1,146 @@
+"""Tests on the selection of the filter strategy."""
+
+from collections.abc import AsyncGenerator
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from openfga_sdk import OpenFgaClient
+from openfga_sdk.client.models import (
+    ClientBatchCheckRequest,
+    ClientBatchCheckResponse,
+    ClientBatchCheckSingleResponse,
+)
+from openfga_sdk.client.models.list_objects_request import ClientListObjectsRequest
+from openfga_sdk.models.streamed_list_objects_response import (
+    StreamedListObjectsResponse,
+)
+
+from src.ofga_operations.filter_strategy import FilterStrategy, FilterStrategySelector
+from src.ofga_operations.watcher import Invalidation, InvalidationKind, StoreChanges
+
+STORE_ID = "01HVMMBCMGZNT3SED4Z17ECXCA"
+READABLE_IDS = {"doc_0", "doc_1"}
+LIST_OBJECTS_SECONDS = 1.0
+
+
+@pytest.mark.asyncio
+async def test_strategy_follows_candidates_and_observed_latencies() -> None:
+    """Test few candidates are checked, many are intersected with a cached list."""
+    now = [0.0]
+    client = MagicMock(spec=OpenFgaClient)
+    client.get_store_id.return_value = STORE_ID
+    client.get_authorization_model_id.return_value = None
+
+    async def streamed_list_objects(  # noqa: RUF029
+        _: ClientListObjectsRequest,
+    ) -> AsyncGenerator[StreamedListObjectsResponse, None]:
+        now[0] += LIST_OBJECTS_SECONDS
+        for object_id in READABLE_IDS:
+            yield StreamedListObjectsResponse(object=f"item:{object_id}")
+
+    async def batch_check(  # noqa: RUF029
+        body: ClientBatchCheckRequest, options: dict[str, int]
+    ) -> ClientBatchCheckResponse:
+        del options
+        return ClientBatchCheckResponse([
+            ClientBatchCheckSingleResponse(
+                allowed=check.object.split(":")[-1] in READABLE_IDS,
+                request=check,
+                correlation_id=check.correlation_id,
+            )
+            for check in body.checks
+        ])
+
+    client.streamed_list_objects = streamed_list_objects
+    client.batch_check = AsyncMock(side_effect=batch_check)
+    selector = FilterStrategySelector(client, clock=lambda: now[0])
+    few_candidates = ["doc_0", "doc_9"]
+    many_candidates = [f"doc_{i}" for i in range(2_000)]
+
+    assert await selector.filter("anne", few_candidates) == {
+        "doc_0": True,
+        "doc_9": False,
+    }
+    result = await selector.filter("anne", many_candidates)
+    assert {id_ for id_, allowed in result.items() if allowed} == READABLE_IDS
+    assert await selector.filter("anne", few_candidates) == {
+        "doc_0": True,
+        "doc_9": False,
+    }
+
+    # The list is dropped, and was too slow to be worth it for few candidates.
+    selector.on_store_changes(
+        StoreChanges(
+            store_id=STORE_ID,
+            changes=[],
+            invalidations=frozenset({Invalidation(InvalidationKind.USER, "user:anne")}),
+        )
+    )
+    await selector.filter("anne", few_candidates)
+
+    decisions = selector.decisions()
+    assert [d.strategy for d in decisions] == [
+        FilterStrategy.BATCH_CHECK,
+        FilterStrategy.LIST_OBJECTS,
+        FilterStrategy.LIST_OBJECTS,
+        FilterStrategy.BATCH_CHECK,
+    ]
+    assert decisions[1].elapsed_seconds == LIST_OBJECTS_SECONDS
+    assert decisions[2].estimated_list_objects_seconds == 0
+    assert decisions[2].listed_object_count == len(READABLE_IDS)
+
+
+@pytest.mark.asyncio
+async def test_longer_lists_favour_the_checks() -> None:
+    """Test the list of a user growing makes checking the candidates cheaper."""
+    now = [0.0]
+    object_count = [2]
+    client = MagicMock(spec=OpenFgaClient)
+    client.get_store_id.return_value = STORE_ID
+    client.get_authorization_model_id.return_value = None
+
+    async def streamed_list_objects(  # noqa: RUF029
+        _: ClientListObjectsRequest,
+    ) -> AsyncGenerator[StreamedListObjectsResponse, None]:
+        # A second per request, and a second per 1000 objects.
+        now[0] += LIST_OBJECTS_SECONDS + object_count[0] / 1_000
+        for i in range(object_count[0]):
+            yield StreamedListObjectsResponse(object=f"item:doc_{i}")
+
+    async def batch_check(  # noqa: RUF029
+        body: ClientBatchCheckRequest, options: dict[str, int]
+    ) -> ClientBatchCheckResponse:
+        del options
+        return ClientBatchCheckResponse([
+            ClientBatchCheckSingleResponse(
+                allowed=False, request=check, correlation_id=check.correlation_id
+            )
+            for check in body.checks
+        ])
+
+    client.streamed_list_objects = streamed_list_objects
+    client.batch_check = AsyncMock(side_effect=batch_check)
+    selector = FilterStrategySelector(
+        client,
+        list_objects_ttl_seconds=10,
+        initial_batch_check_seconds=0.5,
+        clock=lambda: now[0],
+    )
+    candidates = [f"doc_{i}" for i in range(2_000)]
+    await selector.filter("anne", candidates)
+    # Anne is granted many objects, and her list expires.
+    object_count[0] = 2_000
+    now[0] += 10
+    await selector.filter("anne", candidates)
+    now[0] += 10
+    await selector.filter("anne", candidates)
+
+    decisions = selector.decisions()
+    assert [d.strategy for d in decisions] == [
+        FilterStrategy.LIST_OBJECTS,
+        FilterStrategy.LIST_OBJECTS,
+        FilterStrategy.BATCH_CHECK,
+    ]
+    # Her lists took 1.4 seconds on average, but the last one holds 2000 objects.
+    assert decisions[2].estimated_list_objects_seconds == pytest.approx(3.0)
+    assert decisions[2].estimated_batch_check_seconds == pytest.approx(2.0)
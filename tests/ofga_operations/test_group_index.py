@@ -0,0 +1,82 @@
+"""Tests on the group membership closure index."""
+
+import random
+
+from src.ofga_operations.group_index import GroupClosureIndex
+from src.ofga_operations.tuples import TupleKey
+
+
+def _member(user: str, group: str) -> TupleKey:
+    return TupleKey(user, "member", f"group:{group}")
+
+
+def test_nested_memberships() -> None:
+    """Test memberships are followed through nested groups and wildcards."""
+    index = GroupClosureIndex([
+        _member("user:alice", "a"),
+        _member("group:a#member", "b"),
+        _member("group:b#member", "c"),
+        _member("user:*", "everyone"),
+        TupleKey("user:alice", "reader", "item:doc"),
+    ])
+
+    assert index.groups_for("user:alice") == {
+        "group:a",
+        "group:b",
+        "group:c",
+        "group:everyone",
+    }
+    assert index.groups_for("user:bob") == {"group:everyone"}
+    assert index.members_of("group:c") == {
+        "user:alice",
+        "group:a#member",
+        "group:b#member",
+    }
+    assert index.subjects_for("user:bob") == {
+        "user:bob",
+        "user:*",
+        "group:everyone#member",
+    }
+
+
+def test_delete_keeps_alternative_paths() -> None:
+    """Test deleting a membership keeps groups reachable in other ways."""
+    index = GroupClosureIndex([
+        _member("user:alice", "a"),
+        _member("user:alice", "b"),
+        _member("group:a#member", "c"),
+        _member("group:b#member", "c"),
+    ])
+
+    index.delete(_member("group:a#member", "c"))
+    assert "group:c" in index.groups_for("user:alice")
+
+    index.delete(_member("user:alice", "b"))
+    assert index.groups_for("user:alice") == {"group:a"}
+    assert index.members_of("group:c") == {"group:b#member"}
+
+
+def test_incremental_updates_match_rebuild() -> None:
+    """Test random writes and deletes leave the index as a rebuild would."""
+    rng = random.Random(42)  # noqa: S311
+    groups = [f"g{i}" for i in range(6)]
+    subjects = [f"user:u{i}" for i in range(4)] + [f"group:{g}#member" for g in groups]
+    index = GroupClosureIndex()
+    current: set[TupleKey] = set()
+
+    for _ in range(300):
+        tuple_key = _member(rng.choice(subjects), rng.choice(groups))
+        if tuple_key in current and rng.random() < 0.5:  # noqa: PLR2004
+            current.remove(tuple_key)
+            index.delete(tuple_key)
+        else:
+            current.add(tuple_key)
+            index.write(tuple_key)
+
+        rebuilt = GroupClosureIndex(current)
+        for subject in subjects:
+            assert index.groups_for(subject) == rebuilt.groups_for(subject)
+        for group in groups:
+            assert index.members_of(f"group:{group}") == rebuilt.members_of(
+                f"group:{group}"
+            )
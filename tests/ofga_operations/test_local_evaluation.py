@@ -0,0 +1,233 @@
+"""Tests on the in-process evaluation of authorization models."""
+
+from collections.abc import AsyncGenerator
+from datetime import UTC, datetime
+from typing import Any
+from unittest.mock import AsyncMock
+
+import pytest
+import pytest_asyncio
+from openfga_sdk import ClientConfiguration, OpenFgaClient
+from openfga_sdk.models.check_response import CheckResponse
+from openfga_sdk.models.read_response import ReadResponse
+from openfga_sdk.models.tuple import Tuple
+from openfga_sdk.models.tuple_key import TupleKey as RawTupleKey
+
+from src.ofga_operations.checks import can_user_read
+from src.ofga_operations.local_evaluation import (
+    EmbeddedOpenFgaClient,
+    LocalEvaluator,
+    UnsupportedEvaluationError,
+)
+from src.ofga_operations.objects import (
+    list_objects_for_user,
+    stream_objects_for_user,
+)
+from src.ofga_operations.tuples import TupleKey, load_tuple_mirror
+from src.project_types.utils import load_json_from_file_path
+
+DEFAULT_DENY_MODEL = "data/authorization_models/default_deny/authorization_model.json"
+TUPLES_DOCUMENT = "data/tuples/tuples_document.json"
+TOKEN = "token_1"  # noqa: S105
+
+# item#reader is the union of the direct readers and the owners.
+UNION_MODEL: dict[str, Any] = {
+    "schema_version": "1.1",
+    "type_definitions": [
+        {"type": "user", "relations": {}},
+        {
+            "type": "item",
+            "relations": {
+                "owner": {"this": {}},
+                "reader": {
+                    "union": {
+                        "child": [
+                            {"this": {}},
+                            {"computedUserset": {"relation": "owner"}},
+                        ]
+                    }
+                },
+            },
+        },
+    ],
+}
+
+
+def _tuple(user: str, relation: str, object_: str) -> Tuple:
+    return Tuple(
+        key=RawTupleKey(user=user, relation=relation, object=object_),
+        timestamp=datetime.now(UTC),
+    )
+
+
+@pytest.fixture
+def document_evaluator() -> LocalEvaluator:
+    """Fixture with the evaluator for the documents store."""
+    return LocalEvaluator(
+        load_json_from_file_path(DEFAULT_DENY_MODEL),
+        load_tuple_mirror(TUPLES_DOCUMENT, store_name="document_store"),
+    )
+
+
+@pytest_asyncio.fixture
+async def embedded_client(
+    document_evaluator: LocalEvaluator,
+) -> AsyncGenerator[EmbeddedOpenFgaClient, None]:
+    """Fixture with a client evaluating checks for the documents store."""
+    client = EmbeddedOpenFgaClient(
+        ClientConfiguration(api_url="http://localhost:8080"),
+        evaluator=document_evaluator,
+    )
+    yield client
+    await client.close()
+
+
+@pytest.mark.parametrize(
+    ("user", "document", "expected"),
+    [
+        ("user:alice", "item:doc_alice.txt", True),
+        ("user:alice", "item:public_doc.txt", True),
+        ("user:alice", "item:document_group_b.txt", False),
+        ("user:bob", "item:document_group_b.txt", True),
+        ("user:bob", "item:doc_alice.txt", False),
+        ("user:chris", "item:public_doc.txt", True),
+    ],
+)
+def test_check(
+    document_evaluator: LocalEvaluator,
+    user: str,
+    document: str,
+    expected: bool,  # noqa: FBT001
+) -> None:
+    """Test checks against the bundled tuples."""
+    assert document_evaluator.check(user, "can_read", document) is expected
+
+
+def test_list_objects(document_evaluator: LocalEvaluator) -> None:
+    """Test list objects against the bundled tuples."""
+    assert sorted(document_evaluator.list_objects("user:bob", "can_read", "item")) == [
+        "item:document_group_b.txt",
+        "item:public_doc.txt",
+    ]
+
+
+def test_nested_groups_and_deletes(document_evaluator: LocalEvaluator) -> None:
+    """Test usersets are followed through nested groups, and deletes are honoured."""
+    nested = TupleKey("group:group_c#member", "member", "group:group_b")
+    document_evaluator.write(TupleKey("user:chris", "member", "group:group_c"))
+    document_evaluator.write(nested)
+    assert document_evaluator.check(
+        "user:chris", "can_read", "item:document_group_b.txt"
+    )
+    assert "item:document_group_b.txt" in document_evaluator.list_objects(
+        "user:chris", "can_read", "item"
+    )
+
+    document_evaluator.delete(nested)
+    assert not document_evaluator.check(
+        "user:chris", "can_read", "item:document_group_b.txt"
+    )
+
+
+def test_cycles_terminate(document_evaluator: LocalEvaluator) -> None:
+    """Test cyclic group memberships don't loop forever."""
+    document_evaluator.write(
+        TupleKey("group:group_b#member", "member", "group:group_c")
+    )
+    document_evaluator.write(
+        TupleKey("group:group_c#member", "member", "group:group_b")
+    )
+    assert not document_evaluator.check(
+        "user:alice", "can_read", "item:document_group_b.txt"
+    )
+
+
+def test_unsupported_rewrite() -> None:
+    """Test rewrites outside of the supported subset are reported."""
+    evaluator = LocalEvaluator(
+        UNION_MODEL, [TupleKey("user:alice", "owner", "item:doc")]
+    )
+    assert evaluator.check("user:alice", "owner", "item:doc")
+    with pytest.raises(UnsupportedEvaluationError):
+        evaluator.check("user:alice", "reader", "item:doc")
+
+
+@pytest.mark.asyncio
+async def test_embedded_client_answers_locally(
+    monkeypatch: pytest.MonkeyPatch, embedded_client: EmbeddedOpenFgaClient
+) -> None:
+    """Test the client doesn't contact the server when it can evaluate locally."""
+    server_check = AsyncMock()
+    server_list_objects = AsyncMock()
+    monkeypatch.setattr(OpenFgaClient, "check", server_check)
+    monkeypatch.setattr(OpenFgaClient, "list_objects", server_list_objects)
+
+    assert await can_user_read(embedded_client, "alice", "doc_alice.txt")
+    assert sorted(
+        await list_objects_for_user("alice", "can_read", "item", embedded_client)
+    ) == ["item:doc_alice.txt", "item:public_doc.txt"]
+
+    assert sorted([
+        object_
+        async for object_ in stream_objects_for_user(
+            "alice", "can_read", "item", embedded_client
+        )
+    ]) == ["item:doc_alice.txt", "item:public_doc.txt"]
+
+    server_check.assert_not_awaited()
+    server_list_objects.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_embedded_client_falls_back_to_server(
+    monkeypatch: pytest.MonkeyPatch, embedded_client: EmbeddedOpenFgaClient
+) -> None:
+    """Test the client asks the server what it can't evaluate."""
+    server_check = AsyncMock(return_value=CheckResponse(allowed=True, resolution=""))
+    monkeypatch.setattr(OpenFgaClient, "check", server_check)
+
+    assert await can_user_read(
+        embedded_client, "alice", "doc_alice.txt", relation="can_edit"
+    )
+    server_check.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_embedded_client_mirrors_the_store(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test requests go to the server until the tuples are read from the store."""
+    server_check = AsyncMock(return_value=CheckResponse(allowed=False, resolution=""))
+    monkeypatch.setattr(OpenFgaClient, "check", server_check)
+    client = EmbeddedOpenFgaClient(
+        ClientConfiguration(api_url="http://localhost:8080"),
+        evaluator=LocalEvaluator(load_json_from_file_path(DEFAULT_DENY_MODEL)),
+        mirrored=False,
+        mirror_page_size=1,
+    )
+    client.read = AsyncMock(  # type: ignore
+        side_effect=[
+            ReadResponse(
+                tuples=[_tuple("user:alice", "reader", "item:doc_alice.txt")],
+                continuation_token=TOKEN,
+            ),
+            ReadResponse(
+                tuples=[_tuple("user:bob", "reader", "item:doc_bob.txt")],
+                continuation_token="",
+            ),
+        ]
+    )
+    try:
+        assert not await can_user_read(client, "alice", "doc_alice.txt")
+        server_check.assert_awaited_once()
+
+        assert await client.mirror_store() == 2  # noqa: PLR2004
+        assert client.read.await_args_list[1].kwargs["options"] == {
+            "page_size": 1,
+            "continuation_token": TOKEN,
+        }
+        assert await can_user_read(client, "alice", "doc_alice.txt")
+        assert not await can_user_read(client, "alice", "doc_bob.txt")
+        server_check.assert_awaited_once()
+    finally:
+        await client.close()
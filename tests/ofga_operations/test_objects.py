@@ -1,13 +1,22 @@
 """Tests objects."""
 
+import asyncio
+from collections.abc import AsyncGenerator
 from unittest.mock import AsyncMock, MagicMock
 
 import pytest
 import pytest_asyncio
 from openfga_sdk import OpenFgaClient
 from openfga_sdk.client.models.list_objects_request import ClientListObjectsRequest
+from openfga_sdk.models.streamed_list_objects_response import (
+    StreamedListObjectsResponse,
+)
 
-from src.ofga_operations.objects import list_objects_for_user
+from src.ofga_operations.lookup_memo import shared_lookups
+from src.ofga_operations.objects import (
+    list_objects_for_user,
+    stream_object_chunks_for_user,
+)
 
 
 @pytest_asyncio.fixture
@@ -51,3 +60,75 @@ async def test_list_objects_for_user(mock_openfga_client: AsyncMock) -> None:
     assert args[0].type == expected_request.type
 
     assert result == expected_objects
+
+
+@pytest.mark.asyncio
+async def test_stream_object_chunks_for_user(mock_openfga_client: AsyncMock) -> None:
+    """Test streamed objects are grouped in chunks, the last one possibly shorter."""
+    expected_objects = [f"doc:{i}" for i in range(5)]
+
+    async def streamed_list_objects(  # noqa: RUF029
+        _: ClientListObjectsRequest,
+    ) -> AsyncGenerator[StreamedListObjectsResponse, None]:
+        for object_ in expected_objects:
+            yield StreamedListObjectsResponse(object=object_)
+
+    mock_openfga_client.streamed_list_objects = streamed_list_objects
+
+    chunks = [
+        chunk
+        async for chunk in stream_object_chunks_for_user(
+            user_id="anne",
+            relation="viewer",
+            object_type="document",
+            client=mock_openfga_client,
+            chunk_size=2,
+        )
+    ]
+
+    assert chunks == [["doc:0", "doc:1"], ["doc:2", "doc:3"], ["doc:4"]]
+
+
+@pytest.mark.asyncio
+async def test_shared_lookups_list_the_objects_of_a_user_once(
+    mock_openfga_client: AsyncMock,
+) -> None:
+    """Test concurrent callers within the scope share a single ListObjects."""
+    requested_users = []
+    release = asyncio.Event()
+
+    async def streamed_list_objects(
+        request: ClientListObjectsRequest,
+    ) -> AsyncGenerator[StreamedListObjectsResponse, None]:
+        requested_users.append(request.user)
+        await release.wait()
+        yield StreamedListObjectsResponse(object=f"doc:{request.user}")
+
+    mock_openfga_client.get_store_id = MagicMock(return_value="store")
+    mock_openfga_client.get_authorization_model_id = MagicMock(return_value=None)
+    mock_openfga_client.streamed_list_objects = streamed_list_objects
+
+    async def _chunks(user_id: str) -> list[list[str]]:
+        return [
+            chunk
+            async for chunk in stream_object_chunks_for_user(
+                user_id, "viewer", "document", mock_openfga_client
+            )
+        ]
+
+    with shared_lookups():
+        tasks = [
+            asyncio.create_task(_chunks(user_id)) for user_id in ("anne", "anne", "bob")
+        ]
+    await asyncio.sleep(0)
+    release.set()
+    assert await asyncio.gather(*tasks) == [
+        [["doc:user:anne"]],
+        [["doc:user:anne"]],
+        [["doc:user:bob"]],
+    ]
+    assert requested_users == ["user:anne", "user:bob"]
+
+    # Outside of the scope, nothing is shared.
+    await _chunks("anne")
+    assert requested_users == ["user:anne", "user:bob", "user:anne"]
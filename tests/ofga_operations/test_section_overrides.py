@@ -0,0 +1,127 @@
+"""Tests on the index of the sections overriding the ACL of their document."""
+
+import asyncio
+from datetime import UTC, datetime
+from unittest.mock import AsyncMock
+
+import pytest
+from openfga_sdk import ClientConfiguration, OpenFgaClient
+from openfga_sdk.models.read_request_tuple_key import ReadRequestTupleKey
+from openfga_sdk.models.read_response import ReadResponse
+from openfga_sdk.models.tuple import Tuple
+from openfga_sdk.models.tuple_key import TupleKey as RawTupleKey
+
+from src.ofga_operations.section_overrides import SectionOverrideIndex
+from src.ofga_operations.tuples import TupleKey
+from src.ofga_operations.watcher import ChangeOperation, StoreChanges, TupleChange
+
+STORE_ID = "01HVMMBCMGZNT3SED4Z17ECXCA"
+TOKEN = "token_1"  # noqa: S105
+
+
+def _tuple(user: str, relation: str, object_: str) -> Tuple:
+    return Tuple(
+        key=RawTupleKey(user=user, relation=relation, object=object_),
+        timestamp=datetime.now(UTC),
+    )
+
+
+def _client(pages: dict[str, list[ReadResponse]]) -> OpenFgaClient:
+    """A client reading the pages of tuples of every object, in turn."""
+    client = OpenFgaClient(
+        ClientConfiguration(api_url="http://localhost:8080", store_id=STORE_ID)
+    )
+
+    async def read(body: ReadRequestTupleKey, **_: object) -> ReadResponse:  # noqa: RUF029
+        return pages[body.object].pop(0)
+
+    client.read = AsyncMock(side_effect=read)  # type: ignore
+    return client
+
+
+@pytest.mark.asyncio
+async def test_sections_inherit_unless_they_have_tuples() -> None:
+    """Test the tuples read for every section, then the changes, decide."""
+    client = _client({
+        "item:doc.txt/s0": [ReadResponse(tuples=[], continuation_token="")],
+        "item:doc.txt/s1": [
+            ReadResponse(
+                tuples=[_tuple("user:bob", "reader", "item:doc.txt/s1")],
+                continuation_token=TOKEN,
+            ),
+            ReadResponse(
+                tuples=[_tuple("user:carl", "reader", "item:doc.txt/s1")],
+                continuation_token="",
+            ),
+        ],
+    })
+    index = SectionOverrideIndex(client)
+
+    assert await index.objects_to_check(["doc.txt/s0", "doc.txt/s1", "doc.txt"]) == {
+        "doc.txt/s0": "doc.txt",
+        "doc.txt/s1": "doc.txt/s1",
+        "doc.txt": "doc.txt",
+    }
+    # Only the sections are read, a page at a time.
+    assert {call.args[0].object for call in client.read.await_args_list} == {
+        "item:doc.txt/s0",
+        "item:doc.txt/s1",
+    }
+    assert {
+        call.kwargs["options"].get("continuation_token")
+        for call in client.read.await_args_list
+    } == {None, TOKEN}
+
+    index.on_store_changes(
+        StoreChanges(
+            store_id=STORE_ID,
+            changes=[
+                TupleChange(
+                    TupleKey("user:bob", "reader", "item:doc.txt/s1"),
+                    ChangeOperation.DELETE,
+                ),
+                TupleChange(
+                    TupleKey("user:carl", "reader", "item:doc.txt/s1"),
+                    ChangeOperation.DELETE,
+                ),
+                TupleChange(
+                    TupleKey("user:anne", "reader", "item:doc.txt/s0"),
+                    ChangeOperation.WRITE,
+                ),
+            ],
+            invalidations=frozenset(),
+        )
+    )
+    assert await index.objects_to_check(["doc.txt/s0", "doc.txt/s1"]) == {
+        "doc.txt/s0": "doc.txt/s0",
+        "doc.txt/s1": "doc.txt",
+    }
+    assert client.read.await_count == 3  # noqa: PLR2004
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_tuples_are_read_again_in_the_background() -> None:
+    """Test a tuple written on a section after its read is seen once expired."""
+    now = 0.0
+    client = _client({
+        "item:doc.txt/s1": [
+            ReadResponse(tuples=[], continuation_token=""),
+            ReadResponse(
+                tuples=[_tuple("user:bob", "reader", "item:doc.txt/s1")],
+                continuation_token="",
+            ),
+        ]
+    })
+    index = SectionOverrideIndex(client, ttl_seconds=30, clock=lambda: now)
+
+    assert await index.objects_to_check(["doc.txt/s1"]) == {"doc.txt/s1": "doc.txt"}
+    now = 29
+    assert await index.objects_to_check(["doc.txt/s1"]) == {"doc.txt/s1": "doc.txt"}
+    now = 30
+    # The request doesn't wait for the read.
+    assert await index.objects_to_check(["doc.txt/s1"]) == {"doc.txt/s1": "doc.txt"}
+    await asyncio.sleep(0)
+    assert await index.objects_to_check(["doc.txt/s1"]) == {"doc.txt/s1": "doc.txt/s1"}
+    assert client.read.await_count == 2  # noqa: PLR2004
+    await client.close()
@@ -0,0 +1,209 @@
+"""Tests on the watcher of the tuple changes."""
+
+from collections.abc import AsyncGenerator
+from unittest.mock import AsyncMock
+
+import pytest
+import pytest_asyncio
+from openfga_sdk import ClientConfiguration, OpenFgaClient
+from openfga_sdk.models.read_changes_response import ReadChangesResponse
+from openfga_sdk.models.tuple_change import TupleChange as RawTupleChange
+from openfga_sdk.models.tuple_key import TupleKey as RawTupleKey
+from openfga_sdk.models.tuple_operation import TupleOperation
+
+from src.ofga_operations.cache import (
+    CachedOpenFgaClient,
+    DecisionCache,
+    DecisionCacheKey,
+)
+from src.ofga_operations.local_evaluation import EmbeddedOpenFgaClient, LocalEvaluator
+from src.ofga_operations.tuples import TupleKey
+from src.ofga_operations.watcher import (
+    ChangeWatcher,
+    Invalidation,
+    InvalidationKind,
+    StoreChanges,
+)
+from src.project_types.utils import load_json_from_file_path
+
+STORE_ID = "01HVMMBCMGZNT3SED4Z17ECXCA"
+DEFAULT_DENY_MODEL = "data/authorization_models/default_deny/authorization_model.json"
+FIRST_TOKEN = "token_1"  # noqa: S105
+SECOND_TOKEN = "token_2"  # noqa: S105
+
+
+def _change(
+    user: str, relation: str, object_: str, operation: TupleOperation
+) -> RawTupleChange:
+    return RawTupleChange(
+        tuple_key=RawTupleKey(user=user, relation=relation, object=object_),
+        operation=operation,
+        timestamp="2025-01-01T00:00:00Z",
+    )
+
+
+class _Recorder:
+    def __init__(self) -> None:
+        self.received: list[StoreChanges] = []
+
+    def on_store_changes(self, store_changes: StoreChanges) -> None:
+        self.received.append(store_changes)
+
+
+@pytest_asyncio.fixture
+async def client() -> AsyncGenerator[OpenFgaClient, None]:
+    """Fixture with a client for a single store."""
+    client = OpenFgaClient(
+        ClientConfiguration(api_url="http://localhost:8080", store_id=STORE_ID)
+    )
+    yield client
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_poll_once_follows_continuation_tokens(client: OpenFgaClient) -> None:
+    """Test every page is read, and the next poll resumes from the last token."""
+    client.read_changes = AsyncMock(  # type: ignore
+        side_effect=[
+            ReadChangesResponse(
+                changes=[
+                    _change("user:anne", "reader", "item:doc", TupleOperation.WRITE)
+                ],
+                continuation_token=FIRST_TOKEN,
+            ),
+            ReadChangesResponse(
+                changes=[
+                    _change(
+                        "group:a#member",
+                        "reader",
+                        "item:other",
+                        TupleOperation.DELETE,
+                    )
+                ],
+                continuation_token=SECOND_TOKEN,
+            ),
+            ReadChangesResponse(changes=[], continuation_token=SECOND_TOKEN),
+            ReadChangesResponse(changes=[], continuation_token=SECOND_TOKEN),
+        ]
+    )
+    watcher = ChangeWatcher({"store": client})
+    recorder = _Recorder()
+    watcher.register(recorder)
+
+    assert await watcher.poll_once("store") == 2  # noqa: PLR2004
+    assert await watcher.poll_once("store") == 0
+
+    tokens = [
+        call.kwargs["options"].get("continuation_token")
+        for call in client.read_changes.await_args_list
+    ]
+    assert tokens == [None, FIRST_TOKEN, SECOND_TOKEN, SECOND_TOKEN]
+    assert [batch.store_id for batch in recorder.received] == [STORE_ID, STORE_ID]
+    assert recorder.received[0].invalidations == {
+        Invalidation(InvalidationKind.OBJECT, "item:doc"),
+        Invalidation(InvalidationKind.USER, "user:anne"),
+    }
+    assert recorder.received[1].invalidations == {
+        Invalidation(InvalidationKind.OBJECT, "item:other"),
+        Invalidation(InvalidationKind.GROUP, "group:a"),
+    }
+
+
+def test_decision_cache_invalidation() -> None:
+    """Test only the decisions affected by the changes are dropped."""
+    cache = DecisionCache(max_entries=10, allow_ttl_seconds=10, deny_ttl_seconds=10)
+    keys = [
+        DecisionCacheKey(STORE_ID, None, "user:anne", "can_read", "item:a"),
+        DecisionCacheKey(STORE_ID, None, "user:bob", "can_read", "item:b"),
+        DecisionCacheKey(STORE_ID, None, "user:chris", "can_read", "item:c"),
+        DecisionCacheKey("other_store", None, "user:anne", "can_read", "item:a"),
+    ]
+    for key in keys:
+        cache.put(key, allowed=True)
+
+    dropped = cache.invalidate(
+        STORE_ID,
+        [
+            Invalidation(InvalidationKind.OBJECT, "item:a"),
+            Invalidation(InvalidationKind.USER, "user:bob"),
+        ],
+    )
+    assert dropped == 2  # noqa: PLR2004
+    assert [cache.get(key) for key in keys] == [None, None, True, True]
+
+    cache.invalidate(STORE_ID, [Invalidation(InvalidationKind.USER, "user:*")])
+    assert cache.get(keys[2]) is None
+    assert cache.get(keys[3]) is True
+
+
+@pytest.mark.asyncio
+async def test_listener_clients() -> None:
+    """Test the caching and embedded clients react to the changes of their store."""
+    configuration = ClientConfiguration(
+        api_url="http://localhost:8080", store_id=STORE_ID
+    )
+    cache = DecisionCache(max_entries=10, allow_ttl_seconds=10, deny_ttl_seconds=10)
+    cached_client = CachedOpenFgaClient(configuration, decision_cache=cache)
+    evaluator = LocalEvaluator(load_json_from_file_path(DEFAULT_DENY_MODEL))
+    embedded_client = EmbeddedOpenFgaClient(configuration, evaluator=evaluator)
+
+    key = DecisionCacheKey(STORE_ID, None, "user:anne", "can_read", "item:doc")
+    cache.put(key, allowed=False)
+    tuple_key = TupleKey("user:anne", "reader", "item:doc")
+    try:
+        for client in (cached_client, embedded_client):
+            client.read_changes = AsyncMock(  # type: ignore
+                side_effect=[
+                    ReadChangesResponse(
+                        changes=[
+                            _change(*tuple_key, TupleOperation.WRITE),
+                        ],
+                        continuation_token=FIRST_TOKEN,
+                    ),
+                    ReadChangesResponse(changes=[], continuation_token=FIRST_TOKEN),
+                ]
+            )
+            watcher = ChangeWatcher({"store": client})
+            watcher.register(client)
+            await watcher.poll_once("store")
+    finally:
+        await cached_client.close()
+        await embedded_client.close()
+
+    assert cache.get(key) is None
+    assert evaluator.check("user:anne", "can_read", "item:doc")
+
+
+@pytest.mark.asyncio
+async def test_disabled_watcher_starts_no_task(client: OpenFgaClient) -> None:
+    """Test that registering listeners doesn't turn a disabled watcher back on."""
+    client.read_changes = AsyncMock()  # type: ignore
+    watcher = ChangeWatcher({"store": client}, enabled=False)
+    watcher.register(_Recorder())
+
+    watcher.start()
+    assert not watcher._tasks  # noqa: SLF001
+    await watcher.stop()
+    client.read_changes.assert_not_called()
+
+
+def test_store_changes_affect_the_users_of_the_changed_tuples() -> None:
+    """Test which users the changes of a store affect."""
+
+    def changes(*invalidations: Invalidation) -> StoreChanges:
+        return StoreChanges(
+            store_id=STORE_ID, changes=[], invalidations=frozenset(invalidations)
+        )
+
+    by_user = changes(
+        Invalidation(InvalidationKind.USER, "user:anne"),
+        Invalidation(InvalidationKind.OBJECT, "item:doc"),
+    )
+    assert by_user.affects_user(STORE_ID, "anne")
+    assert not by_user.affects_user(STORE_ID, "bob")
+    assert not by_user.affects_user("other_store", "anne")
+    for anyone in (
+        changes(Invalidation(InvalidationKind.USER, "user:*")),
+        changes(Invalidation(InvalidationKind.GROUP, "group:a")),
+    ):
+        assert anyone.affects_user(STORE_ID, "bob")
@@ -0,0 +1,237 @@
+"""Tests on the tabular backends."""
+
+import asyncio
+import random
+from collections.abc import AsyncGenerator, AsyncIterable, Iterator
+from pathlib import Path
+
+import pytest
+
+from src.project_types import ACLType
+from src.tabular_data.aggregates import (
+    Aggregate,
+    AggregateFunction,
+    AggregateQuery,
+    ColumnFilter,
+    FilterOperator,
+    InvalidAggregateQueryError,
+    OrderBy,
+)
+from src.tabular_data.backends import (
+    ColumnarBackend,
+    NumPyBackend,
+    Row,
+    SQLiteBackend,
+    TabularBackend,
+    create_acl_table,
+)
+from src.tabular_data.columnar import ColumnarDataset, ensure_columnar_dataset
+from src.tabular_data.query_runner import SQLiteQueryRunner
+from src.tabular_data.sqlite_cache import ensure_sqlite_dataset
+
+ROW_COUNT = 500
+
+
+@pytest.fixture
+def csv_path(tmp_path: Path) -> Path:
+    """Fixture with a dataset of ROW_COUNT rows."""
+    path = tmp_path / "data.csv"
+    lines = ["id,score,label"]
+    lines.extend(f"row_{i},{i * 1.5},label {i}" for i in range(ROW_COUNT))
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return path
+
+
+@pytest.fixture(params=["sqlite", "numpy", "columnar"])
+def backend(request: pytest.FixtureRequest, csv_path: Path) -> Iterator[TabularBackend]:
+    """Fixture with each backend serving the dataset."""
+    backend: TabularBackend
+    if request.param == "numpy":
+        backend = NumPyBackend.from_csv(csv_path)
+    elif request.param == "columnar":
+        backend = ColumnarBackend(
+            ColumnarDataset(
+                ensure_columnar_dataset(csv_path, csv_path.parent / "cache")
+            )
+        )
+    else:
+        backend = SQLiteBackend(
+            SQLiteQueryRunner(
+                ensure_sqlite_dataset(csv_path, csv_path.parent / "cache"),
+                pool_size=1,
+                initializer=create_acl_table,
+            )
+        )
+    yield backend
+    backend.close()
+
+
+async def _chunks(ids: list[str]) -> AsyncGenerator[list[str], None]:  # noqa: RUF029
+    for start in range(0, len(ids), 100):
+        yield ids[start : start + 100]
+
+
+async def _collect(chunks: AsyncIterable[list[Row]]) -> list[list[Row]]:
+    return [chunk async for chunk in chunks]
+
+
+async def _select(
+    backend: TabularBackend, ids: list[str], acl_type: ACLType, limit: int | None
+) -> list[list[Row]]:
+    return [
+        chunk
+        async for chunk in backend.select(
+            _chunks(ids), acl_type, ["label", "id"], limit=limit, chunk_size=64
+        )
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("acl_type", list(ACLType))
+async def test_select(backend: TabularBackend, acl_type: ACLType) -> None:
+    """Test both ACL types, projections, chunking and unknown ids."""
+    rng = random.Random(0)  # noqa: S311
+    acl = {f"row_{i}" for i in rng.sample(range(ROW_COUNT), 200)}
+    ids = [*acl, "unknown_id"]
+    rng.shuffle(ids)
+
+    chunks = await _select(backend, ids, acl_type, limit=None)
+
+    assert backend.column_names() == ["id", "score", "label"]
+    assert all(0 < len(chunk) <= 64 for chunk in chunks)  # noqa: PLR2004
+    rows = [row for chunk in chunks for row in chunk]
+    expected_ids = (
+        acl
+        if acl_type == ACLType.DEFAULT_DENY
+        else {f"row_{i}" for i in range(ROW_COUNT)} - acl
+    )
+    assert {row[1] for row in rows} == expected_ids
+    assert len(rows) == len(expected_ids)
+    assert all(label == f"label {id_[4:]}" for label, id_ in rows)
+
+
+@pytest.mark.asyncio
+async def test_select_limit_and_empty_acl(backend: TabularBackend) -> None:
+    """Test the limit, and an empty ACL hiding or showing every row."""
+    assert await _select(backend, [], ACLType.DEFAULT_DENY, limit=None) == []
+    limited = await _select(
+        backend, [], ACLType.DEFAULT_ALLOW_WITH_EXPLICIT_DENY, limit=100
+    )
+    assert sum(len(chunk) for chunk in limited) == 100  # noqa: PLR2004
+
+
+@pytest.mark.asyncio
+async def test_numpy_backend_types_columns_like_columnar(tmp_path: Path) -> None:
+    """Test integers `<i8` can't hold, and underscores, make columns of floats."""
+    csv_path = tmp_path / "data.csv"
+    csv_path.write_text(
+        "id,small,large,underscored\n"
+        "a,-9223372036854775808,99999999999999999999,1_000\n"
+        "b,9223372036854775807,1,2\n",
+        encoding="utf-8",
+    )
+    backend = NumPyBackend.from_csv(csv_path)
+    rows = [
+        row
+        async for chunk in backend.select(
+            _chunks([]),
+            ACLType.DEFAULT_ALLOW_WITH_EXPLICIT_DENY,
+            ["small", "large", "underscored"],
+            limit=None,
+            chunk_size=64,
+        )
+        for row in chunk
+    ]
+    assert [tuple(row) for row in rows] == [
+        (-9223372036854775808, 1e20, 1000.0),
+        (9223372036854775807, 1.0, 2.0),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_sqlite_backend_holds_no_connection_while_waiting(csv_path: Path) -> None:
+    """Test a connection is only taken once the ACL ids are all read."""
+    backend = SQLiteBackend(
+        SQLiteQueryRunner(
+            ensure_sqlite_dataset(csv_path, csv_path.parent / "cache"),
+            pool_size=1,
+            initializer=create_acl_table,
+        )
+    )
+    listed = asyncio.Event()
+
+    async def slow_acl_ids() -> AsyncGenerator[list[str], None]:
+        yield ["row_1"]
+        await listed.wait()
+        yield ["row_2"]
+
+    selecting = asyncio.create_task(
+        _collect(backend.select(slow_acl_ids(), ACLType.DEFAULT_DENY, ["id"], None, 1))
+    )
+    await asyncio.sleep(0.01)
+    assert backend.stats().busy == 0
+    # Other queries go on meanwhile.
+    assert await _select(backend, ["row_3"], ACLType.DEFAULT_DENY, limit=None) == [
+        [("label 3", "row_3")]
+    ]
+
+    listed.set()
+    assert sorted(await selecting) == [[("row_1",)], [("row_2",)]]
+    backend.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("acl_type", list(ACLType))
+async def test_aggregate(backend: TabularBackend, acl_type: ACLType) -> None:
+    """Test every backend computes the same aggregates over the visible rows."""
+    acl = [f"row_{i}" for i in range(0, ROW_COUNT, 2)]
+    visible = [
+        i
+        for i in range(ROW_COUNT)
+        if (i % 2 == 0) == (acl_type == ACLType.DEFAULT_DENY)
+    ]
+    totals = AggregateQuery(
+        aggregates=[
+            Aggregate(function=AggregateFunction.COUNT),
+            Aggregate(function=AggregateFunction.SUM, column="score"),
+            Aggregate(function=AggregateFunction.AVG, column="score"),
+            Aggregate(function=AggregateFunction.MAX, column="label"),
+        ],
+        filters=[ColumnFilter(column="score", operator=FilterOperator.GE, value="150")],
+    )
+    kept = [i for i in visible if i * 1.5 >= 150]  # noqa: PLR2004
+    assert await backend.aggregate(_chunks(acl), acl_type, totals) == [
+        (
+            len(kept),
+            sum(i * 1.5 for i in kept),
+            sum(i * 1.5 for i in kept) / len(kept),
+            max(f"label {i}" for i in kept),
+        )
+    ]
+
+    top = AggregateQuery(
+        aggregates=[Aggregate(function=AggregateFunction.SUM, column="score")],
+        group_by=["label"],
+        order_by=[OrderBy(key="sum(score)", descending=True)],
+        limit=3,
+    )
+    assert await backend.aggregate(_chunks(acl), acl_type, top) == [
+        (f"label {i}", i * 1.5) for i in visible[::-1][:3]
+    ]
+
+
+def test_aggregate_query_validation() -> None:
+    """Test queries on unknown columns or keys are rejected."""
+    query = AggregateQuery(
+        aggregates=[Aggregate(function=AggregateFunction.SUM, column="score")],
+        order_by=[OrderBy(key="sum(score)")],
+    )
+    query.validate_columns(["id", "score"])
+    with pytest.raises(InvalidAggregateQueryError):
+        query.validate_columns(["id"])
+    with pytest.raises(InvalidAggregateQueryError):
+        AggregateQuery(
+            aggregates=query.aggregates, order_by=[OrderBy(key="score")]
+        ).validate_columns(["id", "score"])
+    with pytest.raises(ValueError, match="needs a column"):
+        Aggregate(function=AggregateFunction.AVG)
@@ -0,0 +1,79 @@
+"""Tests on the columnar format."""
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+from src.tabular_data.columnar import (
+    ColumnarDataset,
+    ensure_columnar_dataset,
+    write_columnar,
+)
+
+
+def test_round_trip(tmp_path: Path) -> None:
+    """Test the inferred kinds, duplicated ids and lookups of unknown ids."""
+    csv_path = tmp_path / "data.csv"
+    csv_path.write_text(
+        "count,id,ratio,name\n1,b,0.5,Bob\n2,a,1,\n3,long_id,2.5,Zoë\n4,b,3,Bea\n",
+        encoding="utf-8",
+    )
+    output_path = tmp_path / "data.columnar"
+    write_columnar(csv_path, output_path)
+
+    dataset = ColumnarDataset(output_path)
+    assert dataset.row_count == 4  # noqa: PLR2004
+    assert dataset.column_names() == ["count", "id", "ratio", "name"]
+    rows = dataset.rows_with_ids(["b", "long_id", "unknown", "way_too_long_id"])
+    assert rows.tolist() == [0, 2, 3]
+    assert dataset.gather(rows, ["id", "count", "ratio", "name"]) == [
+        ("b", 1, 0.5, "Bob"),
+        ("long_id", 3, 2.5, "Zoë"),
+        ("b", 4, 3.0, "Bea"),
+    ]
+    visible = [
+        chunk.tolist()
+        for chunk in dataset.rows_without(np.array(rows, dtype=np.uint64), 1)
+    ]
+    assert visible == [[1]]
+    assert dataset.gather(np.array([1]), ["name"]) == [("",)]
+    dataset.close()
+
+
+def test_ensure_columnar_dataset_rebuilds_stale_files(tmp_path: Path) -> None:
+    """Test the columnar copy follows the changes of the CSV."""
+    csv_path = tmp_path / "data.csv"
+    csv_path.write_text("id,value\na,1\n", encoding="utf-8")
+    cache_dir = tmp_path / "cache"
+
+    path = ensure_columnar_dataset(csv_path, cache_dir)
+    mtime_ns = path.stat().st_mtime_ns
+    assert ensure_columnar_dataset(csv_path, cache_dir) == path
+    assert path.stat().st_mtime_ns == mtime_ns
+
+    csv_path.write_text("id,value\na,1\nb,2\n", encoding="utf-8")
+    os.utime(csv_path, ns=(mtime_ns + 1, mtime_ns + 1))
+    dataset = ColumnarDataset(ensure_columnar_dataset(csv_path, cache_dir))
+    assert dataset.row_count == 2  # noqa: PLR2004
+    dataset.close()
+
+
+def test_integers_beyond_int64_are_floats(tmp_path: Path) -> None:
+    """Test only the values `<i8` can hold make a column of integers."""
+    csv_path = tmp_path / "data.csv"
+    csv_path.write_text(
+        "id,small,large,underscored\n"
+        "a,-9223372036854775808,9223372036854775808,1_000\n"
+        "b,9223372036854775807,1,2\n",
+        encoding="utf-8",
+    )
+    output_path = tmp_path / "data.columnar"
+    write_columnar(csv_path, output_path)
+
+    dataset = ColumnarDataset(output_path)
+    assert dataset.gather(np.array([0, 1]), ["small", "large", "underscored"]) == [
+        (-9223372036854775808, 9223372036854775808.0, 1000.0),
+        (9223372036854775807, 1.0, 2.0),
+    ]
+    dataset.close()
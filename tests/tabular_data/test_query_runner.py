@@ -0,0 +1,59 @@
+"""Tests on the thread pool running the tabular queries."""
+
+import asyncio
+import sqlite3
+import threading
+from pathlib import Path
+
+import pytest
+
+from src.tabular_data.query_runner import SQLiteQueryRunner
+from src.tabular_data.sqlite_cache import ensure_sqlite_dataset
+
+
+@pytest.fixture
+def db_path(tmp_path: Path) -> Path:
+    """Fixture with a dataset cache."""
+    csv_path = tmp_path / "data.csv"
+    csv_path.write_text("id,value\na,1\nb,2\n", encoding="utf-8")
+    return ensure_sqlite_dataset(csv_path, tmp_path / "cache")
+
+
+def _create_scratch_table(conn: sqlite3.Connection) -> None:
+    conn.execute("CREATE TEMP TABLE scratch (id TEXT)")
+
+
+@pytest.mark.asyncio
+async def test_sessions_are_bounded_and_pinned(db_path: Path) -> None:
+    """Test at most pool_size sessions run at once, each on a single thread."""
+    runner = SQLiteQueryRunner(db_path, pool_size=2, initializer=_create_scratch_table)
+    loop_thread = threading.current_thread()
+    release = asyncio.Event()
+
+    async def use_session(value: str) -> list[tuple[str]]:
+        async with runner.session() as session:
+            threads = {await session.run(lambda _: threading.current_thread())}
+            await session.run(
+                lambda conn: conn.execute("INSERT INTO scratch VALUES (?)", (value,))
+            )
+            await release.wait()
+            threads.add(await session.run(lambda _: threading.current_thread()))
+            assert len(threads) == 1
+            assert loop_thread not in threads
+            return await session.run(
+                lambda conn: conn.execute(
+                    "SELECT data.id FROM data JOIN scratch USING (id)"
+                ).fetchall()
+            )
+
+    tasks = [asyncio.create_task(use_session(value)) for value in "aba"]
+    await asyncio.sleep(0.1)
+    stats = runner.stats()
+    assert (stats.busy, stats.waiting) == (2, 1)
+
+    release.set()
+    results = await asyncio.gather(*tasks)
+    runner.close()
+
+    assert results[1] == [("b",)]
+    assert runner.stats().completed_sessions == len(tasks)
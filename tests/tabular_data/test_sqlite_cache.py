@@ -0,0 +1,53 @@
+"""Tests on the on-disk SQLite copies of the datasets."""
+
+import os
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+
+from src.tabular_data.sqlite_cache import ensure_sqlite_dataset, open_read_only
+
+
+@pytest.fixture
+def csv_path(tmp_path: Path) -> Path:
+    """Fixture with a small dataset."""
+    path = tmp_path / "ratings.csv"
+    path.write_text("id,rating,full name\n001,4.5,Alice\nbob,,Bob\n", encoding="utf-8")
+    return path
+
+
+def test_ingestion(csv_path: Path, tmp_path: Path) -> None:
+    """Test ids stay text, numbers are typed and id is indexed."""
+    db_path = ensure_sqlite_dataset(csv_path, tmp_path / "cache")
+
+    with closing(open_read_only(db_path)) as conn:
+        assert conn.execute('SELECT id, rating, "full name" FROM data').fetchall() == [
+            ("001", 4.5, "Alice"),
+            ("bob", None, "Bob"),
+        ]
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM data WHERE id = ?", ("bob",)
+        )
+        assert "USING INDEX" in plan.fetchone()[-1]
+        conn.execute("CREATE TEMP TABLE scratch (id TEXT)")
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM data")
+
+
+def test_rebuilt_only_when_content_changes(csv_path: Path, tmp_path: Path) -> None:
+    """Test touching the CSV keeps the cache, changing it rebuilds it."""
+    cache_dir = tmp_path / "cache"
+    db_path = ensure_sqlite_dataset(csv_path, cache_dir)
+    inode = db_path.stat().st_ino
+
+    stat = csv_path.stat()
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert ensure_sqlite_dataset(csv_path, cache_dir).stat().st_ino == inode
+
+    csv_path.write_text("id,rating,full name\nchris,3,Chris\n", encoding="utf-8")
+    db_path = ensure_sqlite_dataset(csv_path, cache_dir)
+    assert db_path.stat().st_ino != inode
+    with closing(open_read_only(db_path)) as conn:
+        assert conn.execute("SELECT id FROM data").fetchall() == [("chris",)]